@@ -1,4 +1,5 @@
 import argparse
+import os
 from sfvalidator import SfValidator
 
 def time_travel_validate(string):
@@ -25,11 +26,33 @@ def auto_suspend_validate(string):
         return num
     raise ValueError
 
+def max_workers_validate(string):
+    num = int(string)
+    if (num > 0 and num < 65):
+        return num
+    raise ValueError
+
+def add_profile_arguments(parser, output_dir=None):
+    # Connection profiles in "profiles" of config.json - see SfConfig.profile_config
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--profile', type=str, help='Connect with this profile in config.json')
+    group.add_argument('--profiles', type=str, help='Run once per profile in config.json concurrently - ALL for every profile', nargs='+')
+    parser.add_argument('--max_profiles', type=max_workers_validate, default=8, help='Number of profiles run concurrently with --profiles')
+    if output_dir is not None:
+        parser.add_argument('--output_dir', type=str, default=output_dir, help='Directory with the output of every profile and the merged report with --profiles')
+
 def db_sc_validate(string):
     sf_val = SfValidator()
     db_nm,sc_nm = sf_val.split_db_sc(string)
     return [ db_nm, sc_nm ]
 
+def db_sc_pattern_validate(string):
+    # % wildcards are resolved against the schemas listed in the account
+    if '%' not in string:
+        return db_sc_validate(string)
+    sf_val = SfValidator()
+    return sf_val.split_db_sc_like(string)
+
 def db_sc_obj_validate(string):
     sf_val = SfValidator()
     db_nm,sc_nm,obj_nm = sf_val.split_db_sc_obj(string)
@@ -67,7 +90,17 @@ class CmdlineParseExport():
         parser.add_argument('--export_dir', type=str, default='./export', help='Name of base directory to export to')
         parser.add_argument('--log_level', type=str, choices=['DEBUG','INFO','WARNING','ERROR','CRITICAL'], default='INFO', help='Log Level to output')
         parser.add_argument('--delete', action='store_true', help='Delete files no longer present in schema')
-        parser.add_argument('--database_schema', '--db_sc', type=db_sc_validate, help='Name(s) of Database.Schema to export', nargs='+')
+        parser.add_argument('--database_schema', '--db_sc', type=db_sc_pattern_validate, help='Name(s) of Database.Schema to export - %% wildcards like PRD_%%.%% are matched against the schemas in the account', nargs='+')
+        parser.add_argument('--refresh', action='store_true', help='List the schemas in the account again instead of using the cached list')
+        parser.add_argument('--journal', type=str, help='File recording every exported schema (default: <export_dir>/.sf_export-journal.jsonl)')
+        parser.add_argument('--resume', action='store_true', help='Skip the schemas the journal of an earlier run has as exported')
+        parser.add_argument('--retries', type=int, default=3, help='Number of times to retry a schema that failed on a transient error')
+        parser.add_argument('--format', type=str, choices=['files','store','archive'], default='files', help='files writes a file per object, store writes each distinct DDL once to a content addressed store and an index per schema, archive writes every run to one SQLite file (see sf_archive)')
+        parser.add_argument('--store_dir', type=str, help='Directory of the content addressed store, can be shared by exports of several environments (default: <export_dir>/.store)')
+        parser.add_argument('--compress', action='store_true', help='Compress the DDL in the store with zstd (needs the zstandard package)')
+        parser.add_argument('--fetchers', type=int, default=1, help='Number of sessions of their own getting DDL in parallel while the objects are listed and written - 0 gets it on the listing session after each object type is listed')
+        parser.add_argument('--materialize', type=str, help='Write the file per object layout of the schemas in the store to this directory')
+        add_profile_arguments(parser)
 
         self.parser = parser
         self.args = parser.parse_args()
@@ -82,7 +115,7 @@ class CmdlineParseExport():
     def checkinput(self):
         # db_sc needs to be checked, even if we use a different function for it
         # database_schema should actually be populated and not just the global variable from main script
-        if self.args.list is not True and self.args.all is not True and self.args.database_schema is None:
+        if self.args.list is not True and self.args.all is not True and self.args.database_schema is None and self.args.materialize is None:
             self.parser.print_help()
             exit(0)
         if self.args.list is True and self.args.all is True:
@@ -97,6 +130,19 @@ class CmdlineParseExport():
             print("Cannot specify --database_schema and --all at the same time")
             self.parser.print_help()
             exit(0)
+        if self.args.materialize is not None and (self.args.list is True or self.args.all is True):
+            print("Cannot use --materialize with --list or --all")
+            self.parser.print_help()
+            exit(0)
+        if self.args.compress is True and self.args.format != 'store':
+            print("--compress requires --format store")
+            exit(-1)
+        if self.args.fetchers < 0:
+            print("--fetchers must be 0 or more")
+            exit(-1)
+        if self.args.retries < 0:
+            print("--retries cannot be negative")
+            exit(-1)
         # transfer how-ever database_schema looks like into the array db_sc from main program, but stupid to do this twice
         # can we convert to same datamodel?
 
@@ -183,6 +229,35 @@ class CmdlineParseClone():
         self.owner_role = self.args.owner_role
         # Good to go now
 
+class CmdlineParseFuncRole():
+    """CmdlineParseFuncRole parses the command line options for reconciling
+       functional roles with fr-config.json."""
+    def __init__(self):
+        parser = argparse.ArgumentParser(description='Snowflake functional role provisioning')
+        parser.add_argument('--roles', type=str, help='Name(s) of functional roles in fr-config.json to reconcile - default all', nargs='+')
+        parser.add_argument('--apply', action='store_true', help='Apply the grants and revokes through the connection in config.json instead of printing them')
+        parser.add_argument('--audit', type=str, help='JSON file recording the changes applied to each role')
+        parser.add_argument('--max_workers', type=max_workers_validate, default=8, help='Number of roles reconciled concurrently')
+        parser.add_argument('--snapshot', type=str, help='Compute the deltas from a local grants snapshot created with sf_snapshot')
+        parser.add_argument('--log_level', type=str, choices=['DEBUG','INFO','WARNING','ERROR','CRITICAL'], default='WARNING', help='Log Level to output')
+        add_profile_arguments(parser, output_dir='profiles')
+        self.parser = parser
+        self.args = parser.parse_args()
+        self.checkinput()
+
+    def checkinput(self):
+        if self.args.snapshot is not None and not os.path.exists(self.args.snapshot):
+            print(f"Snapshot {self.args.snapshot} does not exist - create it with sf_snapshot")
+            exit(-1)
+        if self.args.audit is not None and self.args.apply is False:
+            print("--audit can only be used with --apply")
+            exit(-1)
+        if self.args.snapshot is not None and self.args.profiles is not None:
+            print("--snapshot holds the grants of one account and cannot be used with --profiles")
+            exit(-1)
+        if self.args.roles is not None:
+            self.args.roles = [ role.upper() for role in self.args.roles ]
+
 class CmdlineParseCreateDrop():
     """CmdlineParse parses the command line options required to provision
        a database/schema/warehouse and validates the parameters are valid."""
@@ -223,6 +298,12 @@ class CmdlineParseCreateDrop():
         for tmp_parser in [db_parser, sc_parser, wh_parser]:
             tmp_parser.add_argument('--comment', type=str, help='Comment to add to object')
             tmp_parser.add_argument('--tag', type=str, help='Add a single tag_name=value to object')
+            tmp_parser.add_argument('--apply', action='store_true', help='Apply the statements through the connection in config.json instead of printing them')
+            tmp_parser.add_argument('--compact', action='store_true', help='Merge privileges on the same target and role into a single grant statement')
+            tmp_parser.add_argument('--diff', action='store_true', help='Snapshot current grants in Snowflake and only output/apply the missing statements')
+            tmp_parser.add_argument('--journal', type=str, help='Journal file recording applied statements - rerun with the same journal to resume')
+            tmp_parser.add_argument('--max_workers', type=max_workers_validate, default=8, help='Number of statements applied concurrently within a phase')
+            tmp_parser.add_argument('--log_level', type=str, choices=['DEBUG','INFO','WARNING','ERROR','CRITICAL'], default='WARNING', help='Log Level to output')
 
         self.parser = parser
         self.args = parser.parse_args()
@@ -238,6 +319,9 @@ class CmdlineParseCreateDrop():
         self.type = type
         # name is a required argument so parser figures this out
         name = self.args.name
+        if self.args.journal is not None and self.args.apply is False:
+            print("--journal can only be used with --apply")
+            exit(-1)
         
         if (type == 'database'):
             db_match = self.sf_val.db_parse(name)
@@ -0,0 +1 @@
+CALL UPDATE_ALLFUTUREGRANTSDB_INCR();
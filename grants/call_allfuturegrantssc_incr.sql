@@ -0,0 +1 @@
+CALL UPDATE_ALLFUTUREGRANTSSC_INCR();
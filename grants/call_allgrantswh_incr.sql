@@ -0,0 +1 @@
+CALL UPDATE_ALLGRANTSWH_INCR();
@@ -0,0 +1,2 @@
+ALTER TASK UPD_ALLFUTUREGRANTSDB_INCR_TSK RESUME;
+
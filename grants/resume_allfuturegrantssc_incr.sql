@@ -0,0 +1,2 @@
+ALTER TASK UPD_ALLFUTUREGRANTSSC_INCR_TSK RESUME;
+
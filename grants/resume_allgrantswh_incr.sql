@@ -0,0 +1,2 @@
+ALTER TASK UPD_ALLGRANTSWH_INCR_TSK RESUME;
+
@@ -0,0 +1,184 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+
+class SfApply():
+    """SfApply executes generated provisioning statements through an SfConn.
+       Statements are grouped in phases that run strictly in order. Within a
+       phase the statements are independent of each other and are executed
+       concurrently. Every applied statement is recorded in an (optional)
+       journal so a run that failed part way can be resumed without running
+       the already applied statements again. The journal entries of the
+       statements a resumed run skipped are kept in skipped.
+
+       Independent chains of statements (e.g. the grants and revokes of one
+       functional role) can also be run with run_chains() where each chain is
+       executed in order and the chains run concurrently."""
+
+    def __init__(self, sf_conn, logger, journal=None, max_workers=8):
+        self.sf_conn     = sf_conn
+        self.logger      = logger
+        self.journal     = journal
+        self.max_workers = max(1, max_workers)
+        # key -> journal entry of every applied statement
+        self.applied     = {}
+        self.failures    = []
+        self.skipped     = []
+        if journal is not None and os.path.exists(journal):
+            self.load_journal()
+
+    def statement_key(self, phase, statement):
+        return hashlib.sha1(f"{phase}\n{statement}".encode('utf-8')).hexdigest()
+
+    def load_journal(self):
+        with open(self.journal, 'r') as fobj:
+            for line in fobj:
+                line = line.strip()
+                if line == '':
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A partially written last line from a killed run
+                    self.logger.warning(f"Ignoring unreadable journal entry in {self.journal}: {line}")
+                    continue
+                if entry.get('status') == 'applied':
+                    self.applied[entry['key']] = entry
+        self.logger.info(f"Loaded {len(self.applied)} applied statements from journal {self.journal}")
+
+    def write_journal(self, fobj, phase, statement, status, elapsed, error=None):
+        """Returns the journal entry of the statement, written to fobj unless it is None"""
+        entry = {
+            'key':        self.statement_key(phase, statement),
+            'phase':      phase,
+            'status':     status,
+            'statement':  statement,
+            'elapsed_ms': round(elapsed * 1000, 1),
+            'applied_at': datetime.now(timezone.utc).isoformat()
+        }
+        if error is not None:
+            entry['error'] = str(error)
+        if fobj is not None:
+            fobj.write(json.dumps(entry) + '\n')
+            fobj.flush()
+        return entry
+
+    def run_statement(self, statement):
+        start = time.time()
+        try:
+            curs = self.sf_conn.run_query(statement)
+            curs.close()
+        except Exception as e:
+            return e, time.time() - start
+        elapsed = time.time() - start
+        self.logger.debug("Applied in %.3fs: %s", elapsed, statement, duration_ms=round(elapsed * 1000, 1),
+                          query_id=getattr(curs, 'sfqid', None))
+        return None, elapsed
+
+    def run_phase(self, phase, statements, fobj):
+        pending = []
+        seen = {}
+        skipped = 0
+        for statement in statements:
+            key = self.statement_key(phase, statement)
+            if key in seen:
+                continue
+            seen[key] = 1
+            if key in self.applied:
+                self.logger.debug("Phase %s: already applied at %s: %s", phase, self.applied[key]['applied_at'], statement)
+                self.skipped.append(self.applied[key])
+                skipped += 1
+                continue
+            pending.append(statement)
+        if skipped > 0:
+            self.logger.info(f"Phase {phase}: skipping {skipped} statements already applied")
+        if len(statements) - len(pending) - skipped > 0:
+            self.logger.info(f"Phase {phase}: skipping {len(statements) - len(pending) - skipped} duplicated statements")
+        self.logger.info(f"Phase {phase}: applying {len(pending)} statements")
+        phase_failures = []
+        if len(pending) == 0:
+            return phase_failures
+        workers = min(self.max_workers, len(pending))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(self.run_statement, statement): statement for statement in pending}
+            for future in as_completed(futures):
+                statement = futures[future]
+                error, elapsed = future.result()
+                if error is None:
+                    entry = self.write_journal(fobj, phase, statement, 'applied', elapsed)
+                    self.applied[entry['key']] = entry
+                else:
+                    self.logger.error(f"Failed: {statement}: {error}")
+                    phase_failures.append((phase, statement, error))
+                    self.write_journal(fobj, phase, statement, 'failed', elapsed, error)
+        return phase_failures
+
+    def run(self, phases):
+        """Runs a list of (phase name, [statements]) in order. Stops after the
+           first phase with failures as later phases depend on earlier ones.
+           Returns the list of (phase, statement, error) failures."""
+        self.failures = []
+        self.skipped  = []
+        fobj = None
+        if self.journal is not None:
+            fobj = open(self.journal, 'a')
+            # Terminate the partially written last line of a killed run so the
+            # first entry of this run is not appended to it
+            if fobj.tell() > 0:
+                with open(self.journal, 'rb') as last:
+                    last.seek(-1, os.SEEK_END)
+                    if last.read(1) != b'\n':
+                        fobj.write('\n')
+        try:
+            for phase, statements in phases:
+                phase_failures = self.run_phase(phase, statements, fobj)
+                if len(phase_failures) > 0:
+                    self.failures.extend(phase_failures)
+                    self.logger.error(f"Phase {phase} had {len(phase_failures)} failures - not continuing with the remaining phases")
+                    break
+        finally:
+            if fobj is not None:
+                fobj.close()
+        return self.failures
+
+    def print_skipped(self):
+        """Prints the statements the last run() skipped as already applied"""
+        for entry in self.skipped:
+            print(f"-- {entry['phase']} already applied at {entry['applied_at']}: {entry['statement']}")
+
+    def run_chain(self, name, statements):
+        results = []
+        for statement in statements:
+            error, elapsed = self.run_statement(statement)
+            result = { 'statement': statement, 'status': 'applied', 'elapsed_ms': round(elapsed * 1000, 1) }
+            if error is not None:
+                result['status'] = 'failed'
+                result['error'] = str(error)
+                results.append(result)
+                # Later statements in a chain depend on the earlier ones
+                self.logger.error(f"{name}: failed: {statement}: {error} - skipping {len(statements) - len(results)} remaining statements")
+                break
+            results.append(result)
+        return results
+
+    def run_chains(self, chains):
+        """Runs a list of (name, [statements]). The statements of a chain run in
+           order and stop at the first failure, up to max_workers chains run
+           concurrently. Returns a dictionary of name -> list of results."""
+        self.failures = []
+        results = {}
+        if len(chains) == 0:
+            return results
+        workers = min(self.max_workers, len(chains))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(self.run_chain, name, statements): name for name, statements in chains}
+            for future in as_completed(futures):
+                name = futures[future]
+                results[name] = future.result()
+                for result in results[name]:
+                    if result['status'] == 'failed':
+                        self.failures.append((name, result['statement'], result['error']))
+        return results
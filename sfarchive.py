@@ -0,0 +1,134 @@
+import glob
+import os
+import sqlite3
+from datetime import datetime, timezone
+
+def write_content(file_nm, ddls):
+    # Overloaded procedures and functions share a file, as written by sf_export
+    with open(file_nm, 'w') as fobj:
+        for ddl in ddls:
+            fobj.write(ddl)
+            fobj.write('\n')
+
+def archive_name(export_dir, started_at):
+    return os.path.join(export_dir, f"export-{started_at.strftime('%Y%m%dT%H%M%S')}.sqlite")
+
+def list_archives(export_dir, partial=False):
+    """Finished archives of an export directory, oldest first, or the
+       archives of runs that did not finish with partial"""
+    return sorted(glob.glob(os.path.join(export_dir, 'export-*.sqlite' + ('.partial' if partial else ''))))
+
+def find_archive(path):
+    # An export directory stands for its latest archive
+    if os.path.isdir(path):
+        archives = list_archives(path)
+        if len(archives) == 0:
+            raise ValueError(f"No archives in {path}")
+        return archives[-1]
+    if not os.path.exists(path):
+        raise ValueError(f"Archive {path} does not exist")
+    return path
+
+class SfArchive():
+    """SfArchive is a single SQLite file holding every object of an export
+       run. Objects are appended as they are exported, one row per DDL (so
+       several per overloaded procedure or function) and committed once per
+       schema, instead of a file being opened, written and closed per object.
+       Schemas a run did not export again are copied from the previous
+       archive, so every archive is a complete export that can be listed,
+       extracted to the file per object layout and diffed with another one.
+       A run writes to export-<started>.sqlite.partial, renamed when it
+       finished."""
+
+    def __init__(self, filename, logger=None):
+        self.filename = filename
+        self.logger   = logger
+        # The pipelined export (see sfexport.py) writes from its own thread
+        self.db       = sqlite3.connect(filename, check_same_thread=False)
+        self.create_tables()
+
+    def create_tables(self):
+        self.db.execute("create table if not exists archive_info (key text primary key, value text)")
+        self.db.execute("create table if not exists objects (id integer primary key, schema text, file text, exported_at text, ddl text)")
+        self.db.execute("create index if not exists objects_schema_file on objects (schema, file)")
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def info(self, key):
+        row = self.db.execute("select value from archive_info where key = ?", (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def set_info(self, key, value):
+        with self.db:
+            self.db.execute("insert or replace into archive_info values (?, ?)", (key, value))
+
+    def schemas(self):
+        return [ row[0] for row in self.db.execute("select distinct schema from objects order by schema") ]
+
+    def files(self, schema):
+        """{ file: exported_at } of the objects of a schema"""
+        return { file: exported_at for file, exported_at in
+                 self.db.execute("select file, max(exported_at) from objects where schema = ? group by file", (schema,)) }
+
+    def contents(self, schemas=None):
+        """{ (schema, file): [ ddl, ... ] } of the given schemas, all when schemas is None"""
+        contents = {}
+        if schemas is None:
+            rows = self.db.execute("select schema, file, ddl from objects order by schema, file, id")
+        else:
+            rows = [ row for schema in schemas for row in
+                     self.db.execute("select schema, file, ddl from objects where schema = ? order by file, id", (schema,)) ]
+        for schema, file, ddl in rows:
+            contents.setdefault((schema, file), []).append(ddl)
+        return contents
+
+    def add(self, schema, file, exported_at, ddl):
+        self.db.execute("insert into objects (schema, file, exported_at, ddl) values (?, ?, ?, ?)", (schema, file, exported_at, ddl))
+
+    def add_many(self, rows):
+        self.db.executemany("insert into objects (schema, file, exported_at, ddl) values (?, ?, ?, ?)", rows)
+
+    def clear_schema(self, schema):
+        # Rows of a schema export that failed or was interrupted
+        self.db.execute("delete from objects where schema = ?", (schema,))
+
+    def copy_from(self, previous, schema, files):
+        """Copies the objects in files of schema from the archive previous"""
+        for file in files:
+            self.db.executemany("insert into objects (schema, file, exported_at, ddl) values (?, ?, ?, ?)",
+                                previous.db.execute("select schema, file, exported_at, ddl from objects where schema = ? and file = ? order by id",
+                                                    (schema, file)).fetchall())
+
+    def commit(self):
+        self.db.commit()
+
+    def finish(self):
+        self.set_info('finished_at', datetime.now(timezone.utc).isoformat())
+
+    def extract(self, target_dir, schemas=None):
+        """Writes the file per object layout of schemas (all when None) to
+           target_dir with the files dated when they were exported, and returns
+           the number of files written"""
+        files = 0
+        exported = {}
+        for (schema, file), ddls in self.contents(schemas).items():
+            if schema not in exported:
+                exported[schema] = self.files(schema)
+                os.makedirs(os.path.join(target_dir, schema), 0o770, exist_ok=True)
+            file_nm = os.path.join(target_dir, schema, file)
+            write_content(file_nm, ddls)
+            exported_at = datetime.fromisoformat(exported[schema][file]).timestamp()
+            os.utime(file_nm, (exported_at, exported_at))
+            files += 1
+        return files
+
+    def diff(self, other, schemas=None):
+        """Objects added, removed and changed in other since this archive, as sorted "schema/file" lists"""
+        old, new = self.contents(schemas), other.contents(schemas)
+        return {
+            'added':   sorted(f"{schema}/{file}" for schema, file in new.keys() - old.keys()),
+            'removed': sorted(f"{schema}/{file}" for schema, file in old.keys() - new.keys()),
+            'changed': sorted(f"{schema}/{file}" for schema, file in old.keys() & new.keys() if old[(schema, file)] != new[(schema, file)])
+        }
@@ -0,0 +1,400 @@
+import atexit
+import json
+import re
+import threading
+import time
+from datetime import date, datetime, timezone, time as dt_time
+from decimal import Decimal
+
+# Backends SfConn can run on, selected with "backend" in config.json
+backends = [ 'snowflake', 'record', 'replay', 'sim' ]
+
+def programming_error():
+    """snowflake.connector takes a few hundred milliseconds to import, so its
+       ProgrammingError is only loaded when an error is raised or handled"""
+    from snowflake.connector.errors import ProgrammingError
+    return ProgrammingError
+
+def normalize_query(query):
+    # Recordings are matched on the query text with whitespace collapsed
+    return ' '.join(query.split())
+
+def encode_value(value):
+    if isinstance(value, datetime):
+        return { '__datetime__': value.isoformat() }
+    if isinstance(value, date):
+        return { '__date__': value.isoformat() }
+    if isinstance(value, dt_time):
+        return { '__time__': value.isoformat() }
+    if isinstance(value, Decimal):
+        return { '__decimal__': str(value) }
+    if isinstance(value, bytes):
+        return { '__bytes__': value.hex() }
+    raise TypeError(f"Cannot record value of type {type(value).__name__}")
+
+def decode_value(obj):
+    if '__datetime__' in obj:
+        return datetime.fromisoformat(obj['__datetime__'])
+    if '__date__' in obj:
+        return date.fromisoformat(obj['__date__'])
+    if '__time__' in obj:
+        return dt_time.fromisoformat(obj['__time__'])
+    if '__decimal__' in obj:
+        return Decimal(obj['__decimal__'])
+    if '__bytes__' in obj:
+        return bytes.fromhex(obj['__bytes__'])
+    return obj
+
+class SfResultCursor():
+    """Cursor interface used by the tools (execute, fetchone, fetchall,
+       iteration and close) over rows that are already in memory."""
+    def __init__(self):
+        self.rows  = []
+        self.pos   = 0
+        # Query id of the last statement, as the sfqid of a connector cursor
+        self.sfqid = None
+
+    def set_rows(self, rows):
+        self.rows = rows
+        self.pos  = 0
+
+    def fetchone(self):
+        if self.pos >= len(self.rows):
+            return None
+        row = self.rows[self.pos]
+        self.pos += 1
+        return row
+
+    def fetchall(self):
+        rows = self.rows[self.pos:]
+        self.pos = len(self.rows)
+        return rows
+
+    def __iter__(self):
+        while self.pos < len(self.rows):
+            yield self.fetchone()
+
+    def close(self):
+        self.rows = []
+        self.pos  = 0
+
+class SfRecorder():
+    """SfRecorder appends every query of a session with its result rows (or
+       error) and latency to a JSON lines recording."""
+    def __init__(self, filename):
+        self.filename = filename
+        self.fobj = open(filename, 'a')
+
+    def record(self, query, rows, error, latency, query_id=None):
+        entry = {
+            'query':    normalize_query(query),
+            'rows':     rows,
+            'error':    error,
+            'latency':  round(latency, 6),
+            'query_id': query_id
+        }
+        self.fobj.write(json.dumps(entry, default=encode_value) + '\n')
+        self.fobj.flush()
+
+    def close(self):
+        self.fobj.close()
+
+class SfRecordingCursor(SfResultCursor):
+    def __init__(self, cursor, recorder):
+        super().__init__()
+        self.cursor   = cursor
+        self.recorder = recorder
+
+    def execute(self, query):
+        start = time.perf_counter()
+        try:
+            self.cursor.execute(query)
+            rows = [ tuple(row) for row in self.cursor.fetchall() ]
+        except programming_error() as e:
+            self.sfqid = getattr(self.cursor, 'sfqid', None)
+            self.recorder.record(query, None, str(e), time.perf_counter() - start, self.sfqid)
+            raise
+        # Replayed so statements naming a query id (result_scan) match the recording
+        self.sfqid = getattr(self.cursor, 'sfqid', None)
+        self.recorder.record(query, rows, None, time.perf_counter() - start, self.sfqid)
+        self.set_rows(rows)
+        return self
+
+    def close(self):
+        super().close()
+        self.cursor.close()
+
+class SfRecordingConn():
+    """Wraps a snowflake connection and records everything run through it"""
+    def __init__(self, conn, filename):
+        self.conn     = conn
+        self.recorder = SfRecorder(filename)
+
+    def cursor(self):
+        return SfRecordingCursor(self.conn.cursor(), self.recorder)
+
+    def close(self):
+        self.conn.close()
+        self.recorder.close()
+
+class SfReplayCursor(SfResultCursor):
+    def __init__(self, conn):
+        super().__init__()
+        self.conn = conn
+
+    def execute(self, query):
+        entry = self.conn.next_result(query)
+        self.sfqid = entry.get('query_id')
+        if entry['error'] is not None:
+            raise programming_error()(entry['error'])
+        self.set_rows([ tuple(row) for row in entry['rows'] ])
+        return self
+
+class SfReplayConn():
+    """SfReplayConn serves the results of a recording made with the record
+       backend without connecting to Snowflake. A query recorded several
+       times returns its results in the recorded order and the last result
+       once they run out. Every round trip sleeps latency_ms, or the recorded
+       latency when latency_ms is not set."""
+    def __init__(self, filename, latency_ms=None):
+        self.filename   = filename
+        self.latency_ms = latency_ms
+        self.results    = {}
+        self.served     = {}
+        self.round_trips = 0
+        # Cursors of one connection may be used from several threads
+        self.lock       = threading.Lock()
+        with open(filename, 'r') as fobj:
+            for line in fobj:
+                if line.strip() == '':
+                    continue
+                entry = json.loads(line, object_hook=decode_value)
+                self.results.setdefault(entry['query'], []).append(entry)
+
+    def next_result(self, query):
+        query = normalize_query(query)
+        if query not in self.results:
+            raise programming_error()(f"Query not found in recording {self.filename}: {query}")
+        entries = self.results[query]
+        with self.lock:
+            served = self.served.get(query, 0)
+            self.served[query] = served + 1
+            self.round_trips += 1
+        entry = entries[min(served, len(entries) - 1)]
+        latency = entry['latency'] if self.latency_ms is None else self.latency_ms / 1000
+        if latency > 0:
+            time.sleep(latency)
+        return entry
+
+    def cursor(self):
+        return SfReplayCursor(self)
+
+    def close(self):
+        pass
+
+class SfSimAccount():
+    """Synthetic account metadata of a given size: databases with schemas of
+       tables (of columns), views and procedures, a warehouse per database, the
+       access roles of every database, schema and warehouse and functional
+       roles with a schema and a warehouse access role granted to each."""
+    db_levels = [ 'ADM', 'RW', 'RX', 'RO' ]
+    wh_levels = [ 'ADM', 'MOD', 'MON', 'USE' ]
+
+    def __init__(self, databases=1, schemas=1, objects=10, columns=10, roles=10, types=None):
+        self.databases  = [ f"SIM_DB_{i:03}" for i in range(databases) ]
+        self.schemas    = [ f"SC_{i:03}" for i in range(schemas) ]
+        self.warehouses = [ f"SIM_WH_{i:03}" for i in range(databases) ]
+        self.objects    = objects
+        self.columns    = [ f"COL_{i:03}" for i in range(columns) ]
+        self.roles      = [ f"SIM_{i:04}_FR" for i in range(roles) ]
+        # Objects are dealt out round robin over these types
+        self.types      = types or [ 'TABLE', 'VIEW', 'PROCEDURE' ]
+        self.last_altered = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    def object_names(self, obj_type):
+        return [ f"OBJ_{i:04}" for i in range(self.objects) if self.types[i % len(self.types)] == obj_type ]
+
+    def role_schema(self, role_nr):
+        return self.databases[role_nr % len(self.databases)], self.schemas[role_nr % len(self.schemas)]
+
+    def role_warehouse(self, role_nr):
+        return self.warehouses[role_nr % len(self.warehouses)]
+
+    def db_grants(self):
+        return [ (f"_DB_{db}_{level}_AR", db) for db in self.databases for level in self.db_levels ]
+
+    def sc_grants(self):
+        return [ (f"_SC_{db}_{sc}_{level}_AR", db, sc) for db in self.databases for sc in self.schemas for level in self.db_levels ]
+
+    def wh_grants(self):
+        return [ (f"_WH_{wh}_{level}_AR", wh) for wh in self.warehouses for level in self.wh_levels ]
+
+    def role_grants(self):
+        grants = []
+        for role_nr, role in enumerate(self.roles):
+            db, sc = self.role_schema(role_nr)
+            grants.append((role, f"_SC_{db}_{sc}_RO_AR"))
+            grants.append((role, f"_WH_{self.role_warehouse(role_nr)}_USE_AR"))
+        return grants
+
+    def all_roles(self):
+        return [ row[0] for row in self.db_grants() + self.sc_grants() + self.wh_grants() ] + self.roles
+
+class SfSimConn():
+    """SfSimConn answers the queries of the tools from an SfSimAccount. Every
+       statement is one round trip that sleeps latency_ms. The number of round
+       trips of all sessions of the process is written to the stats file when
+       the process exits. Like a Snowflake session it keeps the output of its
+       show statements for result_scan, by query id or of last_query_id(),
+       which is the last statement run on the session by any thread."""
+    status = [ ('Statement executed successfully.',) ]
+    # Columns of the show output kept for result_scan
+    show_columns       = [ 'created_on', 'name' ]
+    show_grant_columns = [ 'privilege', 'granted_on', 'name' ]
+    total_round_trips = 0
+    # Sessions are used from several threads (sf_apply, the export pipeline)
+    count_lock = threading.Lock()
+
+    def __init__(self, spec, latency_ms=None, stats=None):
+        self.account     = SfSimAccount(**spec)
+        self.latency_ms  = latency_ms
+        self.stats       = stats
+        self.round_trips = 0
+        # query id -> (columns, rows) of the show statements, and the last query id of the session
+        self.show_results  = {}
+        self.last_query_id = None
+        self.rules = [
+            (r'^show (tasks|streams|dynamic tables) in schema\b', self.show_rows),
+            (r'^show grants to role\b', self.show_grant_rows),
+            (r'^(alter|use|create|insert|grant|revoke|drop|show)\b', self.status_rows),
+            (r'^select current_version\(\)', self.version_rows),
+            (r'from snowflake\.account_usage\.schemata', self.schemata_rows),
+            (r'^select get_ddl\(', self.ddl_rows),
+            (r'result_scan\(', self.scan_rows),
+            (r'clone_tables as', self.clone_rows),
+            (r"select 'from' as type", self.key_rows),
+            (r"select 'from' as source, column_name", self.column_rows),
+            (r'\bas diff from', self.diff_rows),
+            (r'^with cnt as', self.zero_rows),
+            (r'^select count\(', self.count_rows),
+            (r'information_schema\.tables t\s', self.table_rows),
+            (r'information_schema\.(tables|views|procedures)\b', self.object_rows),
+            (r'information_schema\.', self.empty_rows),
+            (r'from allfuturegrantsdb', lambda query: self.account.db_grants()),
+            (r'from allfuturegrantssc', lambda query: self.account.sc_grants()),
+            (r'from allgrantswh', lambda query: self.account.wh_grants()),
+            (r'from snowflake\.account_usage\.roles', lambda query: [ (role,) for role in self.account.all_roles() ]),
+            (r'from snowflake\.account_usage\.grants_to_roles', self.role_grant_rows)
+        ]
+        self.rules = [ (re.compile(pattern, re.IGNORECASE), rows) for pattern, rows in self.rules ]
+        # Rules answering show statements and the columns of their output
+        self.show_rules = { self.show_rows: self.show_columns, self.show_grant_rows: self.show_grant_columns }
+        # Not every tool closes its connection before it exits
+        atexit.register(self.write_stats)
+
+    def next_result(self, query):
+        query = normalize_query(query)
+        with SfSimConn.count_lock:
+            self.round_trips += 1
+            SfSimConn.total_round_trips += 1
+            query_id = f"sim-{SfSimConn.total_round_trips:08}"
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        for pattern, rows in self.rules:
+            if pattern.search(query):
+                result = rows(query)
+                with SfSimConn.count_lock:
+                    if rows in self.show_rules:
+                        self.show_results[query_id] = (self.show_rules[rows], result)
+                    self.last_query_id = query_id
+                return { 'rows': result, 'error': None, 'query_id': query_id }
+        raise programming_error()(f"Query not supported by the sim backend: {query}")
+
+    def status_rows(self, query):
+        return self.status
+
+    def empty_rows(self, query):
+        return []
+
+    def show_rows(self, query):
+        obj_type = re.search(r'^show (\w+(?: \w+)?)s in schema', query, re.IGNORECASE).group(1).upper()
+        return [ (self.account.last_altered, name) for name in self.account.object_names(obj_type) ]
+
+    def show_grant_rows(self, query):
+        role = re.search(r'^show grants to role (\S+)', query, re.IGNORECASE).group(1).strip('"').upper()
+        if role not in self.account.all_roles():
+            raise programming_error()(f"Role '{role}' does not exist or not authorized.")
+        return [ ('USAGE', 'ROLE', granted) for grantee, granted in self.account.role_grants() if grantee == role ]
+
+    def scan_rows(self, query):
+        # The quoted columns selected from the show output of the query scanned
+        match = re.search(r"result_scan\('([^']+)'\)", query)
+        query_id = self.last_query_id if match is None else match.group(1)
+        columns = re.findall(r'"(\w+)"', query[:query.lower().index(' from ')])
+        show_columns, rows = self.show_results.get(query_id, (self.show_columns, []))
+        # Only equality filters on the show columns, as the tools use them
+        for column, value in re.findall(r'"(\w+)" = \'([^\']*)\'', query[query.lower().index(' from '):]):
+            rows = [ row for row in rows if row[show_columns.index(column)] == value ]
+        return [ tuple(row[show_columns.index(column)] for column in columns) for row in rows ]
+
+    def zero_rows(self, query):
+        return [ (0,) ]
+
+    def version_rows(self, query):
+        return [ ('8.0.0', 'SIM_ROLE', self.account.databases[0], self.account.schemas[0], self.account.warehouses[0]) ]
+
+    def schemata_rows(self, query):
+        return [ (db, sc) for db in self.account.databases for sc in self.account.schemas ]
+
+    def ddl_rows(self, query):
+        obj_type, name = re.search(r"get_ddl\('([^']+)', '([^']+)'\)", query).groups()
+        return [ (f"create or replace {obj_type.lower()} {name} as select 1;",) ]
+
+    def object_rows(self, query):
+        obj_type = { 'tables': 'TABLE', 'views': 'VIEW', 'procedures': 'PROCEDURE' }[re.search(r'information_schema\.(\w+)', query).group(1)]
+        last_altered = self.account.last_altered
+        if obj_type == 'PROCEDURE':
+            return [ (name, last_altered, '(ARG VARCHAR)') for name in self.account.object_names(obj_type) ]
+        return [ (name, last_altered) for name in self.account.object_names(obj_type) ]
+
+    def table_rows(self, query):
+        db, sc = re.search(r"where t\.table_catalog = '(\w+)' and t\.table_schema = '(\w+)'", query).groups()
+        return [ (nr, nr, db, sc, name, 'SIM_ROLE', False, 'NO', 1000, 1, 8192, 8192, 0, 0, 0)
+                 for nr, name in enumerate(self.account.object_names('TABLE')) ]
+
+    def clone_rows(self, query):
+        (to_db, to_sc), (from_db, from_sc) = re.findall(r"tsm\.table_catalog = '(\w+)' and tsm\.table_schema = '(\w+)'", query)
+        # Every other table has changed since it was cloned
+        return [ (f"{to_db}.{to_sc}", f"{from_db}.{from_sc}", name, False, False, False, nr % 2 == 0, False, False)
+                 for nr, name in enumerate(self.account.object_names('TABLE')) ]
+
+    def key_rows(self, query):
+        return [ ('FROM', 0), ('TO', 0), ('BOTH', 1000) ]
+
+    def column_rows(self, query):
+        return [ ('BOTH', column) for column in self.account.columns ]
+
+    def diff_rows(self, query):
+        # Every fourth column has differences
+        column = re.search(r'\b(COL_\d+)\b', query)
+        if column is not None and int(column.group(1)[4:]) % 4 == 0:
+            return [ (5,) ]
+        return [ (0,) ]
+
+    def count_rows(self, query):
+        return [ (1000,) ]
+
+    def role_grant_rows(self, query):
+        return [ (grantee, role, self.account.last_altered, False) for grantee, role in self.account.role_grants() ]
+
+    def cursor(self):
+        return SfReplayCursor(self)
+
+    def write_stats(self):
+        if self.stats is None:
+            return
+        with open(self.stats, 'w') as fobj:
+            json.dump({ 'round_trips': SfSimConn.total_round_trips }, fobj)
+
+    def close(self):
+        self.write_stats()
@@ -0,0 +1,234 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from sfbackend import SfSimAccount
+
+# Size of the synthetic account for each preset
+bench_sizes = {
+    'small':  { 'databases': 1, 'schemas': 2,  'objects': 30,  'columns': 10, 'roles': 20 },
+    'medium': { 'databases': 2, 'schemas': 5,  'objects': 150, 'columns': 25, 'roles': 200 },
+    'large':  { 'databases': 4, 'schemas': 10, 'objects': 600, 'columns': 50, 'roles': 2000 }
+}
+
+bench_scenarios = [ 'export', 'clone_refresh', 'tieout', 'funcrole' ]
+
+# Entry points timed by the startup benchmark (--help) and their budget
+bench_entry_points = [ 'sf_create_obj', 'sf_drop_obj', 'sf_export', 'sf_clone', 'sf_tieout', 'sf_funcrole',
+                       'sf_genrole', 'sf_rolegraph', 'sf_snapshot', 'sf_service', 'sf_archive', 'sf_bench' ]
+startup_budget_ms = 150
+
+# A statement count above the baseline is always a regression, wall-clock only
+# when it is more than the tolerance slower and at least this many seconds
+min_wall_clock_delta = 0.5
+
+# The validator benchmark scales the cases of testsfvalidator.py to this many
+# identifiers, numbered so there are this many variants of every case
+validator_identifiers = 1000000
+validator_variants = 1000
+
+def bench_key(scenario, size):
+    return f"{scenario}/{size}"
+
+class SfBench():
+    """SfBench runs the tools against a synthetic account of a given size
+       served by the sim backend of SfConn and measures wall-clock, the
+       number of SQL statements (round trips), statements per object and peak
+       RSS of every run. Each run gets its own working directory and HOME so
+       caches of earlier runs are not picked up."""
+
+    def __init__(self, repo_dir, logger, latency_ms=0):
+        self.repo_dir   = repo_dir
+        self.logger     = logger
+        self.latency_ms = latency_ms
+        self.results    = []
+
+    def prepare(self, work_dir, spec):
+        os.makedirs(os.path.join(work_dir, 'home'), 0o700)
+        config = {
+            'account':    'SIM_ACCOUNT',
+            'user':       'bench@sim',
+            'warehouse':  'SIM_WH_000',
+            'role':       'SIM_ROLE',
+            'database':   'SIM_DB_000',
+            'schema':     'SC_000',
+            'backend':    'sim',
+            'sim':        spec,
+            'latency_ms': self.latency_ms,
+            'stats':      os.path.join(work_dir, 'stats.json')
+        }
+        with open(os.path.join(work_dir, 'config.json'), 'w') as fobj:
+            json.dump(config, fobj, indent=4)
+
+    def scenario_args(self, scenario, work_dir, account):
+        """Returns the command line and the number of objects the scenario processes"""
+        tables = account.object_names('TABLE')
+        if scenario == 'export':
+            return [ 'sf_export', '--all', '--export_dir', 'export', '--log_level', 'WARNING' ], len(account.databases) * len(account.schemas) * account.objects
+        if scenario == 'clone_refresh':
+            return [ 'sf_clone', '--log_level', 'WARNING', 'refresh', '--owner_role', 'SIM_OWNER_FR', '--clone_role', 'SIM_CLONE_FR',
+                     '--from_db_sc', f"{account.databases[0]}.SC_000", '--to_db_sc', f"{account.databases[0]}.SC_001" ], len(tables)
+        if scenario == 'tieout':
+            validations = [ { 'NAME': name, 'KEY': [ 'ID' ], 'FROM_TBL': f"{account.databases[0]}.SC_000.{name}",
+                              'TO_TBL': f"{account.databases[0]}.SC_001.{name}" } for name in tables ]
+            tieout_cfg = { 'BENCH': { 'OUTPUT_DB': account.databases[0], 'OUTPUT_SC': 'SC_000', 'OUTPUT_PREFIX': 'BENCH', 'VALIDATIONS': validations } }
+            # JSON is valid YAML
+            with open(os.path.join(work_dir, 'tieout.yaml'), 'w') as fobj:
+                json.dump(tieout_cfg, fobj, indent=4)
+            return [ 'sf_tieout', '--yaml', 'tieout.yaml', '--target', 'BENCH', '--log_level', 'WARNING' ], len(tables) * len(account.columns)
+        if scenario == 'funcrole':
+            for filename in [ 'db-config.json', 'sc-config.json', 'wh-config.json' ]:
+                shutil.copy(os.path.join(self.repo_dir, filename), work_dir)
+            fr_cfg = {}
+            for role_nr, role in enumerate(account.roles):
+                db, sc = account.role_schema(role_nr)
+                fr_cfg[role] = {
+                    'ORDER': 'INCEXC',
+                    'INCLUDE': [ { 'TYPE': 'SCHEMA', 'DATABASE': db, 'SCHEMA': sc, 'ROLE': 'RW' },
+                                 { 'TYPE': 'WAREHOUSE', 'WAREHOUSE': account.role_warehouse(role_nr), 'ROLE': 'USE' } ],
+                    'EXCLUDE': [], 'CUSTOM_INCLUDE': [], 'CUSTOM_EXCLUDE': [], 'SCIM_ROLES': []
+                }
+            with open(os.path.join(work_dir, 'fr-config.json'), 'w') as fobj:
+                json.dump(fr_cfg, fobj, indent=4)
+            return [ 'sf_funcrole', '--log_level', 'WARNING' ], len(account.roles)
+        raise ValueError(f"Unknown benchmark scenario {scenario}")
+
+    def run(self, scenario, size):
+        spec = bench_sizes[size]
+        account = SfSimAccount(**spec)
+        with tempfile.TemporaryDirectory(prefix='sfbench-') as work_dir:
+            self.prepare(work_dir, spec)
+            args, objects = self.scenario_args(scenario, work_dir, account)
+            env = dict(os.environ, HOME=os.path.join(work_dir, 'home'))
+            self.logger.info(f"Running {scenario} ({size}): {' '.join(args)}")
+            with open(os.path.join(work_dir, 'stderr.log'), 'w+') as stderr:
+                start = time.perf_counter()
+                proc = subprocess.Popen([ sys.executable, os.path.join(self.repo_dir, args[0]) ] + args[1:],
+                                        cwd=work_dir, env=env, stdout=subprocess.DEVNULL, stderr=stderr)
+                # wait4 returns the resource usage of this child only
+                _, status, rusage = os.wait4(proc.pid, 0)
+                wall_clock = time.perf_counter() - start
+                proc.returncode = os.waitstatus_to_exitcode(status)
+                if proc.returncode != 0:
+                    stderr.seek(0)
+                    self.logger.error(f"{scenario} ({size}) exited with {proc.returncode}:\n{stderr.read()}")
+            statements = None
+            if os.path.exists(os.path.join(work_dir, 'stats.json')):
+                with open(os.path.join(work_dir, 'stats.json'), 'r') as fobj:
+                    statements = json.load(fobj)['round_trips']
+        result = {
+            'scenario':    scenario,
+            'size':        size,
+            'exit_code':   proc.returncode,
+            'objects':     objects,
+            'statements':  statements,
+            'statements_per_object': None if statements is None or objects == 0 else round(statements / objects, 2),
+            'wall_clock':  round(wall_clock, 3),
+            # ru_maxrss is in kilobytes on Linux
+            'peak_rss_kb': rusage.ru_maxrss
+        }
+        self.results.append(result)
+        return result
+
+    def startup(self, entry_point, runs=5):
+        """Best of runs wall-clock in milliseconds of the entry point printing its help.
+           Heavy dependencies are imported lazily so this stays within startup_budget_ms."""
+        best = None
+        for run in range(runs):
+            start = time.perf_counter()
+            subprocess.run([ sys.executable, os.path.join(self.repo_dir, entry_point), '--help' ],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            elapsed = (time.perf_counter() - start) * 1000
+            if best is None or elapsed < best:
+                best = elapsed
+        self.logger.info(f"Startup of {entry_point}: {best:.1f} ms")
+        return round(best, 1)
+
+    def validator(self, count=validator_identifiers):
+        """Seconds to validate count identifiers built from the testsfvalidator.py
+           cases one at a time (is_unquoted_name/is_quoted_name or split_db_sc)
+           and with SfValidator.normalize_identifiers, and the number valid"""
+        from sfvalidator import SfValidator
+        import testsfvalidator as cases
+        names = cases.true_unquoted_nms + cases.false_unquoted_nms + cases.true_quoted_nms + cases.false_quoted_nms
+        db_scs = [ db_sc for db_sc, res in cases.true_db_sc ] + cases.false_db_sc
+        templates = [ (name, 1) for name in names ] + [ (db_sc, 2) for db_sc in db_scs ]
+        identifiers = []
+        for nr in range(count):
+            identifier, parts = templates[nr % len(templates)]
+            variant = f"_{(nr // len(templates)) % validator_variants}"
+            if identifier.endswith('"'):
+                identifier = identifier[:-1] + variant + '"'
+            else:
+                identifier = identifier + variant
+            identifiers.append((identifier, parts))
+
+        def one_at_a_time(sf_val):
+            valid = 0
+            for identifier, parts in identifiers:
+                if parts == 1:
+                    valid += sf_val.is_unquoted_name(identifier) or sf_val.is_quoted_name(identifier)
+                else:
+                    try:
+                        sf_val.split_db_sc(identifier)
+                        valid += 1
+                    except ValueError:
+                        pass
+            return valid
+
+        def batch(sf_val):
+            # Mixed lists are validated by the number of parts of each kind
+            valid = 0
+            for parts in [ 1, 2 ]:
+                normalized = sf_val.normalize_identifiers([ identifier for identifier, kind in identifiers if kind == parts ], parts)
+                valid += sum(result is not None for result in normalized)
+            return valid
+
+        results = []
+        for method, run in [ ('one_at_a_time', one_at_a_time), ('batch', batch) ]:
+            start = time.perf_counter()
+            valid = run(SfValidator())
+            elapsed = time.perf_counter() - start
+            self.logger.info(f"Validated {count} identifiers {method} in {elapsed:.3f}s")
+            results.append({ 'method': method, 'identifiers': count, 'valid': valid, 'seconds': round(elapsed, 3) })
+        return results
+
+    def regressions(self, baseline, tolerance=0.25):
+        """Compares the results with a baseline saved by save_baseline"""
+        regressions = []
+        for result in self.results:
+            base = baseline.get(bench_key(result['scenario'], result['size']))
+            if base is None:
+                continue
+            key = bench_key(result['scenario'], result['size'])
+            if result['exit_code'] != 0:
+                regressions.append(f"{key}: exited with {result['exit_code']}")
+                continue
+            if base['statements'] is not None and (result['statements'] is None or result['statements'] > base['statements']):
+                regressions.append(f"{key}: {result['statements']} statements, baseline {base['statements']}")
+            if (result['wall_clock'] > base['wall_clock'] * (1 + tolerance)
+                    and result['wall_clock'] - base['wall_clock'] > min_wall_clock_delta):
+                regressions.append(f"{key}: {result['wall_clock']}s wall-clock, baseline {base['wall_clock']}s")
+        return regressions
+
+    def save_baseline(self, filename):
+        baseline = {}
+        if os.path.exists(filename):
+            with open(filename, 'r') as fobj:
+                baseline = json.load(fobj)
+        for result in self.results:
+            baseline[bench_key(result['scenario'], result['size'])] = result
+        with open(filename, 'w') as fobj:
+            json.dump(baseline, fobj, indent=4, sort_keys=True)
+            fobj.write('\n')
+
+    def print_report(self, baseline={}):
+        print(f"{'scenario':<16} {'size':<8} {'objects':>8} {'statements':>11} {'baseline':>9} {'stmt/obj':>9} {'wall (s)':>9} {'peak rss (MB)':>14}")
+        for result in self.results:
+            base = baseline.get(bench_key(result['scenario'], result['size']), {})
+            print(f"{result['scenario']:<16} {result['size']:<8} {result['objects']:>8} {str(result['statements']):>11} "
+                  f"{str(base.get('statements', '-')):>9} {str(result['statements_per_object']):>9} "
+                  f"{result['wall_clock']:>9.3f} {result['peak_rss_kb'] / 1024:>14.1f}")
@@ -0,0 +1,72 @@
+import hashlib
+import os
+import threading
+
+def zstd():
+    # zstandard is optional and only needed for compressed stores
+    import zstandard
+    return zstandard
+
+def normalize_ddl(content):
+    """DDL bodies are stored without trailing whitespace on any line and
+       without leading or trailing blank lines, so bodies that only differ in
+       those hash to the same blob"""
+    if content is None:
+        return ''
+    return '\n'.join(line.rstrip() for line in content.strip('\n').splitlines()).strip('\n')
+
+class SfBlobStore():
+    """SfBlobStore keeps every distinct DDL body once, in a file named by the
+       sha256 of its normalized text: <store_dir>/<2 hex>/<sha256>, with a .zst
+       extension when compressed. Writing a body that is already in the store
+       costs a stat and no write, so schemas exported from several
+       environments (PRD, QA, DEV) into one store share their identical
+       objects. Blobs are written to a temporary file and renamed so several
+       processes and sf_service jobs can write to the same store."""
+
+    def __init__(self, store_dir, compress=False, level=3):
+        self.store_dir = os.path.abspath(store_dir)
+        self.compress  = compress
+        self.level     = level
+        self.written   = 0
+        self.reused    = 0
+        if compress:
+            # Fails early when zstandard is not installed
+            zstd()
+
+    def path(self, digest, compressed=False):
+        return os.path.join(self.store_dir, digest[:2], digest + ('.zst' if compressed else ''))
+
+    def find(self, digest):
+        for compressed in [ self.compress, not self.compress ]:
+            if os.path.exists(self.path(digest, compressed)):
+                return self.path(digest, compressed)
+        return None
+
+    def put(self, content):
+        """Stores content and returns its hash"""
+        data = normalize_ddl(content).encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        if self.find(digest) is not None:
+            self.reused += 1
+            return digest
+        if self.compress:
+            data = zstd().ZstdCompressor(level=self.level).compress(data)
+        blob_file = self.path(digest, self.compress)
+        os.makedirs(os.path.dirname(blob_file), 0o770, exist_ok=True)
+        tmp_file = f"{blob_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file, 'wb') as fobj:
+            fobj.write(data)
+        os.replace(tmp_file, blob_file)
+        self.written += 1
+        return digest
+
+    def get(self, digest):
+        blob_file = self.find(digest)
+        if blob_file is None:
+            raise ValueError(f"Blob {digest} not found in {self.store_dir}")
+        with open(blob_file, 'rb') as fobj:
+            data = fobj.read()
+        if blob_file.endswith('.zst'):
+            data = zstd().ZstdDecompressor().decompress(data)
+        return data.decode('utf-8')
@@ -0,0 +1,136 @@
+import hashlib
+import os
+import pickle
+
+# Bump when the compiled classes or validate_config change so old cache files are ignored
+model_version = 2
+
+cache_dir = os.path.join(os.path.expanduser("~"), '.snowflake', 'cache')
+
+# Object types in sc-config.json ROLE_PERMISSIONS and the object they are created as
+sc_map = {
+    "TABLES": "TABLE",
+    "EXTERNAL TABLES": "TABLE",
+    "VIEWS": "VIEW",
+    "MATERIALIZED VIEWS": "VIEW",
+    "FILE FORMATS": "FILE FORMAT",
+    "STAGES": "STAGE",
+    "STREAMS": "STREAM",
+    "SEQUENCES": "SEQUENCE",
+    "FUNCTIONS": "FUNCTION",
+    "PROCEDURES": "PROCEDURE",
+    "TASKS": "TASK"
+}
+
+class SfObjectModel():
+    """Validated DATABASE/SCHEMA/WAREHOUSE configuration with the permission
+       expansion for each level of the ROLE_HIERARCHY precomputed."""
+    __slots__ = ('type', 'role_owner', 'role_hierarchy', 'ar_prefix', 'default_params', 'expansions', 'creates')
+
+    def __init__(self, config, default_params_key):
+        self.type           = config['TYPE']
+        self.role_owner     = config['ROLE_OWNER']
+        self.role_hierarchy = tuple(config['ROLE_HIERARCHY'])
+        self.ar_prefix      = config['AR_PREFIX']
+        self.default_params = dict(config.get(default_params_key, {}))
+        # level -> ((privilege, object), ...)
+        self.expansions     = {}
+        # level -> (object, ...) CREATE privileges on the schema granted by
+        # SfProvisionConfig.create_sc_grants(). Each CREATE goes to the lowest
+        # level granted ALL on the objects, higher levels inherit it
+        self.creates        = {}
+        seen = {}
+        for level in self.role_hierarchy[::-1]:
+            pairs = []
+            creates = []
+            for privilege, objects in config['ROLE_PERMISSIONS'][level].items():
+                for obj in objects:
+                    pairs.append((privilege, obj))
+                    if self.type == 'SCHEMA' and privilege == 'ALL' and sc_map[obj] not in seen:
+                        creates.append(sc_map[obj])
+                        seen[sc_map[obj]] = 1
+            self.expansions[level] = tuple(pairs)
+            self.creates[level] = tuple(creates)
+
+    def ar_role(self, level, *names):
+        """Access role name for the level of the object(s), e.g. ar_role('RO', 'DB', 'SC')"""
+        return f"{self.ar_prefix}{'_'.join(names)}_{level}_AR"
+
+    def ar_roles(self, *names):
+        return [self.ar_role(level, *names) for level in self.role_hierarchy]
+
+class SfFuncRoleModel():
+    """Validated functional role from fr-config.json."""
+    __slots__ = ('name', 'order', 'include', 'exclude', 'custom_include', 'custom_exclude', 'scim_roles')
+
+    def __init__(self, name, config):
+        self.name           = name
+        self.order          = config['ORDER']
+        self.include        = tuple(dict(entry) for entry in config['INCLUDE'])
+        self.exclude        = tuple(dict(entry) for entry in config['EXCLUDE'])
+        self.custom_include = tuple(config['CUSTOM_INCLUDE'])
+        self.custom_exclude = tuple(config['CUSTOM_EXCLUDE'])
+        self.scim_roles     = tuple(config['SCIM_ROLES'])
+
+class SfCompiledConfig():
+    """The four provisioning configuration files compiled after validation.
+       Only SfProvisionConfig.validate_config() builds one, so a compiled
+       configuration loaded from the cache is one that passed validation when
+       it was compiled and is not validated again. Keeps the layered SfConfig
+       objects so SfProvisionConfig can be restored from the cache without
+       reading the json again."""
+    __slots__ = ('key', 'db_cfg', 'sc_cfg', 'wh_cfg', 'fr_cfg', 'db', 'sc', 'wh', 'fr')
+
+    def __init__(self, key, db_cfg, sc_cfg, wh_cfg, fr_cfg):
+        self.key    = key
+        self.db_cfg = db_cfg
+        self.sc_cfg = sc_cfg
+        self.wh_cfg = wh_cfg
+        self.fr_cfg = fr_cfg
+        self.db     = SfObjectModel(db_cfg.config, 'DEFAULT_DB_PARAMS')
+        self.sc     = SfObjectModel(sc_cfg.config, 'DEFAULT_SC_PARAMS')
+        self.wh     = SfObjectModel(wh_cfg.config, 'DEFAULT_WH_PARAMS')
+        self.fr     = {}
+        for frole in fr_cfg.config:
+            self.fr[frole] = SfFuncRoleModel(frole, fr_cfg.config[frole])
+
+def config_key(filenames):
+    """Hash of the model_version and of the path and content of every file
+       SfConfig would layer for the filenames (~/.snowflake/<file> and
+       ./<file>). Any edit to one of them, or to the compiled classes, yields a
+       new key so a stale compiled configuration is never loaded."""
+    sha = hashlib.sha256(f"model_version={model_version}".encode('utf-8'))
+    home_dir = os.path.join(os.path.expanduser("~"), '.snowflake')
+    for filename in filenames:
+        for path in [os.path.join(home_dir, filename), os.path.join(os.getcwd(), filename)]:
+            sha.update(path.encode('utf-8'))
+            try:
+                with open(path, 'rb') as fobj:
+                    sha.update(hashlib.sha256(fobj.read()).digest())
+            except OSError:
+                sha.update(b'-')
+    return sha.hexdigest()
+
+def cache_file(key):
+    return os.path.join(cache_dir, f"provision-{key}.pickle")
+
+def load_compiled_config(key):
+    try:
+        with open(cache_file(key), 'rb') as fobj:
+            compiled = pickle.load(fobj)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None
+    if not isinstance(compiled, SfCompiledConfig) or compiled.key != key:
+        return None
+    return compiled
+
+def save_compiled_config(compiled):
+    # The cache is an optimization only - never fail provisioning over it
+    try:
+        os.makedirs(cache_dir, 0o700, exist_ok=True)
+        tmp_file = cache_file(compiled.key) + f".{os.getpid()}"
+        with open(tmp_file, 'wb') as fobj:
+            pickle.dump(compiled, fobj, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file(compiled.key))
+    except OSError:
+        pass
@@ -1,10 +1,14 @@
 import json
 import os
-from yaml import load, dump
-try:
-    from yaml import CLoader as Loader, CDumper as Dumper
-except ImportError:
-    from yaml import load, dump
+
+def yaml_load(stream):
+    # yaml is only needed by sf_tieout so it is imported on first use
+    from yaml import load
+    try:
+        from yaml import CLoader as Loader
+    except ImportError:
+        from yaml import Loader
+    return load(stream, Loader)
 
 def file_exists(file_path):
     return os.path.exists(file_path)
@@ -37,5 +41,33 @@ class SfConfig():
             self.config = config
         if type == 'yaml':
             stream = open(filename, 'r')
-            yaml_config = load(stream, Loader)
-            self.config = yaml_config
\ No newline at end of file
+            yaml_config = yaml_load(stream)
+            self.config = yaml_config
+
+    def profile_config(self, name=None):
+        """Connection configuration of a profile in "profiles" - the keys of the
+           profile override the top level keys. Without a name the top level
+           configuration is returned."""
+        if name is None:
+            return self.config
+        profiles = self.config.get('profiles', {})
+        if name not in profiles:
+            raise ValueError(f"Profile {name} not in config.json - expected one of {', '.join(profiles)}")
+        # A service holds the sessions of one account
+        config = { key: value for key, value in self.config.items() if key not in [ 'profiles', 'service_socket' ] }
+        config.update(profiles[name])
+        return config
+
+    def profile_names(self, names):
+        """Expands ALL to every profile and validates the names"""
+        if names is None:
+            return []
+        profiles = self.config.get('profiles', {})
+        if len(profiles) == 0:
+            raise ValueError("No profiles in config.json")
+        if 'ALL' in names:
+            return list(profiles)
+        for name in names:
+            if name not in profiles:
+                raise ValueError(f"Profile {name} not in config.json - expected one of {', '.join(profiles)}")
+        return names
@@ -1,15 +1,71 @@
-import snowflake.connector as sf
-from snowflake.connector.errors import DatabaseError
-from snowflake.connector.errors import ProgrammingError
+import json
 import os
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives.asymmetric import rsa
-from cryptography.hazmat.primitives.asymmetric import dsa
-from cryptography.hazmat.primitives import serialization
+import time
+from functools import lru_cache
+from sfbackend import backends, programming_error, SfRecordingConn, SfReplayConn, SfSimConn
+from sftrace import SfTracer, SfTracedConn, sql_string
+
+@lru_cache(maxsize=None)
+def load_private_key(filename):
+    """Decodes the PEM private key and returns it DER encoded. The key is only
+       read and decoded once per process no matter how many sessions are opened."""
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives import serialization
+
+    with open(filename, "rb") as key:
+        p_key= serialization.load_pem_private_key(
+            key.read(),
+            password=None,
+            backend=default_backend()
+        )
+
+    return p_key.private_bytes(
+        encoding=serialization.Encoding.DER,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption())
+
+cache_dir = os.path.join(os.path.expanduser("~"), '.snowflake', 'cache')
+
+# Filters the output of show schemas in account on the same cursor
+show_schemas_scan_sql = """select "database_name", "name" from table(result_scan(last_query_id()))
+where "name" <> 'INFORMATION_SCHEMA' and "database_name" <> 'SNOWFLAKE'
+order by "database_name", "name" desc"""
+
+def schema_cache_file(account, role):
+    # The schemas listed depend on what the role can see
+    return os.path.join(cache_dir, f"schemas-{account}-{role}.json")
+
+def load_schema_cache(filename, max_age):
+    """Returns the cached [database, schema] list or None when it is missing or older than max_age seconds"""
+    try:
+        with open(filename, 'r') as fobj:
+            cache = json.load(fobj)
+    except (OSError, ValueError):
+        return None
+    if time.time() - cache.get('listed_at', 0) > max_age:
+        return None
+    return cache['schemas']
+
+def save_schema_cache(filename, db_sc):
+    # The cache is an optimization only - never fail over it
+    try:
+        os.makedirs(os.path.dirname(filename), 0o700, exist_ok=True)
+        tmp_file = filename + f".{os.getpid()}"
+        with open(tmp_file, 'w') as fobj:
+            json.dump({ 'listed_at': time.time(), 'schemas': db_sc }, fobj)
+        os.replace(tmp_file, filename)
+    except OSError:
+        pass
+
+class SfConnError(Exception):
+    """A database or schema could not be used, because it does not exist or
+       the role has no access to it. Wraps the ProgrammingError of the
+       connector; the sf_* scripts exit on it, sf_service fails the job and a
+       schema export that raises it is not retried."""
 
 class SfConn():
 
-    def __init__(self, config, logger):
+    def __init__(self, config, logger, verify=True, keep_alive=False):
         
         self.user      = config['user']
         self.account   = config['account']
@@ -19,28 +75,64 @@ class SfConn():
         self.schema    = config['schema']
         self.home      = os.environ['HOME']
         self.logger    = logger
+        self.keep_alive = keep_alive
+        # list_db_sc is served from the disk cache for this long (0 disables it)
+        self.schema_cache_seconds = config.get('schema_cache_seconds', 900)
+        # snowflake (default), record, replay or sim - see sfbackend.py
+        self.backend   = config.get('backend', 'snowflake')
 
-        with open(os.path.join(self.home, '.snowflake', 'rsa_key.p8'), "rb") as key:
-            p_key= serialization.load_pem_private_key(
-                key.read(),
-                password=None,
-                backend=default_backend()
-            )
+        # Connector session, None when served by the replay or sim backend
+        self.raw_conn  = None
+
+        if self.backend not in backends:
+            raise ValueError(f"Unknown backend {self.backend} - expected one of {', '.join(backends)}")
+        if self.backend == 'replay':
+            # Served from a recording, no private key or connection needed
+            self.logger.debug(f"Replaying Snowflake session from {config['recording']}")
+            self.conn = SfReplayConn(config['recording'], config.get('latency_ms'))
+        elif self.backend == 'sim':
+            # Synthetic account metadata of the size given in "sim"
+            self.logger.debug(f"Simulating Snowflake account {config.get('sim', {})}")
+            self.conn = SfSimConn(config.get('sim', {}), config.get('latency_ms'), config.get('stats'))
+        else:
+            self.raw_conn = self.connect()
+            self.conn = self.raw_conn
+            if self.backend == 'record':
+                self.logger.debug(f"Recording Snowflake session to {config['recording']}")
+                self.conn = SfRecordingConn(self.conn, config['recording'])
+        # Every statement is traced when "trace" names a JSON lines file
+        self.tracer    = None
+        query_tag      = config.get('query_tag')
+        if config.get('trace') is not None:
+            self.tracer = SfTracer(config['trace'], self.logger, query_tag, config.get('trace_top', 10))
+            self.conn   = SfTracedConn(self.conn, self.tracer)
+            query_tag   = self.tracer.query_tag
+        session = "ALTER SESSION SET QUOTED_IDENTIFIERS_IGNORE_CASE = TRUE"
+        if query_tag is not None:
+            # Lets the statements be joined with query_history
+            session += f" QUERY_TAG = {sql_string(query_tag)}"
+        self.session_sql = session
+        cursor = self.run_query(session)
+        self.logger.debug('Connected to Snowflake')
+        if verify:
+            self.verify_conn()
+        
+    def connect(self):
+        # The connector and cryptography are only imported when connecting to Snowflake
+        import snowflake.connector as sf
 
-        pkb = p_key.private_bytes(
-            encoding=serialization.Encoding.DER,
-            format=serialization.PrivateFormat.PKCS8,
-            encryption_algorithm=serialization.NoEncryption())
+        pkb = load_private_key(os.path.join(self.home, '.snowflake', 'rsa_key.p8'))
         self.logger.debug('Connecting to Snowflake..')
         try:
-            self.conn = sf.connect(
+            conn = sf.connect(
                 user=self.user,
                 account=self.account,
                 private_key=pkb,
                 role=self.role,
                 warehouse=self.warehouse,
                 database=self.database,
-                schema=self.schema
+                schema=self.schema,
+                client_session_keep_alive=self.keep_alive
             )
 
         except sf.errors.ProgrammingError as e:
@@ -52,10 +144,8 @@ class SfConn():
             # sys.exit(2)
             self.logger.error(f"Error Connecting: {e}")
             raise Exception(f"Error connecting: {e}")
-        cursor = self.run_query("ALTER SESSION SET QUOTED_IDENTIFIERS_IGNORE_CASE = TRUE")
-        self.logger.debug('Connected to Snowflake')
-        self.verify_conn()
-        
+        return conn
+
     def verify_conn(self):
         curs = self.conn.cursor()
         self.logger.debug("Verifying connection ...")
@@ -70,6 +160,34 @@ class SfConn():
         finally:
             curs.close()
         
+    def reconnect(self):
+        """Replaces a lost session (network failure, expired session) with a new one"""
+        if self.raw_conn is None:
+            return
+        lost = self.raw_conn
+        try:
+            lost.close()
+        except Exception as e:
+            self.logger.debug(f"Error closing lost session: {e}")
+        self.raw_conn = self.connect()
+        # The recording and tracing wrappers keep working on the new session
+        if self.conn is lost:
+            self.conn = self.raw_conn
+        else:
+            wrapper = self.conn
+            while wrapper.conn is not lost:
+                wrapper = wrapper.conn
+            wrapper.conn = self.raw_conn
+        if self.tracer is not None and self.tracer.conn is lost:
+            self.tracer.conn = self.raw_conn
+        self.run_query(self.session_sql)
+
+    def reset_session(self):
+        # A reused session may have been left on another role, database or schema
+        self.run_query(f"USE ROLE {self.role}")
+        self.run_query(f"USE DATABASE {self.database}")
+        self.run_query(f"USE SCHEMA {self.schema}")
+
     def close_conn(self):
         self.logger.debug("Disconnecting from Snowflake..")
         self.conn.close()
@@ -90,7 +208,7 @@ class SfConn():
             curs = self.conn.cursor()
         try:
             curs.execute(query)
-        except sf.errors.ProgrammingError as e:
+        except programming_error() as e:
             #err_msg = f"DB Error when running query: '{query}': {e}"
             #print(err_msg)
             raise e
@@ -106,7 +224,21 @@ class SfConn():
             curs = self.run_query(self.conn, query, cursor)
         return curs
         
-    def list_db_sc(self):
+    def list_db_sc(self, refresh=False):
+        """Returns [database, schema] of every schema the role can see. The list is
+           cached on disk for schema_cache_seconds, refresh=True lists the account again."""
+        cache_file = schema_cache_file(self.account, self.role)
+        if refresh is False:
+            db_sc = load_schema_cache(cache_file, self.schema_cache_seconds)
+            if db_sc is not None:
+                self.logger.debug(f"Using {len(db_sc)} database.schema cached in {cache_file}")
+                return db_sc
+        db_sc = self.query_db_sc()
+        if len(db_sc) > 0:
+            save_schema_cache(cache_file, db_sc)
+        return db_sc
+
+    def query_db_sc(self):
             done = 0
             db_sc = []
             query = """select catalog_name as database_name, schema_name from snowflake.account_usage.schemata
@@ -119,10 +251,23 @@ order by catalog_name, schema_name desc
                 for row in cursor:
                     db_sc.append([ row[0], row[1] ])
                 done = 1
-            except ProgrammingError as e:
+            except programming_error() as e:
                 self.logger.debug(f"Current role may not have access to snowflake.account_usage schema: {e}")
                 pass
-            # If current role does not have access to query snowflake.account_usage?
+            # If current role does not have access to query snowflake.account_usage
+            # every schema is listed in one statement and filtered with result_scan
+            if done == 0:
+                self.logger.debug("Attemping to fetch database.schema through show schemas in account")
+                try:
+                    cursor = self.run_query("show schemas in account")
+                    cursor.execute(show_schemas_scan_sql)
+                    for row in cursor.fetchall():
+                        db_sc.append([ row[0], row[1] ])
+                    done = 1
+                except programming_error() as e:
+                    self.logger.debug(f"Current role does not have access to run show schemas in account: {e}")
+                    pass
+            # Last resort: show databases + show schemas in db
             if done == 0:
                 self.logger.debug("Attemping to fetch database.schema through show database + show schemas in db")
                 databases = []
@@ -130,7 +275,7 @@ order by catalog_name, schema_name desc
                     cursor = self.run_query("show databases")
                     for row in cursor:
                         databases.append(row[1])
-                except ProgrammingError as e:
+                except programming_error() as e:
                     self.logger.debug(f"Current role does not have access to run show database: {e}")
                 for db in databases:
                     if db == 'SNOWFLAKE':
@@ -141,7 +286,7 @@ order by catalog_name, schema_name desc
                             if row[1] == 'INFORMATION_SCHEMA':
                                 continue
                             db_sc.append([ db, row[1] ])
-                    except ProgrammingError as e:
+                    except programming_error() as e:
                         self.logger.debug(f"Current role does not have access to run `show schemas in {db}`: {e}")
                         pass
                 done = 1
@@ -154,10 +299,8 @@ order by catalog_name, schema_name desc
                 new_cursor.execute(f"use database {db_nm}")
                 if sc_nm != '':
                     new_cursor.execute(f"use schema {sc_nm}")
-        except ProgrammingError as e:
-            # Need to re-raise?
-            self.logger.error(f"Fatal Error: Could not use database {db_nm} and schema {sc_nm}: {e}")
-            exit(-1)
+        except programming_error() as e:
+            raise SfConnError(f"Could not use database {db_nm} and schema {sc_nm}: {e}") from e
         return new_cursor
 
     def validate_role(self, role, db_nm, sc_nm): 
@@ -165,9 +308,8 @@ order by catalog_name, schema_name desc
         try:
             self.run_query(f"USE ROLE {role}")
             curs = self.cursor(db_nm, sc_nm)
-        except: 
-            self.logger.error(f"Error: role {role} does not have access to {db_nm}.{sc_nm}")
-            exit(-1)
+        except (programming_error(), SfConnError) as e:
+            raise SfConnError(f"Role {role} does not have access to {db_nm}.{sc_nm}: {e}") from e
         return True
     
     def get_tables(self, clone_role, db_nm, sc_nm):
@@ -195,9 +337,8 @@ select tsm.id,tsm.clone_group_id,t.table_catalog, t.table_schema, t.table_name,
             for row in curs:
                 list_of_tables.append(row)
 
-        except ProgrammingError as e:
-            self.logger.error(f"Fatal Error: Could not use database {db_nm} and schema {sc_nm}: {e}")
-            exit(-1)
+        except programming_error() as e:
+            raise SfConnError(f"Could not list the tables of database {db_nm} and schema {sc_nm}: {e}") from e
         return list_of_tables
 
     def get_clone_tables(self, clone_role, from_db_nm, from_sc_nm, to_db_nm, to_sc_nm):
@@ -280,9 +421,8 @@ order by tsm1.table_name asc
                          """)
             for row in curs:
                 list_of_clones.append(row)
-        except ProgrammingError as e:
-            self.logger.error(f"Fatal Error: Could not use database {from_db_nm} and schema {from_sc_nm}: {e}")
-            exit(-1)
+        except programming_error() as e:
+            raise SfConnError(f"Could not list the clones of database {from_db_nm} and schema {from_sc_nm}: {e}") from e
         return list_of_clones
 
     def get_ddl(self, db_nm, sc_nm, type, name):
@@ -403,7 +543,8 @@ order by tsm1.table_name asc
                 ) 
             else:
                 curs.execute(f"show {type}S in schema {db_nm}.{sc_nm}")
-                curs.execute('select "name", "created_on" from table(result_scan(last_query_id()))')
+                # By query id, last_query_id() is whatever ran last on the session from any thread
+                curs.execute(f'select "name", "created_on" from table(result_scan(\'{curs.sfqid}\'))')
             for row in curs:
                 name             = row[0]
                 last_modified_dt = row[1] # created_on from `show <type>S in <sc>`
@@ -417,7 +558,7 @@ order by tsm1.table_name asc
                     else:
                         arguments = '()'
                 objs.append((name, last_modified_dt, arguments))
-        except ProgrammingError as e:
+        except programming_error() as e:
             self.logger.error(f"Error getting objects: {e}")
             return None
         return objs
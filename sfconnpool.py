@@ -0,0 +1,116 @@
+import threading
+import time
+from contextlib import contextmanager
+from sfconn import SfConn
+
+class SfConnPool():
+    """SfConnPool hands out up to max_size SfConn sessions sharing one
+       configuration. Sessions are opened lazily on first demand and reused
+       afterwards. The private key is decoded once per process (see
+       load_private_key) and the session parameters are applied once when a
+       session is opened. A session idle for longer than health_check_seconds
+       is verified before it is handed out again and replaced when the check
+       fails. Sessions are opened with client_session_keep_alive so idle
+       sessions do not expire.
+
+           with SfConnPool(config, logger, max_size=4) as pool:
+               with pool.session() as sf_conn:
+                   sf_conn.run_query(...)
+    """
+
+    def __init__(self, config, logger, max_size=4, health_check_seconds=60):
+        self.config      = config
+        self.logger      = logger
+        self.max_size    = max(1, max_size)
+        self.health_check_seconds = health_check_seconds
+        self.cond        = threading.Condition()
+        # (SfConn, time it was released) of the sessions not in use
+        self.idle        = []
+        self.size        = 0
+        self.opened      = 0
+        self.closed      = False
+
+    def open_session(self):
+        self.logger.debug(f"Opening session {self.size} of at most {self.max_size}")
+        # Verified by the login itself, the health check covers idle sessions
+        return SfConn(self.config, self.logger, verify=False, keep_alive=True)
+
+    def acquire(self):
+        with self.cond:
+            while True:
+                if self.closed:
+                    raise ValueError("Session requested from a closed SfConnPool")
+                if len(self.idle) > 0:
+                    sf_conn, released = self.idle.pop()
+                    break
+                if self.size < self.max_size:
+                    # Reserve the slot and open the session outside of the lock
+                    self.size += 1
+                    sf_conn = None
+                    break
+                self.cond.wait()
+        if sf_conn is None:
+            try:
+                sf_conn = self.open_session()
+            except Exception:
+                with self.cond:
+                    self.size -= 1
+                    self.cond.notify()
+                raise
+            self.opened += 1
+            return sf_conn
+        if time.monotonic() - released > self.health_check_seconds and sf_conn.verify_conn() is False:
+            self.logger.warning("Replacing idle session that failed its health check")
+            self.discard(sf_conn)
+            return self.acquire()
+        return sf_conn
+
+    def release(self, sf_conn):
+        with self.cond:
+            if self.closed:
+                self.size -= 1
+                sf_conn.close_conn()
+                return
+            self.idle.append((sf_conn, time.monotonic()))
+            self.cond.notify()
+
+    def discard(self, sf_conn):
+        """Closes a broken session and frees its slot"""
+        try:
+            sf_conn.close_conn()
+        except Exception as e:
+            self.logger.debug(f"Error closing discarded session: {e}")
+        with self.cond:
+            self.size -= 1
+            self.cond.notify()
+
+    @contextmanager
+    def session(self):
+        sf_conn = self.acquire()
+        try:
+            yield sf_conn
+        except BaseException:
+            # The session may be unusable after an error or an exit - check it
+            # before reuse, the slot is freed either way
+            if sf_conn.verify_conn() is False:
+                self.discard(sf_conn)
+            else:
+                self.release(sf_conn)
+            raise
+        self.release(sf_conn)
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            idle = self.idle
+            self.idle = []
+            self.size -= len(idle)
+            self.cond.notify_all()
+        for sf_conn, released in idle:
+            sf_conn.close_conn()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
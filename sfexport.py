@@ -0,0 +1,562 @@
+import json
+import os
+import queue
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from sfarchive import SfArchive, archive_name, list_archives
+from sfbackend import programming_error
+from sfblobstore import SfBlobStore
+from sfconn import SfConnError
+from sfgrantindex import like_to_regex
+
+# Object types exported and the extension of the file they are written to
+objects = {
+    'TABLE':          '.tbl',
+    'EXTERNAL TABLE': '.tbl',
+    'DYNAMIC TABLE':  '.tbl',
+    'VIEW':           '.vw',
+    'PROCEDURE':      '.pr',
+    'TASK':           '.tsk',
+    'STREAM':         '.stm',
+    'FILE_FORMAT':    '.ff',
+    'PIPE':           '.pipe',
+    'FUNCTION':       '.func',
+    'SEQUENCE':       '.seq'
+}
+
+def has_pattern(db_sc):
+    return any('%' in db or '%' in sc for db, sc in db_sc)
+
+def expand_db_sc(db_sc, listing, logger):
+    """Replaces the [database, schema] LIKE patterns with % wildcards by the
+       schemas in listing (see SfConn.list_db_sc) that match them"""
+    expanded = []
+    for db, sc in db_sc:
+        if '%' not in db and '%' not in sc:
+            expanded.append([ db, sc ])
+            continue
+        db_regex, sc_regex = like_to_regex(db), like_to_regex(sc)
+        matches = [ [ list_db, list_sc ] for list_db, list_sc in listing if db_regex.match(list_db) and sc_regex.match(list_sc) ]
+        if len(matches) == 0:
+            logger.warning(f"No schemas match {db}.{sc}")
+        logger.debug(f"{db}.{sc} matches {len(matches)} schemas")
+        expanded.extend([ match for match in matches if match not in expanded ])
+    return expanded
+
+class SfExportStage():
+    """Items handled by a stage of the export pipeline and the time it was busy"""
+
+    def __init__(self, name):
+        self.name  = name
+        self.items = 0
+        self.busy  = 0.0
+        self.lock  = threading.Lock()
+
+    def add(self, items, seconds):
+        with self.lock:
+            self.items += items
+            self.busy  += seconds
+
+    def report(self, logger):
+        rate = self.items / self.busy if self.busy > 0 else 0
+        logger.info("%s: %d objects in %.3fs (%.1f/s)", self.name, self.items, self.busy, rate,
+                    stage=self.name, objects=self.items, duration_ms=round(self.busy * 1000, 1))
+
+def write_file(file_nm, content, mode='w'):
+    fobj = open(file_nm, mode)
+    fobj.write(content)
+    fobj.write('\n')
+    fobj.close()
+
+class SfExport():
+    """SfExport writes the DDL of every object in a schema to
+       <export_dir>/<database>.<schema>/<object><extension>. An object is only
+       extracted again when it was altered after its file was last written.
+       All paths are absolute so exports can run side by side in one process
+       (see sfservice.py).
+
+       With a journal every finished schema is recorded with its object count
+       and catalog version (the last time an object in it was altered), so an
+       export of thousands of schemas that was interrupted can be resumed
+       without listing them again. A schema that fails on an error that is not
+       a missing schema or privilege (network, expired session) is retried
+       with exponential backoff on a new session before it is given up on.
+
+       A schema is exported by a pipeline: the calling thread lists the
+       objects on sf_conn and queues the files that changed, fetchers (one per
+       session in fetch_conns) get their DDL and a writer thread writes what
+       was fetched in batches, so listing, round trips to Snowflake and disk
+       writes overlap. The queues are bounded by queue_size. A session is
+       never used by two stages at once: listing reads the output of show
+       statements with result_scan and every statement changes the current
+       schema of the session. Without fetch_conns the DDL is fetched on
+       sf_conn after each object type is listed."""
+
+    # Objects are written to a directory per schema
+    schema_dirs = True
+
+    def __init__(self, sf_conn, logger, export_dir, delete=False, journal=None, retries=3, backoff_seconds=2,
+                 fetch_conns=None, queue_size=256, batch_size=64):
+        self.sf_conn    = sf_conn
+        self.logger     = logger
+        self.export_dir = os.path.abspath(export_dir)
+        self.delete     = delete
+        self.journal    = journal
+        self.retries    = retries
+        self.backoff_seconds = backoff_seconds
+        # Sessions fetching DDL, sf_conn only lists the objects
+        self.fetch_conns = fetch_conns or []
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.stages     = { stage: SfExportStage(stage) for stage in [ 'list', 'fetch', 'write' ] }
+        # "db.sc" -> journal entry of schemas finished by an earlier run
+        self.done       = {}
+        self.partial_line = False
+
+    def load_journal(self):
+        if self.journal is None or not os.path.exists(self.journal):
+            return
+        with open(self.journal, 'r') as fobj:
+            lines = fobj.readlines()
+        # Entries of this run go on a line of their own after a partially written one
+        self.partial_line = len(lines) > 0 and not lines[-1].endswith('\n')
+        for line in lines:
+            line = line.strip()
+            if line == '':
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # A partially written last line from a killed run
+                self.logger.warning(f"Ignoring unreadable journal entry in {self.journal}: {line}")
+                continue
+            if entry.get('status') == 'done':
+                self.done[entry['schema']] = entry
+            else:
+                self.done.pop(entry['schema'], None)
+        self.logger.info(f"Loaded {len(self.done)} exported schemas from journal {self.journal}")
+
+    def write_journal(self, fobj, schema, result):
+        if fobj is None:
+            return
+        entry = dict(schema=schema, **result)
+        entry['finished_at'] = datetime.now(timezone.utc).isoformat()
+        fobj.write(json.dumps(entry) + '\n')
+        fobj.flush()
+
+    def populate_file_stats(self, db_sc_dir):
+        # Last modified time for easy use to see if file is older than object in database
+        # Seen to easily check if there are files that need to be removed
+        file_stats = {}
+        for file in Path(db_sc_dir).glob('*.*'):
+            if file.is_file():
+                file_name = str(os.path.relpath(file, db_sc_dir))
+                file_last_modified = datetime.fromtimestamp(file.stat().st_mtime, tz=timezone.utc)
+                file_stats[file_name] = { "seen": 0, "file_last_modified": file_last_modified }
+        return file_stats
+
+    def write_object(self, db_sc_dir, file_nm, contents):
+        # Overloaded procedures and functions share a file
+        write_file(os.path.join(db_sc_dir, file_nm), '\n'.join(contents))
+
+    def write_objects(self, db_sc_dir, files):
+        """Writes a batch of [ (file_nm, [ ddl, ... ]) ]"""
+        for file_nm, contents in files:
+            self.write_object(db_sc_dir, file_nm, contents)
+
+    def delete_object(self, db_sc_dir, file_nm):
+        os.remove(os.path.join(db_sc_dir, file_nm))
+
+    def save_file_stats(self, db_sc_dir):
+        # The files are the state of the classic layout
+        pass
+
+    def changed_files(self, schema, file_stats, obj_type, schema_objects):
+        """Groups the objects of a type by the file they are written to and
+           returns the [ (file_nm, objects) ] altered since the file was written.
+           All overloads of a procedure or function are fetched again when one
+           of them was altered."""
+        files = {}
+        for schema_obj in schema_objects:
+            files.setdefault(f"{schema_obj[0]}{objects[obj_type]}", []).append(schema_obj)
+        changed = []
+        for file_nm, file_objects in files.items():
+            obj_last_modified = max(schema_obj[1] for schema_obj in file_objects)
+            if file_nm in file_stats:
+                file_last_modified = file_stats[file_nm]['file_last_modified']
+                file_stats[file_nm]['seen'] = 1
+                if file_last_modified >= obj_last_modified:
+                    self.logger.info("No change - %s %s modified %s =< file modified %s", obj_type, file_objects[0][0], obj_last_modified,
+                                     file_last_modified, schema=schema, object=file_nm)
+                    continue
+                self.logger.warning("Changed: %s %s modified %s > file modified %s", obj_type, file_objects[0][0], obj_last_modified,
+                                    file_last_modified, schema=schema, object=file_nm)
+            if len(file_objects) > 1:
+                self.logger.info("%d %ss %s written to %s", len(file_objects), obj_type, file_objects[0][0], file_nm, schema=schema, object=file_nm)
+            changed.append((file_nm, file_objects))
+        return changed
+
+    def fetch_ddl(self, sf_conn, db_nm, sc_nm, obj_type, obj_name, obj_last_modified, arguments=None):
+        content = ''
+        try:
+            if arguments is not None:
+                sproc = re.sub(' RETURN .*','', arguments)
+                self.logger.info("Extracting %s:%s%s", obj_type, obj_name, sproc, schema=f"{db_nm}.{sc_nm}", object=obj_name)
+                content = sf_conn.get_ddl(db_nm, sc_nm, obj_type, f"{obj_name}{sproc}")
+            else:
+                content = sf_conn.get_ddl(db_nm, sc_nm, obj_type, obj_name)
+        except programming_error() as e:
+            self.logger.warning("Failure to get_ddl for %s %s", obj_type, obj_name, schema=f"{db_nm}.{sc_nm}", object=obj_name)
+        return '' if content is None else content
+
+    def fetch_file(self, sf_conn, db_nm, sc_nm, job, write_queue, errors):
+        """Gets the DDL of the objects of a file on sf_conn and queues it for the writer"""
+        obj_type, file_nm, file_objects = job
+        start = time.perf_counter()
+        try:
+            contents = [ self.fetch_ddl(sf_conn, db_nm, sc_nm, obj_type, *schema_obj[:3]) for schema_obj in file_objects ]
+        except Exception as e:
+            # Raised by export_schema, export_schema_retry decides whether to retry
+            errors.append(e)
+            return
+        self.stages['fetch'].add(len(contents), time.perf_counter() - start)
+        write_queue.put((obj_type, file_nm, contents))
+
+    def fetch_files(self, sf_conn, db_nm, sc_nm, fetch_queue, write_queue, errors):
+        """Fetcher stage: gets the DDL of the queued files on sf_conn"""
+        while True:
+            job = fetch_queue.get()
+            if job is None:
+                return
+            if len(errors) > 0:
+                # Drained without work after another stage failed
+                continue
+            self.fetch_file(sf_conn, db_nm, sc_nm, job, write_queue, errors)
+
+    def write_files(self, db_sc_dir, write_queue, errors):
+        """Writer stage: writes everything fetched so far, up to batch_size files, at once"""
+        done = False
+        while not done:
+            batch = [ write_queue.get() ]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(write_queue.get_nowait())
+                except queue.Empty:
+                    break
+            done = None in batch
+            batch = [ job for job in batch if job is not None ]
+            if len(errors) > 0 or len(batch) == 0:
+                continue
+            start = time.perf_counter()
+            try:
+                if self.logger.is_enabled('INFO'):
+                    schema = os.path.basename(db_sc_dir)
+                    for obj_type, file_nm, contents in batch:
+                        self.logger.info("Writing %s:%s to %s", obj_type, file_nm[:file_nm.rindex('.')], file_nm, schema=schema, object=file_nm)
+                self.write_objects(db_sc_dir, [ (file_nm, contents) for obj_type, file_nm, contents in batch ])
+            except Exception as e:
+                errors.append(e)
+                continue
+            self.stages['write'].add(sum(len(contents) for obj_type, file_nm, contents in batch), time.perf_counter() - start)
+
+    def export_schema(self, db_nm, sc_nm):
+        """Exports all objects in db_nm.sc_nm and returns counts of what was done"""
+        db_sc_dir = os.path.join(self.export_dir, f"{db_nm}.{sc_nm}")
+        self.logger.info(f"Extracting {db_nm}.{sc_nm}")
+        if self.schema_dirs:
+            self.logger.debug(f"Creating directory {db_sc_dir}")
+            # will this work with uppercase/mixed case
+            os.makedirs(db_sc_dir, 0o770, exist_ok=True)
+        stats = { 'status': 'done', 'objects': 0, 'written': 0, 'deleted': 0, 'catalog_version': None }
+        catalog_version = None
+        curs = self.sf_conn.cursor(db_nm, sc_nm)
+        file_stats = self.populate_file_stats(db_sc_dir)
+        errors = []
+        fetch_queue = queue.Queue(maxsize=self.queue_size)
+        write_queue = queue.Queue(maxsize=self.queue_size)
+        fetchers = [ threading.Thread(target=self.fetch_files, args=(sf_conn, db_nm, sc_nm, fetch_queue, write_queue, errors))
+                     for sf_conn in self.fetch_conns ]
+        writer = threading.Thread(target=self.write_files, args=(db_sc_dir, write_queue, errors))
+        for thread in fetchers + [ writer ]:
+            thread.start()
+        try:
+            # Lister stage
+            for obj_type in objects.keys():
+                if len(errors) > 0:
+                    break
+                self.logger.debug("Extracting %ss in %s.%s", obj_type, db_nm, sc_nm, schema=f"{db_nm}.{sc_nm}")
+                start = time.perf_counter()
+                schema_objects = []
+                try:
+                    schema_objects = self.sf_conn.get_objs_by_type(db_nm, sc_nm, obj_type)
+                except programming_error() as e:
+                    self.logger.warning(f"Failure to extract {obj_type} in {db_nm}.{sc_nm}")
+                    pass
+                if schema_objects is None:
+                    schema_objects = []
+                self.stages['list'].add(len(schema_objects), time.perf_counter() - start)
+                for schema_obj in schema_objects:
+                    # obj_nm, obj_last_modified, arguments
+                    stats['objects'] += 1
+                    if catalog_version is None or schema_obj[1] > catalog_version:
+                        catalog_version = schema_obj[1]
+                for file_nm, file_objects in self.changed_files(f"{db_nm}.{sc_nm}", file_stats, obj_type, schema_objects):
+                    stats['written'] += len(file_objects)
+                    if len(fetchers) == 0:
+                        if len(errors) > 0:
+                            break
+                        self.fetch_file(self.sf_conn, db_nm, sc_nm, (obj_type, file_nm, file_objects), write_queue, errors)
+                    else:
+                        fetch_queue.put((obj_type, file_nm, file_objects))
+        finally:
+            for thread in fetchers:
+                fetch_queue.put(None)
+            for thread in fetchers:
+                thread.join()
+            write_queue.put(None)
+            writer.join()
+        if len(errors) > 0:
+            raise errors[0]
+        # Check for files in db.sc directory that haven't been seen
+        for file in file_stats.keys():
+            if file_stats[file]['seen'] == 0:
+                if self.delete:
+                    self.logger.warning(f"{db_nm}.{sc_nm}:{file} not seen - deleting")
+                    self.delete_object(db_sc_dir, file)
+                    stats['deleted'] += 1
+                else:
+                    self.logger.warning(f"{db_nm}.{sc_nm}:{file} not seen in this run")
+        self.save_file_stats(db_sc_dir)
+        if catalog_version is not None:
+            stats['catalog_version'] = catalog_version.isoformat()
+        return stats
+
+    def export_schema_retry(self, db_nm, sc_nm):
+        """Exports db_nm.sc_nm, retrying transient errors with backoff. A schema
+           that cannot be exported is returned as failed instead of ending the run."""
+        start = time.perf_counter()
+        for attempt in range(self.retries + 1):
+            try:
+                stats = self.export_schema(db_nm, sc_nm)
+                stats['attempts'] = attempt + 1
+                stats['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 1)
+                self.logger.debug("Exported %s.%s: %d objects, %d written in %.1f ms", db_nm, sc_nm, stats['objects'], stats['written'],
+                                  stats['elapsed_ms'], schema=f"{db_nm}.{sc_nm}", duration_ms=stats['elapsed_ms'])
+                return stats
+            except SfConnError as e:
+                # The schema does not exist or the role has no access to it
+                error = str(e)
+                break
+            except Exception as e:
+                error = str(e)
+                if attempt == self.retries:
+                    break
+                delay = self.backoff_seconds * 2 ** attempt
+                self.logger.warning(f"Export of {db_nm}.{sc_nm} failed: {e} - retrying in {delay}s ({attempt + 1} of {self.retries})")
+                time.sleep(delay)
+                for sf_conn in [ self.sf_conn ] + self.fetch_conns:
+                    if not sf_conn.verify_conn():
+                        self.logger.warning(f"Session lost, reconnecting to {sf_conn.account}")
+                        try:
+                            sf_conn.reconnect()
+                        except Exception as e:
+                            self.logger.warning(f"Reconnecting failed: {e}")
+        self.logger.error(f"Giving up on {db_nm}.{sc_nm} after {attempt + 1} attempts: {error}")
+        return { 'status': 'failed', 'error': error, 'attempts': attempt + 1,
+                 'elapsed_ms': round((time.perf_counter() - start) * 1000, 1) }
+
+    def export(self, db_sc, resume=False):
+        """Exports a list of [database, schema] and returns the counts per schema.
+           With resume the schemas the journal has as done are skipped."""
+        self.logger.debug(f"Creating {self.export_dir} if it does not exist")
+        os.makedirs(self.export_dir, 0o770, exist_ok=True)
+        if resume:
+            self.load_journal()
+        fobj = None
+        if self.journal is not None:
+            fobj = open(self.journal, 'a' if resume else 'w')
+            if resume and self.partial_line:
+                fobj.write('\n')
+        results = {}
+        try:
+            for db, sc in db_sc:
+                schema = f"{db}.{sc}"
+                if schema in self.done:
+                    self.logger.info(f"Skipping {schema} - exported at {self.done[schema]['finished_at']}")
+                    results[schema] = dict(self.done[schema], status='skipped')
+                    continue
+                results[schema] = self.export_schema_retry(db, sc)
+                self.write_journal(fobj, schema, results[schema])
+        finally:
+            if fobj is not None:
+                fobj.close()
+        for stage in self.stages.values():
+            stage.report(self.logger)
+        return results
+
+class SfExportStore(SfExport):
+    """SfExportStore exports to a content addressed store (see sfblobstore.py)
+       instead of a file per object. A schema directory only holds index.json,
+       mapping the file name an object has in the classic layout to the hashes
+       of its DDL (several for overloaded procedures and functions) and when it
+       was exported. materialize() writes the classic layout from the indexes."""
+
+    def __init__(self, sf_conn, logger, export_dir, delete=False, journal=None, retries=3, backoff_seconds=2,
+                 fetch_conns=None, store_dir=None, compress=False):
+        super().__init__(sf_conn, logger, export_dir, delete, journal, retries, backoff_seconds, fetch_conns)
+        if store_dir is None:
+            store_dir = os.path.join(self.export_dir, '.store')
+        self.blob_store = SfBlobStore(store_dir, compress)
+        # db_sc_dir -> { file_nm: { "hashes": [...], "exported_at": ... } }
+        self.indexes    = {}
+
+    def load_index(self, db_sc_dir):
+        index_file = os.path.join(db_sc_dir, 'index.json')
+        if not os.path.exists(index_file):
+            return {}
+        with open(index_file, 'r') as fobj:
+            return json.load(fobj)
+
+    def populate_file_stats(self, db_sc_dir):
+        index = self.load_index(db_sc_dir)
+        self.indexes[db_sc_dir] = index
+        return { file_nm: { "seen": 0, "file_last_modified": datetime.fromisoformat(entry['exported_at']) }
+                 for file_nm, entry in index.items() }
+
+    def write_object(self, db_sc_dir, file_nm, contents):
+        self.indexes[db_sc_dir][file_nm] = { 'hashes': [ self.blob_store.put(content) for content in contents ],
+                                             'exported_at': datetime.now(timezone.utc).isoformat() }
+
+    def delete_object(self, db_sc_dir, file_nm):
+        # The blobs may be shared with other schemas and are kept
+        del self.indexes[db_sc_dir][file_nm]
+
+    def save_file_stats(self, db_sc_dir):
+        index_file = os.path.join(db_sc_dir, 'index.json')
+        tmp_file = f"{index_file}.{os.getpid()}.tmp"
+        with open(tmp_file, 'w') as fobj:
+            json.dump(self.indexes.pop(db_sc_dir), fobj, indent=1, sort_keys=True)
+        os.replace(tmp_file, index_file)
+
+    def materialize(self, target_dir, schemas=None):
+        """Writes the classic layout of the exported schemas (all when schemas
+           is None) to target_dir and returns the number of files written. The
+           files get the time their object was exported, so the classic
+           export can continue incrementally from them."""
+        if schemas is None:
+            schemas = sorted(file.parent.name for file in Path(self.export_dir).glob('*/index.json'))
+        files = 0
+        for schema in schemas:
+            db_sc_dir = os.path.join(self.export_dir, schema)
+            if not os.path.exists(os.path.join(db_sc_dir, 'index.json')):
+                self.logger.warning(f"{schema} has not been exported to {self.export_dir}")
+                continue
+            schema_dir = os.path.join(os.path.abspath(target_dir), schema)
+            os.makedirs(schema_dir, 0o770, exist_ok=True)
+            for file_nm, entry in self.load_index(db_sc_dir).items():
+                file = os.path.join(schema_dir, file_nm)
+                write_file(file, '\n'.join(self.blob_store.get(digest) for digest in entry['hashes']))
+                exported_at = datetime.fromisoformat(entry['exported_at']).timestamp()
+                os.utime(file, (exported_at, exported_at))
+                files += 1
+            self.logger.info(f"Materialized {schema} to {schema_dir}")
+        return files
+
+class SfExportArchive(SfExport):
+    """SfExportArchive writes a run to one SQLite archive in export_dir (see
+       sfarchive.py) instead of a file per object. Whether an object changed
+       is decided from the time it was exported to the previous archive, and
+       the objects that did not change are copied from it."""
+
+    schema_dirs = False
+
+    def __init__(self, sf_conn, logger, export_dir, delete=False, journal=None, retries=3, backoff_seconds=2,
+                 fetch_conns=None):
+        super().__init__(sf_conn, logger, export_dir, delete, journal, retries, backoff_seconds, fetch_conns)
+        self.archive      = None
+        self.previous     = None
+        self.archive_file = None
+        # State of the schema being exported: file -> exported_at
+        self.previous_files = {}
+        self.written      = {}
+        self.deleted      = set()
+
+    def open_archives(self, resume):
+        finished = list_archives(self.export_dir)
+        if len(finished) > 0:
+            self.previous = SfArchive(finished[-1], self.logger)
+            self.logger.info(f"Comparing with previous archive {finished[-1]}")
+        partial = list_archives(self.export_dir, partial=True)
+        if resume and len(partial) > 0:
+            filename = partial[-1]
+            self.logger.info(f"Resuming archive {filename}")
+        else:
+            filename = archive_name(self.export_dir, datetime.now(timezone.utc)) + '.partial'
+        self.archive = SfArchive(filename, self.logger)
+
+    def schema(self, db_sc_dir):
+        return os.path.basename(db_sc_dir)
+
+    def populate_file_stats(self, db_sc_dir):
+        schema = self.schema(db_sc_dir)
+        # Anything not committed is left from a schema that failed
+        self.archive.db.rollback()
+        self.archive.clear_schema(schema)
+        self.previous_files = {} if self.previous is None else self.previous.files(schema)
+        self.written        = {}
+        self.deleted        = set()
+        return { file_nm: { "seen": 0, "file_last_modified": datetime.fromisoformat(exported_at) }
+                 for file_nm, exported_at in self.previous_files.items() }
+
+    def write_objects(self, db_sc_dir, files):
+        # One statement for the batch
+        exported_at = datetime.now(timezone.utc).isoformat()
+        schema = self.schema(db_sc_dir)
+        for file_nm, contents in files:
+            self.written[file_nm] = exported_at
+        self.archive.add_many([ (schema, file_nm, exported_at, content) for file_nm, contents in files for content in contents ])
+
+    def delete_object(self, db_sc_dir, file_nm):
+        self.deleted.add(file_nm)
+
+    def save_file_stats(self, db_sc_dir):
+        if self.previous is not None:
+            unchanged = [ file_nm for file_nm in self.previous_files if file_nm not in self.written and file_nm not in self.deleted ]
+            self.archive.copy_from(self.previous, self.schema(db_sc_dir), unchanged)
+        self.archive.commit()
+
+    def export(self, db_sc, resume=False):
+        os.makedirs(self.export_dir, 0o770, exist_ok=True)
+        self.open_archives(resume)
+        try:
+            results = super().export(db_sc, resume)
+            self.archive.db.rollback()
+            if self.previous is not None:
+                # Schemas not exported by this run, or failed, are kept as they were
+                exported = set(self.archive.schemas())
+                for schema in self.previous.schemas():
+                    if schema not in exported:
+                        self.archive.copy_from(self.previous, schema, self.previous.files(schema))
+                self.archive.commit()
+            self.archive.finish()
+        finally:
+            self.archive.close()
+            if self.previous is not None:
+                self.previous.close()
+        self.archive_file = self.archive.filename[:-len('.partial')]
+        os.replace(self.archive.filename, self.archive_file)
+        self.logger.info(f"Wrote archive {self.archive_file}")
+        return results
+
+def make_export(sf_conn, logger, export_dir, format='files', delete=False, journal=None, retries=3,
+                store_dir=None, compress=False, fetch_conns=None):
+    """SfExport for the --format of sf_export"""
+    if format == 'store':
+        return SfExportStore(sf_conn, logger, export_dir, delete, journal, retries, fetch_conns=fetch_conns,
+                             store_dir=store_dir, compress=compress)
+    if format == 'archive':
+        return SfExportArchive(sf_conn, logger, export_dir, delete, journal, retries, fetch_conns=fetch_conns)
+    return SfExport(sf_conn, logger, export_dir, delete, journal, retries, fetch_conns=fetch_conns)
@@ -0,0 +1,80 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+class SfFanout():
+    """SfFanout runs a tool once for every connection profile in config.json,
+       each in its own process with --profile <name> and up to max_workers
+       processes at once, so the run takes as long as the largest account
+       instead of the sum of all of them. The output of a profile is written to
+       <output_dir>/<profile>/ and a merged report of all profiles to
+       <output_dir>/report.json."""
+
+    def __init__(self, script, logger, output_dir, max_workers=8, stdout_name='stdout.txt'):
+        self.script      = os.path.abspath(script)
+        self.logger      = logger
+        self.output_dir  = os.path.abspath(output_dir)
+        self.max_workers = max_workers
+        self.stdout_name = stdout_name
+
+    def run_profile(self, profile, args):
+        profile_dir = os.path.join(self.output_dir, profile)
+        os.makedirs(profile_dir, 0o770, exist_ok=True)
+        stdout_file = os.path.join(profile_dir, self.stdout_name)
+        stderr_file = os.path.join(profile_dir, 'stderr.txt')
+        command = [ sys.executable, self.script, '--profile', profile ] + args(profile, profile_dir)
+        self.logger.info(f"{profile}: running {' '.join(command[1:])}")
+        start = time.perf_counter()
+        with open(stdout_file, 'w') as stdout, open(stderr_file, 'w') as stderr:
+            proc = subprocess.run(command, stdout=stdout, stderr=stderr)
+        result = {
+            'profile':    profile,
+            'exit_code':  proc.returncode,
+            'wall_clock': round(time.perf_counter() - start, 3),
+            'output_dir': profile_dir,
+            'stdout':     stdout_file,
+            'stderr':     stderr_file
+        }
+        if proc.returncode != 0:
+            with open(stderr_file, 'r') as fobj:
+                result['error'] = ''.join(fobj.readlines()[-5:]).strip()
+            self.logger.error(f"{profile}: exited with {proc.returncode} after {result['wall_clock']}s - see {stderr_file}")
+        else:
+            self.logger.info(f"{profile}: done in {result['wall_clock']}s")
+        return result
+
+    def run(self, profiles, args, merge=None):
+        """Runs the script for every profile. args(profile, profile_dir) returns the
+           command line of a profile and merge(result), when given, adds the
+           output of a profile to its entry in the report."""
+        started_at = datetime.now(timezone.utc).isoformat()
+        start = time.perf_counter()
+        os.makedirs(self.output_dir, 0o770, exist_ok=True)
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(profiles)))) as executor:
+            results = list(executor.map(lambda profile: self.run_profile(profile, args), profiles))
+        if merge is not None:
+            for result in results:
+                merge(result)
+        report = {
+            'script':      os.path.basename(self.script),
+            'started_at':  started_at,
+            'finished_at': datetime.now(timezone.utc).isoformat(),
+            'wall_clock':  round(time.perf_counter() - start, 3),
+            'failed':      [ result['profile'] for result in results if result['exit_code'] != 0 ],
+            'profiles':    { result['profile']: result for result in results }
+        }
+        with open(os.path.join(self.output_dir, 'report.json'), 'w') as fobj:
+            json.dump(report, fobj, indent=2)
+        return report
+
+    def print_report(self, report):
+        print(f"{'profile':<24} {'exit':>5} {'wall (s)':>9}  output")
+        for profile, result in report['profiles'].items():
+            print(f"{profile:<24} {result['exit_code']:>5} {result['wall_clock']:>9.3f}  {result['output_dir']}")
+        total = sum(result['wall_clock'] for result in report['profiles'].values())
+        print(f"{len(report['profiles'])} profiles in {report['wall_clock']:.3f}s ({total:.3f}s run back to back), "
+              f"{len(report['failed'])} failed - report in {os.path.join(self.output_dir, 'report.json')}")
@@ -1,189 +1,175 @@
 import re
-from snowflake.connector.errors import ProgrammingError
+from sfbackend import programming_error
+from sfgrantindex import SfGrantIndex
+
+ar_re = re.compile(r'_(\w{2,3})_AR$')
+fr_re = re.compile(r'_FR$')
+
+def apply_order(order, inc, exc, custom_inc, custom_exc):
+    """Evaluates the rules of a functional role in the configured ORDER.
+       INCEXC: everything included, then everything excluded is removed.
+       EXCINC: the excludes are applied to the INCLUDE rules and CUSTOM_INCLUDE
+               is added afterwards, so an explicitly listed role is granted
+               even if it matches an EXCLUDE rule."""
+    if order == 'EXCINC':
+        return ((inc - exc - custom_exc) | custom_inc)
+    return ((inc | custom_inc) - (exc | custom_exc))
+
+class SfRoleDelta():
+    """Grants and revokes of access roles (AR) and functional roles (FR) that
+       make a functional role match its configuration."""
+    def __init__(self, role, create_role=False):
+        self.role        = role
+        self.create_role = create_role
+        self.grant_ars   = []
+        self.grant_frs   = []
+        self.revoke_ars  = []
+        self.revoke_frs  = []
+
+    def is_empty(self):
+        return not (self.create_role or self.grant_ars or self.grant_frs or self.revoke_ars or self.revoke_frs)
+
+    def statements(self):
+        # Grants before revokes so access never lapses while a role is reconciled
+        statements = []
+        if self.create_role:
+            statements.append(f"CREATE ROLE IF NOT EXISTS {self.role};")
+        for role in self.grant_ars + self.grant_frs:
+            statements.append(f"GRANT ROLE {role} TO ROLE {self.role};")
+        for role in self.revoke_ars + self.revoke_frs:
+            statements.append(f"REVOKE ROLE {role} FROM ROLE {self.role};")
+        return statements
+
+    def to_dict(self):
+        return {
+            'role':        self.role,
+            'create_role': self.create_role,
+            'grant_ars':   self.grant_ars,
+            'grant_frs':   self.grant_frs,
+            'revoke_ars':  self.revoke_ars,
+            'revoke_frs':  self.revoke_frs
+        }
+
+    def print_delta(self):
+        for statement in self.statements():
+            print(statement)
+        print()
 
 class SfFuncRole():
-    def __init__(self, cfg, sf_conn):
+    def __init__(self, cfg, sf_conn, logger, grant_index=None):
         self.cfg = cfg
         self.sf_conn = sf_conn
-        prov_cfg = cfg
-        db_cfg = prov_cfg.db
-        sc_cfg = prov_cfg.sc
-        wh_cfg = prov_cfg.wh
-        fr_cfg = prov_cfg.fr
-
+        self.logger = logger
+        # All grants are read once and shared by every functional role
+        if grant_index is None:
+            grant_index = SfGrantIndex(sf_conn, logger)
+        self.grant_index = grant_index
         
     def list_roles(self):
-        return self.cfg.fr.config
+        return self.cfg.compiled_config().fr
 
-    def gen_role_delta(self, frole):
-        include_grants = []
-        exclude_grants = []
-        include_frs = []
-        exclude_frs = []
-
-        db_prefix = db_cfg.config['AR_PREFIX']
-        sc_prefix = sc_cfg.config['AR_PREFIX']
-        wh_prefix = wh_cfg.config['AR_PREFIX']
+    def live_granted_roles(self, frole):
+        """Whether frole exists and the roles granted to it right now, read with
+           SHOW GRANTS TO ROLE as account_usage lags behind"""
+        try:
+            cursor = self.sf_conn.run_query(f"SHOW GRANTS TO ROLE {frole}")
+        except programming_error() as e:
+            self.logger.debug(f"SHOW GRANTS TO ROLE {frole} failed, the role does not exist: {e}")
+            return False, set()
+        # By query id, the session may be used by other statements in between
+        query_id = cursor.sfqid
+        cursor.close()
+        cursor = self.sf_conn.run_query(f"select \"name\" from table(result_scan('{query_id}')) where \"granted_on\" = 'ROLE' and \"privilege\" = 'USAGE'")
+        rows = cursor.fetchall()
+        cursor.close()
+        return True, set(row[0].strip('"') for row in rows)
+
+    def role_delta(self, frole, live=False):
+        """Computes the SfRoleDelta that makes frole match its configuration.
+           With live the current grants of frole are read from the account
+           first, which is what the delta has to be applied against."""
+        index = self.grant_index
+        if live:
+            exists, granted = self.live_granted_roles(frole)
+            index.set_role(frole, exists, granted)
+        compiled = self.cfg.compiled_config()
+        fr_model = compiled.fr[frole]
+        db_prefix = compiled.db.ar_prefix
+        sc_prefix = compiled.sc.ar_prefix
+        wh_prefix = compiled.wh.ar_prefix
 
         # Includes/excludes are really hard to match so the scripts needs to compare the output of the DB to
         # what is generated with the configuration. It will not be a simple 1:1 for between config and db
+        delta = SfRoleDelta(frole, not index.role_exists(frole))
 
-        # For DB/SC/WH
-        existing_ar = []
-        # For roles
-        existing_fr = []    
-        existing_role = 0
-
-        try:
-            cursor = self.sf_conn.run_query(f"SHOW GRANTS TO ROLE {frole}")
-            for row in cursor:
-                existing_role = 1
-                if row[1] != 'OWNERSHIP':
-                    if row[1] == 'USAGE':
-                        match_type = re.search(r'_(\w{2,3})_AR$', row[3])
-                        if match_type:
-                            existing_ar.append(row[3])
-                        match_type = re.search(r'_FR$', row[3])
-                        if match_type:
-                            existing_fr.append(row[3])
-                    else:
-                        # Not _ARs or _FRs 
-                        # How can we fix this?
-                        print("Error cannot generate configuration for row: ", row)
-        except ProgrammingError as e:
-            print(f"-- error when fetching grants for {frole} -- role does not exist: {e.errno}")
-        except:
-            print(f"-- error when fetching grants for {frole} -- role does not exist")
-        # if existing_role = 1
-        if existing_role == 0:
-            print(f"CREATE ROLE {frole} IF NOT EXISTS;")
+        # What is granted today: access roles for DB/SC/WH and functional roles
+        existing_ar = set()
+        existing_fr = set()
+        for role in index.granted_roles(frole):
+            if ar_re.search(role):
+                existing_ar.add(role)
+            if fr_re.search(role):
+                existing_fr.add(role)
 
         # What does the configuration say should be granted?
-        # FIX: db *
-        # Build up include statements
-        for include in self.cfg.fr.config[frole]['INCLUDE']:
+        inc_grants = set()
+        inc_frs = set()
+        exc_grants = set()
+        exc_frs = set()
+        for include in fr_model.include:
             if include['TYPE'] == 'DATABASE':
-                include_grants.append(f"select distinct 'DATABASE' as type, grantee_name, db_name from allfuturegrantsdb where db_name like '{include['DATABASE']}' and grantee_name like '{db_prefix}%_{include['ROLE']}_AR' order by grantee_name asc")
+                inc_grants |= index.db_grantees(include['DATABASE'], f"{db_prefix}%_{include['ROLE']}_AR")
             elif include['TYPE'] == 'SCHEMA':
-                include_grants.append(f"select distinct 'SCHEMA' as type, grantee_name, db_name, sc_name, db_sc\n  from allfuturegrantssc where db_name like '{include['DATABASE']}' and sc_name like '{include['SCHEMA']}' and grantee_name like '{sc_prefix}%_{include['ROLE']}_AR' order by grantee_name asc")
+                inc_grants |= index.sc_grantees(include['DATABASE'], include['SCHEMA'], f"{sc_prefix}%_{include['ROLE']}_AR")
             elif include['TYPE'] == 'WAREHOUSE':
-                # We need something that gives us all role grants for warehouses
-                include_grants.append(f"select distinct 'WAREHOUSE' as type, grantee_name, wh_name\n  from allgrantswh where wh_name like '{include['WAREHOUSE']}' and grantee_name like '{wh_prefix}%_{include['ROLE']}_AR' order by grantee_name asc")
+                inc_grants |= index.wh_grantees(include['WAREHOUSE'], f"{wh_prefix}%_{include['ROLE']}_AR")
             elif include['TYPE'] == 'ROLE':
-                include_frs.append(f"select distinct 'ROLE' as type, name from snowflake.account_usage.roles where name like '{include['ROLE']}' and deleted_on is null order by name asc")
+                inc_frs |= index.roles_like(include['ROLE'])
             else:
-                print(f"Type incorrect: {include['TYPE']}")
-                exit(-1)
-        # Build up exclude statements
-        for exclude in self.cfg.fr.config[frole]['EXCLUDE']:
+                raise ValueError(f"Type incorrect: {include['TYPE']}")
+        for exclude in fr_model.exclude:
             if exclude['TYPE'] == 'DATABASE':
-                exclude_grants.append(f"select distinct 'DATABASE' as type, grantee_name, db_name from allfuturegrantsdb where db_name like '{exclude['DATABASE']}' order by grantee_name asc")
+                exc_grants |= index.db_grantees(exclude['DATABASE'])
             elif exclude['TYPE'] == 'SCHEMA':
-                exclude_grants.append(f"select distinct 'SCHEMA' as type, grantee_name, db_name, sc_name, db_sc\n  from allfuturegrantssc where db_name like '{exclude['DATABASE']}' and sc_name like '{exclude['SCHEMA']}' order by grantee_name asc")
+                exc_grants |= index.sc_grantees(exclude['DATABASE'], exclude['SCHEMA'])
             elif exclude['TYPE'] == 'WAREHOUSE':
-                # We need something that gives us all role grants for warehouses
-                excludes_grants.append(f"select distinct 'WAREHOUSE' as type, grantee_name, wh_name\n  from allgrantswh where wh_name like '{exclude['WAREHOUSE']}' order by grantee_name asc")
-            elif include['TYPE'] == 'ROLE':
-                excludes_frs.append(f"select distinct 'ROLE' as type, name from snowflake.account_usage.roles where name like '{exclude['ROLE']}' and deleted_on is null order by name asc")            
+                exc_grants |= index.wh_grantees(exclude['WAREHOUSE'])
+            elif exclude['TYPE'] == 'ROLE':
+                exc_frs |= index.roles_like(exclude['ROLE'])
             else:
-                print(f"Type incorrect: {include['TYPE']}")
-                exit(-1)
-    
-        # type = 'ROLE' should only be _FR?
-
-        # [x] we need to split out grants vs roles
-        # includes_grants vs includes_fr
-        # excludes_grants vs excludes_fr
-
-        map_roles = {}
-        inc_grants = []
-        inc_frs = []
-        exc_grants = []
-        exc_frs = []
-
-        for sql in include_grants:
-            cursor = self.sf_conn.run_query(sql)
-            for row in cursor:
-                inc_grants.append(row[1])
-                map_roles[row[0]] = row
-        for sql in exclude_grants:
-            cursor = self.sf_conn.run_query(sql)
-            for row in cursor:
-                exc_grants.append(row[1])
-                map_roles[row[0]] = row
-        for sql in include_frs:
-            cursor = self.sf_conn.run_query(sql)
-            for row in cursor:
-                inc_frs.append(row[1])
-                map_roles[row[0]] = row    
-        for sql in exclude_frs:
-            cursor = self.sf_conn.run_query(sql)
-            for row in cursor:
-                exc_frs.append(row[1])
-                map_roles[row[0]] = row    
-            
+                raise ValueError(f"Type incorrect: {exclude['TYPE']}")
+
         # CUSTOM_INCLUDE/CUSTOM_EXCLUDE
         # what if they aren't valid roles?
-        for role in self.cfg.fr.config[frole]['CUSTOM_INCLUDE']:
-            match_type = re.search(r'_AR$', role)
-            if match_type:
-                inc_grants.append(role)
-            match_type = re.search(r'_FR$', role)
-            if match_type:
-                inc_frs.append(role)
-        for role in self.cfg.fr.config[frole]['CUSTOM_EXCLUDE']:
-            match_type = re.search(r'_AR$', role)
-            if match_type:
-                exc_grants.append(role)
-            match_type = re.search(r'_FR$', role)
-            if match_type:
-                exc_frs.append(role)
-
-        # ORDER: INCEXC vs EXCINC
-        # depending on order include/exclude first
-        new_grants = []
-        new_frs = []
-        for inc in inc_grants:
-            if inc not in exc_grants:
-                new_grants.append(inc)
-        for inc in inc_frs:
-            if inc not in exc_frs:
-                new_frs.append(inc)
-
-        # now validate between new_grants and existing_ar
-        # -"-                  new_frs    and existing_fr
-        delta_add_grants = []
-        delta_add_frs = []
-        for new in new_grants:
-            if new not in existing_ar:
-                delta_add_grants.append(new)
-        for new in new_frs:
-            if new not in existing_fr:
-                delta_add_frs.append(new)
-    
-        delta_remove_grants = []
-        delta_remove_frs = []
-        for old in existing_ar:
-            if old not in new_grants:
-                delta_remove_grants.append(old)
-        for old in existing_fr:
-            if old not in new_frs:
-                delta_remove_frs.append(old)
-
-        for addgrant in delta_add_grants:
-            print(f"GRANT ROLE {addgrant} TO ROLE {frole};")
-
-        for addfr in delta_add_frs:
-            print(f"GRANT ROLE {addfr} TO ROLE {frole};")
-
-        for remgrant in delta_remove_grants:
-            print(f"REVOKE ROLE {remgrant} FROM ROLE {frole};")
-
-        for remfr in delta_remove_frs:
-            print(f"REVOKE ROLE {remfr} FROM ROLE {frole};")
-
-        print()
-
-        
-        
+        custom_inc_grants = set(role for role in fr_model.custom_include if role.endswith('_AR'))
+        custom_inc_frs    = set(role for role in fr_model.custom_include if role.endswith('_FR'))
+        custom_exc_grants = set(role for role in fr_model.custom_exclude if role.endswith('_AR'))
+        custom_exc_frs    = set(role for role in fr_model.custom_exclude if role.endswith('_FR'))
+
+        new_grants = apply_order(fr_model.order, inc_grants, exc_grants, custom_inc_grants, custom_exc_grants)
+        new_frs    = apply_order(fr_model.order, inc_frs, exc_frs, custom_inc_frs, custom_exc_frs)
+
+        delta.grant_ars  = sorted(new_grants - existing_ar)
+        delta.grant_frs  = sorted(new_frs - existing_fr)
+        delta.revoke_ars = sorted(existing_ar - new_grants)
+        delta.revoke_frs = sorted(existing_fr - new_frs)
+        return delta
+
+    def record_applied(self, delta, results):
+        """Updates the grant index with the statements of delta that were applied"""
+        applied = set(result['statement'] for result in results if result['status'] == 'applied')
+        index = self.grant_index
+        exists = index.role_exists(delta.role) or f"CREATE ROLE IF NOT EXISTS {delta.role};" in applied
+        granted = index.granted_roles(delta.role)
+        for role in delta.grant_ars + delta.grant_frs:
+            if f"GRANT ROLE {role} TO ROLE {delta.role};" in applied:
+                granted.add(role)
+        for role in delta.revoke_ars + delta.revoke_frs:
+            if f"REVOKE ROLE {role} FROM ROLE {delta.role};" in applied:
+                granted.discard(role)
+        index.set_role(delta.role, exists, granted)
 
+    def gen_role_delta(self, frole):
+        delta = self.role_delta(frole)
+        delta.print_delta()
+        return delta
@@ -1,116 +1,158 @@
+import json
 import re
+import sys
+from sfgrantindex import match_like
+
+ar_re = re.compile(r'_(\w{2,3})_AR$')
+fr_re = re.compile(r'_FR$')
+
+def json_entry(entry):
+    # One include per line like the hand maintained fr-config.json files
+    return "{ " + ", ".join(f"{json.dumps(key)} : {json.dumps(value)}" for key, value in entry.items()) + " }"
 
 class SfGenConfig():
-    def __init__(self, cfg, sf_conn, roles):
+    """SfGenConfig generates fr-config.json entries from the access and
+       functional roles granted to existing functional roles. The grant tables
+       (allgrantswh, allfuturegrantssc, allfuturegrantsdb) are read once for
+       all roles and joined in memory, and the configuration is written out
+       one role at a time."""
+    def __init__(self, cfg, sf_conn, roles, role_graph=None, snapshot=None):
         self.cfg = cfg
         self.sf_conn = sf_conn
+        # Grant tables and roles are read from the local snapshot instead of Snowflake
+        self.snapshot = snapshot
+        # Role grants are looked up in the role graph instead of a SHOW GRANTS per role
+        self.role_graph = role_graph
         self.generated_config = []
         self.roles = []
+        # grantee_name -> set of objects granted future/usage grants to
+        self.wh_grants = {}
+        self.sc_grants = {}
+        self.db_grants = {}
+        self.loaded = False
 
         if len(roles) == 1 and roles[0] == 'ALL':
             # load up all FRs
-            cursor = sf_conn.run_query("show roles like '%_FR'")
-            for row in cursor:
-                roles.append(row[1])
-            self.roles = roles
+            if snapshot is not None:
+                self.roles = sorted(match_like('%_FR', snapshot.roles()))
+            else:
+                cursor = sf_conn.run_query("show roles like '%_FR'")
+                for row in cursor:
+                    self.roles.append(row[1])
         else:
             self.roles = roles
 
     def list_roles(self):
         return self.roles
 
-    def gen_role_config(self, fr_role):
-        old_roles = []
-        old_roles_dict = {}
-        functional_roles = []
+    def load_grants(self):
+        if self.loaded:
+            return
+        if self.snapshot is not None:
+            wh_rows = self.snapshot.wh_grants()
+            sc_rows = self.snapshot.sc_grants()
+            db_rows = self.snapshot.db_grants()
+        else:
+            wh_rows = self.sf_conn.run_query("select distinct grantee_name, wh_name from allgrantswh")
+            sc_rows = self.sf_conn.run_query("select distinct grantee_name, db_name, sc_name from allfuturegrantssc")
+            db_rows = self.sf_conn.run_query("select distinct grantee_name, db_name from allfuturegrantsdb")
+        for grantee, wh_name in wh_rows:
+            self.wh_grants.setdefault(grantee, set()).add(wh_name)
+        for grantee, db_name, sc_name in sc_rows:
+            self.sc_grants.setdefault(grantee, set()).add((db_name, sc_name))
+        for grantee, db_name in db_rows:
+            self.db_grants.setdefault(grantee, set()).add(db_name)
+        self.loaded = True
+
+    def granted_roles(self, fr_role):
+        if self.role_graph is not None:
+            return sorted(self.role_graph.granted_roles(fr_role))
+        granted = []
         cursor = self.sf_conn.run_query(f"show grants to role {fr_role}")
         for row in cursor:
-            if row[1] != 'OWNERSHIP':
-                if row[1] == 'USAGE':
-                    match_type = re.search(r'_(\w{2,3})_AR$', row[3])
-                    if match_type:
-                        old_roles.append(row[3])
-                        old_roles_dict[row[3]] = 1
-                    match_type = re.search(r'_FR$', row[3])
-                    if match_type:
-                        functional_roles.append(row[3])
-                else:
-                    # Not _ARs or _FRs 
-                    # How can we fix this?
-                    print("Error cannot generate configuration for row: ", row)
-        union_arr = []
-        for role in old_roles:
-            union_arr.append(f"'{role}'")
-        union_sql = ",".join(union_arr)
-    
-        wh_roles = {}
-        cursor = self.sf_conn.run_query(f"select distinct grantee_name, wh_name\n  from allgrantswh where grantee_name in ({union_sql}) order by wh_name asc")
-        for row in cursor:
-            wh_roles[row[0]] = row[1]
-            old_roles_dict[row[0]] = 0
-        sc_roles = {}
-        cursor = self.sf_conn.run_query(f"select distinct grantee_name, db_name, sc_name, db_sc\n  from allfuturegrantssc where grantee_name in ({union_sql}) order by db_sc asc")
-        for row in cursor:
-            sc_roles[row[0]] = row
-            old_roles_dict[row[0]] = 0
-        db_roles = {}
-        cursor = self.sf_conn.run_query(f"select * from allfuturegrantsdb where grantee_name in ({union_sql}) order by db_name asc")
-        for row in cursor:
-            db_roles[row[0]] = row
-            old_roles_dict[row[0]] = 0
+            if row[1] == 'USAGE':
+                granted.append(row[3])
+            elif row[1] != 'OWNERSHIP':
+                # Not _ARs or _FRs
+                # How can we fix this?
+                print("Error cannot generate configuration for row: ", row, file=sys.stderr)
+        return granted
 
-        # Remaining roles in old_roles_dict where the value is still 1
-        custom_includes = []
-
-        for c_role in old_roles_dict:
-            if old_roles_dict[c_role] == 1:
-                custom_includes.append(f"\"{c_role}\"")
-
-        custom_include = ", ".join(custom_includes)
-            
-        includes = []
-
-        for wh_r in wh_roles:
-            match_type = re.search(r'_(\w{2,3})_AR$', wh_r)
-            if match_type:
-                type = match_type.group(1)
-                includes.append("      {" + f" \"TYPE\" : \"WAREHOUSE\", \"WAREHOUSE\" : \"{wh_roles[wh_r]}\", \"ROLE\" : \"{type}\"" + " }")
-
-        for sc_r in sc_roles:
-            match_type = re.search(r'_(\w{2,3})_AR$', sc_r)
-            if match_type:
-                type = match_type.group(1)
-                includes.append("      {" + f" \"TYPE\" : \"SCHEMA\", \"DATABASE\" : \"{sc_roles[sc_r][1]}\", \"SCHEMA\" : \"{sc_roles[sc_r][2]}\", \"ROLE\" : \"{type}\"" + " }")
+    def role_config(self, fr_role):
+        self.load_grants()
+        access_roles = []
+        functional_roles = []
+        for role in self.granted_roles(fr_role):
+            if ar_re.search(role):
+                access_roles.append(role)
+            if fr_re.search(role):
+                functional_roles.append(role)
 
-        for db_r in db_roles:
-            match_type = re.search(r'_(\w{2,3})_AR$', db_r)
-            if match_type:
-                type = match_type.group(1)
-                includes.append("      {" + f" \"TYPE\" : \"DATABASE\", \"DATABASE\" : \"{sc_roles[sc_r][1]}\", \"ROLE\" : \"{type}\"" + " }")
+        wh_includes = []
+        sc_includes = []
+        db_includes = []
+        custom_includes = []
+        for role in access_roles:
+            role_type = ar_re.search(role).group(1)
+            found = False
+            for wh_name in sorted(self.wh_grants.get(role, [])):
+                wh_includes.append({ "TYPE" : "WAREHOUSE", "WAREHOUSE" : wh_name, "ROLE" : role_type })
+                found = True
+            for db_name, sc_name in sorted(self.sc_grants.get(role, [])):
+                sc_includes.append({ "TYPE" : "SCHEMA", "DATABASE" : db_name, "SCHEMA" : sc_name, "ROLE" : role_type })
+                found = True
+            for db_name in sorted(self.db_grants.get(role, [])):
+                db_includes.append({ "TYPE" : "DATABASE", "DATABASE" : db_name, "ROLE" : role_type })
+                found = True
+            # Access roles not provisioned through the grant tables
+            if found is False:
+                custom_includes.append(role)
+        includes = wh_includes + sc_includes + db_includes
+        for role in functional_roles:
+            includes.append({ "TYPE" : "ROLE", "ROLE" : role })
+        return {
+            "ORDER" : "INCEXC",
+            "INCLUDE" : includes,
+            "EXCLUDE" : [],
+            "CUSTOM_INCLUDE" : custom_includes,
+            "CUSTOM_EXCLUDE" : [],
+            "SCIM_ROLES" : []
+        }
 
-        for fr_r in functional_roles:
-            includes.append("      {" + f" \"TYPE\" : \"ROLE\", \"ROLE\" : \"{fr_r}\"" + " }")
-            
-        include = ",\n".join(includes)
+    def role_config_lines(self, fr_role, config):
+        lines = []
+        lines.append(f"  {json.dumps(fr_role)} : " + "{")
+        lines.append(f"    \"ORDER\" : {json.dumps(config['ORDER'])},")
+        lines.append( "    \"INCLUDE\" : [")
+        lines.append(",\n".join("      " + json_entry(entry) for entry in config['INCLUDE']))
+        lines.append( "    ],")
+        lines.append( "    \"EXCLUDE\" : [],")
+        lines.append( "    \"CUSTOM_INCLUDE\" : [ " + ", ".join(json.dumps(role) for role in config['CUSTOM_INCLUDE']) + " ],")
+        lines.append( "    \"CUSTOM_EXCLUDE\" : [],")
+        lines.append( "    \"SCIM_ROLES\" : []")
+        lines.append( "  }")
+        return "\n".join(lines)
 
-        config = []
-        config.append(f"  \"{fr_role}\" : " + "{")
-        config.append( "    \"ORDER\" : \"INCEXC\",")
-        config.append( "    \"INCLUDE\" : [")
-        config.append(include)
-        config.append( "    ],")
-        config.append( "    \"EXCLUDE\" : [],")
-        config.append(f"    \"CUSTOM_INCLUDE\" : [ {custom_include} ],")
-        config.append( "    \"CUSTOM_EXCLUDE\" : [],")
-        config.append( "    \"SCIM_ROLES\" : []")
-        config.append( "  }")
-        self.generated_config.append("\n".join(config))
+    def gen_role_config(self, fr_role):
+        self.generated_config.append(self.role_config_lines(fr_role, self.role_config(fr_role)))
 
     def config(self):
-        role_config = "\n".join(self.generated_config)
+        role_config = ",\n".join(self.generated_config)
         return "{\n" + role_config + "\n}"
 
     def print_config(self):
         role_config = self.config()
         print(role_config)
-        
+
+    def write_config(self, fobj=sys.stdout):
+        """Generates and writes the configuration one role at a time so
+           nothing but the grant indexes is kept in memory."""
+        fobj.write("{\n")
+        first = True
+        for fr_role in self.roles:
+            if first is False:
+                fobj.write(",\n")
+            fobj.write(self.role_config_lines(fr_role, self.role_config(fr_role)))
+            first = False
+        fobj.write("\n}\n")
+        fobj.flush()
@@ -0,0 +1,151 @@
+import re
+from functools import lru_cache
+from sfrolegraph import SfRoleGraph
+
+@lru_cache(maxsize=None)
+def like_to_regex(pattern):
+    """Compiles a SQL LIKE pattern (% and _ wildcards, \\ escape) into a regular
+       expression matching the whole string like Snowflake does."""
+    regex = []
+    escaped = False
+    for char in pattern:
+        if escaped:
+            regex.append(re.escape(char))
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif char == '%':
+            regex.append('.*')
+        elif char == '_':
+            regex.append('.')
+        else:
+            regex.append(re.escape(char))
+    if escaped:
+        regex.append(re.escape('\\'))
+    return re.compile(''.join(regex) + r'\Z', re.DOTALL)
+
+def has_wildcard(pattern):
+    return '%' in pattern or '_' in pattern or '\\' in pattern
+
+def match_like(pattern, names):
+    """Returns the names matching the LIKE pattern. A pattern without
+       wildcards is a plain lookup."""
+    if not has_wildcard(pattern):
+        if pattern in names:
+            return [pattern]
+        return []
+    regex = like_to_regex(pattern)
+    return [name for name in names if regex.match(name)]
+
+class SfGrantIndex():
+    """SfGrantIndex snapshots the grant tables maintained by the procedures in
+       grants/ (allfuturegrantsdb, allfuturegrantssc, allgrantswh), the roles
+       and all role to role grants (through an SfRoleGraph) once and answers
+       the LIKE lookups of sf_funcrole from memory. The whole account is read
+       in five queries regardless of the number of functional roles and
+       INCLUDE/EXCLUDE rules.
+
+       Roles and role grants are read from snowflake.account_usage which lags
+       behind by up to a couple of hours - just like the grant tables that are
+       refreshed by a daily task. set_role() replaces what the index has for a
+       role with its live state before that role is reconciled.
+
+       With an SfSnapshot the index is loaded from the local snapshot instead
+       and no queries are run at all."""
+
+    def __init__(self, sf_conn, logger, role_graph=None, snapshot=None):
+        self.sf_conn  = sf_conn
+        self.logger   = logger
+        self.snapshot = snapshot
+        if role_graph is None:
+            role_graph = SfRoleGraph(sf_conn, logger, snapshot=snapshot)
+        self.role_graph = role_graph
+        # db_name -> set of grantee_name
+        self.db_grants = {}
+        # db_name -> sc_name -> set of grantee_name
+        self.sc_grants = {}
+        # wh_name -> set of grantee_name
+        self.wh_grants = {}
+        self.roles = set()
+        self.loaded = False
+
+    def fetch(self, query):
+        cursor = self.sf_conn.run_query(query)
+        rows = cursor.fetchall()
+        cursor.close()
+        self.logger.debug(f"{len(rows)} rows from: {query}")
+        return rows
+
+    def load(self):
+        if self.loaded:
+            return
+        if self.snapshot is not None:
+            db_rows = self.snapshot.db_grants()
+            sc_rows = self.snapshot.sc_grants()
+            wh_rows = self.snapshot.wh_grants()
+            roles   = self.snapshot.roles()
+        else:
+            db_rows = self.fetch("select distinct grantee_name, db_name from allfuturegrantsdb")
+            sc_rows = self.fetch("select distinct grantee_name, db_name, sc_name from allfuturegrantssc")
+            wh_rows = self.fetch("select distinct grantee_name, wh_name from allgrantswh")
+            roles   = [ row[0] for row in self.fetch("select name from snowflake.account_usage.roles where deleted_on is null") ]
+        for grantee, db_name in db_rows:
+            self.db_grants.setdefault(db_name, set()).add(grantee)
+        for grantee, db_name, sc_name in sc_rows:
+            self.sc_grants.setdefault(db_name, {}).setdefault(sc_name, set()).add(grantee)
+        for grantee, wh_name in wh_rows:
+            self.wh_grants.setdefault(wh_name, set()).add(grantee)
+        self.roles.update(roles)
+        self.role_graph.load()
+        self.loaded = True
+        self.logger.info(f"Grant index: {len(self.db_grants)} databases, {len(self.sc_grants)} databases with schemas, "
+                         f"{len(self.wh_grants)} warehouses, {len(self.roles)} roles, {len(self.role_graph.names)} roles in role graph")
+
+    def filter_grantees(self, grantees, grantee_like):
+        if grantee_like is None:
+            return grantees
+        return set(match_like(grantee_like, grantees))
+
+    def db_grantees(self, db_like, grantee_like=None):
+        self.load()
+        result = set()
+        for db_name in match_like(db_like, self.db_grants):
+            result |= self.filter_grantees(self.db_grants[db_name], grantee_like)
+        return result
+
+    def sc_grantees(self, db_like, sc_like, grantee_like=None):
+        self.load()
+        result = set()
+        for db_name in match_like(db_like, self.sc_grants):
+            schemas = self.sc_grants[db_name]
+            for sc_name in match_like(sc_like, schemas):
+                result |= self.filter_grantees(schemas[sc_name], grantee_like)
+        return result
+
+    def wh_grantees(self, wh_like, grantee_like=None):
+        self.load()
+        result = set()
+        for wh_name in match_like(wh_like, self.wh_grants):
+            result |= self.filter_grantees(self.wh_grants[wh_name], grantee_like)
+        return result
+
+    def roles_like(self, role_like):
+        self.load()
+        return set(match_like(role_like, self.roles))
+
+    def role_exists(self, role):
+        self.load()
+        return role in self.roles
+
+    def granted_roles(self, grantee):
+        self.load()
+        return self.role_graph.granted_roles(grantee)
+
+    def set_role(self, role, exists, granted):
+        """Replaces whether the role exists and the roles granted to it"""
+        self.load()
+        if exists:
+            self.roles.add(role)
+        else:
+            self.roles.discard(role)
+        self.role_graph.set_granted_roles(role, granted)
@@ -1,23 +1,90 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import os
+import queue
+
+# Log formats, SF_LOG_FORMAT selects one for every tool
+log_formats = [ 'text', 'json' ]
+
+class SfJsonFormatter(logging.Formatter):
+    """One JSON object per line with the structured fields (schema, object,
+       duration_ms, query_id, ...) passed to the SfLogger call as keywords"""
+
+    def format(self, record):
+        entry = {
+            'time':    self.formatTime(record, self.datefmt),
+            'level':   record.levelname,
+            'logger':  os.path.basename(record.name),
+            'message': record.getMessage()
+        }
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
 
 class SfLogger():
-    def __init__(self, level, name=__file__):
+    """SfLogger logs to stderr through a queue: the calling thread only
+       formats and enqueues a record, a listener thread does the writing.
+
+       Messages are formatted lazily, only when their level is enabled:
+
+           logger.debug("Cloning %s to %s", table, to_db_sc, schema=to_db_sc, object=table)
+
+       Keyword arguments are structured fields, written as JSON keys when
+       SF_LOG_FORMAT=json (or log_format='json') and left out of the text
+       format. Guard anything expensive to compute with is_enabled('DEBUG').
+       Creating an SfLogger for a name that already has one only sets the
+       level, so records are never written twice."""
+
+    def __init__(self, level, name=__file__, log_format=None):
+        if log_format is None:
+            log_format = os.environ.get('SF_LOG_FORMAT', 'text')
+        if log_format not in log_formats:
+            raise ValueError(f"Unknown log format {log_format} - expected one of {', '.join(log_formats)}")
         logger = logging.getLogger(name)
         logger.setLevel(getattr(logging, level))
-        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
-        ch = logging.StreamHandler()
-        ch.setFormatter(formatter)
-        logger.addHandler(ch)
+        if not any(getattr(handler, 'sf_logger', False) for handler in logger.handlers):
+            if log_format == 'json':
+                formatter = SfJsonFormatter(datefmt='%Y-%m-%dT%H:%M:%S%z')
+            else:
+                formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+            ch = logging.StreamHandler()
+            ch.setFormatter(formatter)
+            log_queue = queue.SimpleQueue()
+            handler = logging.handlers.QueueHandler(log_queue)
+            handler.sf_logger = True
+            listener = logging.handlers.QueueListener(log_queue, ch)
+            handler.listener = listener
+            listener.start()
+            # Writes what is still queued when the tool exits
+            atexit.register(listener.stop)
+            logger.addHandler(handler)
         self.logger = logger
 
-    def info(self, message):
-        self.logger.info(message)
+    def flush(self):
+        """Waits until every record logged so far has been written"""
+        for handler in self.logger.handlers:
+            if getattr(handler, 'sf_logger', False):
+                handler.listener.stop()
+                handler.listener.start()
+
+    def is_enabled(self, level):
+        return self.logger.isEnabledFor(getattr(logging, level))
+
+    def info(self, message, *args, **fields):
+        if self.logger.isEnabledFor(logging.INFO):
+            self.logger.info(message, *args, extra={ 'fields': fields })
 
-    def debug(self, message):
-        self.logger.debug(message)
+    def debug(self, message, *args, **fields):
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(message, *args, extra={ 'fields': fields })
 
-    def warning(self, message):
-        self.logger.warning(message)
+    def warning(self, message, *args, **fields):
+        if self.logger.isEnabledFor(logging.WARNING):
+            self.logger.warning(message, *args, extra={ 'fields': fields })
 
-    def error(self, message):
-        self.logger.error(message)
\ No newline at end of file
+    def error(self, message, *args, **fields):
+        if self.logger.isEnabledFor(logging.ERROR):
+            self.logger.error(message, *args, extra={ 'fields': fields })
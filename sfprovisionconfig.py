@@ -1,29 +1,53 @@
 from sfconfig import SfConfig
-import numpy as np
+from sfcompiledconfig import SfCompiledConfig, sc_map, config_key, load_compiled_config, save_compiled_config
+import re
 
 db_cfg_file = "db-config.json"
 sc_cfg_file = "sc-config.json"
 wh_cfg_file = "wh-config.json"
 fr_cfg_file = "fr-config.json"
 
-sc_map = {
-    "TABLES": "TABLE",
-    "EXTERNAL TABLES": "TABLE",
-    "VIEWS": "VIEW",
-    "MATERIALIZED VIEWS": "VIEW",
-    "FILE FORMATS": "FILE FORMAT",
-    "STAGES": "STAGE",
-    "STREAMS": "STREAM",
-    "SEQUENCES": "SEQUENCE",
-    "FUNCTIONS": "FUNCTION",
-    "PROCEDURES": "PROCEDURE",
-    "TASKS": "TASK"
-} 
+# Command line arguments that control the script and are not object parameters
+cmdline_only_args = [ 'type', 'name', 'dryrun', 'apply', 'diff', 'compact', 'journal', 'max_workers', 'log_level' ]
+
+# GRANT <privileges> ON <target> TO ROLE <role>; as generated by the grant_* methods
+grant_re = re.compile(r'^GRANT (?P<privs>.+?) ON (?P<target>.+) TO ROLE (?P<role>\S+?)(?P<suffix> REVOKE CURRENT GRANTS)?;$')
+
+def split_privileges(privs):
+    privileges = []
+    for priv in privs.split(','):
+        priv = ' '.join(priv.split()).upper()
+        if priv == 'ALL PRIVILEGES':
+            priv = 'ALL'
+        privileges.append(priv)
+    return privileges
             
 class SfProvisionConfig():
     """SfProvisionConfig parses database/schema/warehouse configuration and 
        builds out the statements required to provision objects."""
     def __init__(self):
+        # A compiled configuration cached by an earlier run with identical
+        # configuration files was validated when it was compiled, a cache hit
+        # skips validate_config() entirely
+        self.cfg_key  = config_key([db_cfg_file, sc_cfg_file, wh_cfg_file, fr_cfg_file])
+        self.compiled = load_compiled_config(self.cfg_key)
+        if self.compiled is not None:
+            self.db = self.compiled.db_cfg
+            self.sc = self.compiled.sc_cfg
+            self.wh = self.compiled.wh_cfg
+            self.fr = self.compiled.fr_cfg
+        else:
+            self.load_config()
+        # Objects that will be populated 
+        self.objects            = []
+        self.drop_objects       = []
+        self.obj_grants         = []
+        self.revoke_obj_grants  = []
+        self.owner_grants       = []
+        self.role_grants        = []
+        self.revoke_role_grants = []
+
+    def load_config(self):
         try:
             self.db = SfConfig(db_cfg_file)
         except Exception as e:
@@ -44,14 +68,6 @@ class SfProvisionConfig():
         except Exception as e:
             print(f"Error loading configuration from {fr_cfg_file}: {str(e)}")
             exit(-1)
-        # Objects that will be populated 
-        self.objects            = []
-        self.drop_objects       = []
-        self.obj_grants         = []
-        self.revoke_obj_grants  = []
-        self.owner_grants       = []
-        self.role_grants        = []
-        self.revoke_role_grants = []
 
     def db(self):
         return self.db
@@ -66,6 +82,31 @@ class SfProvisionConfig():
         return self.fr
     
     def validate_config(self):
+        if self.compiled is not None:
+            return
+        self.check_config()
+        self.compiled = SfCompiledConfig(self.cfg_key, self.db, self.sc, self.wh, self.fr)
+        save_compiled_config(self.compiled)
+
+    def compiled_config(self):
+        """The SfCompiledConfig every statement is generated from. Validates and
+           compiles the configuration files unless that was already done, either by
+           validate_config() or by the run that cached the compiled configuration."""
+        self.validate_config()
+        return self.compiled
+
+    def obj_model(self):
+        """SfObjectModel of the object type on the command line"""
+        compiled = self.compiled_config()
+        if self.cmdline.type == 'database':
+            return compiled.db
+        elif self.cmdline.type == 'schema':
+            return compiled.sc
+        elif self.cmdline.type == 'warehouse':
+            return compiled.wh
+        raise ValueError(f"Unknown object type: {self.cmdline.type}")
+
+    def check_config(self):
         for cfg in [self.db, self.sc, self.wh]:
             if 'TYPE' not in cfg.config:
                 print(f"Missing TYPE in configuration file: {cfg.filename}")
@@ -108,7 +149,7 @@ class SfProvisionConfig():
             print(f"TYPE not WAREHOUSE in configuration file: {cfg.filename}")
             raise ValueError
         # Validate that db.ROLE_HIERARCHY matches sc.ROLE_HIERARCHY
-        if np.array_equal(self.db.config['ROLE_HIERARCHY'], self.sc.config['ROLE_HIERARCHY']) is False:
+        if list(self.db.config['ROLE_HIERARCHY']) != list(self.sc.config['ROLE_HIERARCHY']):
             print(f"ROLE_HIERARCHY between DB {self.db.config['ROLE_HIERARCHY']} and SC {self.sc.config['ROLE_HIERARCHY']} does not match in configuration files: {self.db.filename} and {self.sc.filename}")
             raise ValueError
         # Validate functional role figuration
@@ -117,6 +158,9 @@ class SfProvisionConfig():
             if 'ORDER' not in fr_cfg.config[frole]:
                 print(f"Missing ORDER in configuration for {frole} in configuration file: {fr_cfg.filename}")
                 raise ValueError
+            if fr_cfg.config[frole]['ORDER'] not in ['INCEXC', 'EXCINC']:
+                print(f"ORDER must be INCEXC or EXCINC for {frole} in configuration file: {fr_cfg.filename}")
+                raise ValueError
             if 'INCLUDE' not in fr_cfg.config[frole]:
                 print(f"Missing INCLUDE in configuration for {frole} in configuration file: {fr_cfg.filename}")
                 raise ValueError
@@ -210,37 +254,37 @@ class SfProvisionConfig():
         config = {}
         self.cmdline = cmdline
         if cmdline.type == 'database':
-            cfg = self.db
-            for config_key in cfg.config['DEFAULT_DB_PARAMS']:
-                config[config_key] = cfg.config['DEFAULT_DB_PARAMS'][config_key]
+            default_params = self.compiled_config().db.default_params
+            for config_key in default_params:
+                config[config_key] = default_params[config_key]
             for config_key in vars(cmdline.args):
-                if (config_key == 'type' or config_key == 'name' or config_key == 'dryrun'):
+                if config_key in cmdline_only_args:
                     continue
                 if vars(cmdline.args)[config_key] is not None:
                     config[config_key.upper()] = vars(cmdline.args)[config_key]
         elif cmdline.type == 'schema':
-            cfg = self.sc
-            for config_key in cfg.config['DEFAULT_SC_PARAMS']:
-                config[config_key] = cfg.config['DEFAULT_SC_PARAMS'][config_key]
+            default_params = self.compiled_config().sc.default_params
+            for config_key in default_params:
+                config[config_key] = default_params[config_key]
             for config_key in vars(cmdline.args):
-                if (config_key == 'type' or config_key == 'name' or config_key == 'dryrun'):
+                if config_key in cmdline_only_args:
                     continue
                 if vars(cmdline.args)[config_key] is not None: #and vars(cmdline.args)[config_key] is not False:
                     config[config_key.upper()] = vars(cmdline.args)[config_key]
         elif cmdline.type == 'warehouse':
-            cfg = self.wh
-            for config_key in cfg.config['DEFAULT_WH_PARAMS']:
+            default_params = self.compiled_config().wh.default_params
+            for config_key in default_params:
                 # Handle str('True')
-                if type(cfg.config['DEFAULT_WH_PARAMS'][config_key]) is str:
-                    if cfg.config['DEFAULT_WH_PARAMS'][config_key] == 'True':
+                if type(default_params[config_key]) is str:
+                    if default_params[config_key] == 'True':
                         config[config_key] = True
                         continue
-                    elif cfg.config['DEFAULT_WH_PARAMS'][config_key] == 'False':
+                    elif default_params[config_key] == 'False':
                         config[config_key] = False
                         continue            
-                config[config_key] = cfg.config['DEFAULT_WH_PARAMS'][config_key]
+                config[config_key] = default_params[config_key]
             for config_key in vars(cmdline.args):
-                if (config_key == 'type' or config_key == 'name' or config_key == 'dryrun'):
+                if config_key in cmdline_only_args:
                     continue
                 if vars(cmdline.args)[config_key] is not None: # and vars(cmdline.args)[config_key] is not False:
                     config[config_key.upper()] = vars(cmdline.args)[config_key]
@@ -249,7 +293,7 @@ class SfProvisionConfig():
         self.obj_config = config
 
     def create_db(self):
-        cfg = self.db
+        model = self.compiled_config().db
         config = self.obj_config
         cmdline = self.cmdline
         create_db = []
@@ -276,50 +320,34 @@ class SfProvisionConfig():
         create_db.append(";")
         self.objects.append("\n".join(create_db))
         self.drop_objects.append(f"DROP DATABASE IF EXISTS {cmdline.db_nm};")
-        self.owner_grants.append(f"GRANT OWNERSHIP ON DATABASE {cmdline.db_nm} TO ROLE {cfg.config['ROLE_OWNER']} REVOKE CURRENT GRANTS;")
-        self.owner_grants.append(f"GRANT ALL PRIVILEGES ON DATABASE {cmdline.db_nm} TO ROLE {cfg.config['ROLE_OWNER']};")
+        self.owner_grants.append(f"GRANT OWNERSHIP ON DATABASE {cmdline.db_nm} TO ROLE {model.role_owner} REVOKE CURRENT GRANTS;")
+        self.owner_grants.append(f"GRANT ALL PRIVILEGES ON DATABASE {cmdline.db_nm} TO ROLE {model.role_owner};")
         
     def create_db_roles(self):
-        cfg = self.db
-        cmdline = self.cmdline
-        ar_db_prefix = cfg.config['AR_PREFIX']
-        for role_type in cfg.config['ROLE_HIERARCHY'][::-1]:
-            ar_role = f"{ar_db_prefix}{cmdline.db_nm}_{role_type}_AR"
+        model = self.compiled_config().db
+        for ar_role in model.ar_roles(self.cmdline.db_nm)[::-1]:
             self.create_role(ar_role)
 
     def create_db_grants(self):
-        cfg = self.db
+        model = self.compiled_config().db
         cmdline = self.cmdline
-        ar_db_prefix = cfg.config['AR_PREFIX']
-        for role_type in cfg.config['ROLE_HIERARCHY'][::-1]:
-            ar_role = f"{ar_db_prefix}{cmdline.db_nm}_{role_type}_AR"
-            type_grants = cfg.config['ROLE_PERMISSIONS'][role_type]
-            for privilege in type_grants.keys():
-                for object in type_grants[privilege]:
-                    if (object == 'DATABASE'):
-                        self.grant_privilege(privilege, object, cmdline.db_nm, ar_role)
-                    elif (object == 'SCHEMA'):
-                        print(f"Unsupported grants for {privilege} on {object}")
-                    else:
-                        self.grant_privilege_in(privilege, object, 'ON DATABASE', cmdline.db_nm, ar_role)
-                        self.grant_future_privilege_in(privilege, object, 'ON DATABASE', cmdline.db_nm, ar_role)
+        for role_type in model.role_hierarchy[::-1]:
+            ar_role = model.ar_role(role_type, cmdline.db_nm)
+            for privilege, object in model.expansions[role_type]:
+                if (object == 'DATABASE'):
+                    self.grant_privilege(privilege, object, cmdline.db_nm, ar_role)
+                elif (object == 'SCHEMA'):
+                    print(f"Unsupported grants for {privilege} on {object}")
+                else:
+                    self.grant_privilege_in(privilege, object, 'ON DATABASE', cmdline.db_nm, ar_role)
+                    self.grant_future_privilege_in(privilege, object, 'ON DATABASE', cmdline.db_nm, ar_role)
         
     def create_db_r2r_grants(self):
-        cfg = self.db
-        cmdline = self.cmdline
-        role_hierarchy = cfg.config['ROLE_HIERARCHY']
-        ar_db_prefix = cfg.config['AR_PREFIX']
-        hierarchy_length = len(role_hierarchy)
-        hierarchy_length = hierarchy_length - 1;
-        for role_num in range(hierarchy_length)[::-1]:
-            lower_ar_role = f"{ar_db_prefix}{cmdline.db_nm}_{role_hierarchy[role_num+1]}_AR"
-            higher_ar_role = f"{ar_db_prefix}{cmdline.db_nm}_{role_hierarchy[role_num]}_AR"
-            self.grant_r2r(lower_ar_role, higher_ar_role)
-            # Grant the highest level role to 'ROLE_OWNER'
-        self.grant_r2r(f"{ar_db_prefix}{cmdline.db_nm}_{role_hierarchy[0]}_AR", cfg.config['ROLE_OWNER'])
+        model = self.compiled_config().db
+        self.grant_hierarchy(model, model.ar_roles(self.cmdline.db_nm))
             
     def create_sc(self):
-        cfg = self.sc
+        model = self.compiled_config().sc
         config = self.obj_config
         cmdline = self.cmdline
         create_sc = []
@@ -349,27 +377,22 @@ class SfProvisionConfig():
         create_sc.append(";")
         self.objects.append("\n".join(create_sc))
         self.drop_objects.append(f"DROP SCHEMA IF EXISTS {cmdline.db_nm}.{cmdline.sc_nm};")
-        self.owner_grants.append(f"GRANT OWNERSHIP ON SCHEMA {cmdline.db_nm}.{cmdline.sc_nm} TO ROLE {cfg.config['ROLE_OWNER']} REVOKE CURRENT GRANTS;")
-        self.owner_grants.append(f"GRANT ALL PRIVILEGES ON SCHEMA {cmdline.db_nm}.{cmdline.sc_nm} TO ROLE {cfg.config['ROLE_OWNER']};")
+        self.owner_grants.append(f"GRANT OWNERSHIP ON SCHEMA {cmdline.db_nm}.{cmdline.sc_nm} TO ROLE {model.role_owner} REVOKE CURRENT GRANTS;")
+        self.owner_grants.append(f"GRANT ALL PRIVILEGES ON SCHEMA {cmdline.db_nm}.{cmdline.sc_nm} TO ROLE {model.role_owner};")
 
     def create_sc_roles(self):
-        cfg = self.sc
-        cmdline = self.cmdline
-        ar_sc_prefix = cfg.config['AR_PREFIX']
-        for role_type in cfg.config['ROLE_HIERARCHY'][::-1]:
-            ar_role = f"{ar_sc_prefix}{cmdline.db_nm}_{cmdline.sc_nm}_{role_type}_AR"
+        model = self.compiled_config().sc
+        for ar_role in model.ar_roles(self.cmdline.db_nm, self.cmdline.sc_nm)[::-1]:
             self.create_role(ar_role)
 
     def create_sc_grants(self):
-        seen = {}
-        cfg = self.sc
+        compiled = self.compiled_config()
+        model = compiled.sc
         cmdline = self.cmdline
-        ar_sc_prefix = cfg.config['AR_PREFIX']
-        ar_db_prefix = self.db.config['AR_PREFIX']
         once = 1
-        for role_type in cfg.config['ROLE_HIERARCHY'][::-1]:
-            ar_role = f"{ar_sc_prefix}{cmdline.db_nm}_{cmdline.sc_nm}_{role_type}_AR"
-            db_ar_role = f"{ar_db_prefix}{cmdline.db_nm}_{role_type}_AR"
+        for role_type in model.role_hierarchy[::-1]:
+            ar_role = model.ar_role(role_type, cmdline.db_nm, cmdline.sc_nm)
+            db_ar_role = compiled.db.ar_role(role_type, cmdline.db_nm)
             if (once == 1):
                 # One grant at the parent database level is enough for
                 # all the roles inheriting from this role to see the db
@@ -377,34 +400,22 @@ class SfProvisionConfig():
                 self.grant_privilege('USAGE', 'SCHEMA', f"{cmdline.db_nm}.{cmdline.sc_nm}", ar_role)
                 once = 0
             self.grant_r2r(ar_role, db_ar_role)
-            type_grants = cfg.config['ROLE_PERMISSIONS'][role_type]
-            for privilege in type_grants.keys():
-                for object in type_grants[privilege]:
-                    if privilege == 'ALL':
-                        # remove S; materialized/external and skip multiples
-                        sing_obj = sc_map[object]
-                        if sing_obj not in seen.keys():
-                            self.grant_create_privilege(sing_obj, f"ON SCHEMA {cmdline.db_nm}.{cmdline.sc_nm}", ar_role)
-                            seen[sing_obj] = 1
-                    self.grant_privilege_in(privilege, f"ALL {object}", f"{cmdline.db_nm}.{cmdline.sc_nm}", 'ON SCHEMA', ar_role)
-                    self.grant_future_privilege_in(privilege, object, f"{cmdline.db_nm}.{cmdline.sc_nm}", 'ON SCHEMA', ar_role)
+            # The CREATE privileges of this level go right before the first ALL
+            # grant on the objects they create
+            creates = list(model.creates[role_type])
+            for privilege, object in model.expansions[role_type]:
+                if privilege == 'ALL' and sc_map[object] in creates:
+                    creates.remove(sc_map[object])
+                    self.grant_create_privilege(sc_map[object], f"ON SCHEMA {cmdline.db_nm}.{cmdline.sc_nm}", ar_role)
+                self.grant_privilege_in(privilege, f"ALL {object}", f"{cmdline.db_nm}.{cmdline.sc_nm}", 'ON SCHEMA', ar_role)
+                self.grant_future_privilege_in(privilege, object, f"{cmdline.db_nm}.{cmdline.sc_nm}", 'ON SCHEMA', ar_role)
         
     def create_sc_r2r_grants(self):
-        cfg = self.sc
-        cmdline = self.cmdline
-        ar_sc_prefix = cfg.config['AR_PREFIX']
-        role_hierarchy = cfg.config['ROLE_HIERARCHY']
-        hierarchy_length = len(role_hierarchy)
-        hierarchy_length = hierarchy_length - 1;
-        for role_num in range(hierarchy_length)[::-1]:
-            lower_ar_role = f"{ar_sc_prefix}{cmdline.db_nm}_{cmdline.sc_nm}_{role_hierarchy[role_num+1]}_AR"
-            higher_ar_role = f"{ar_sc_prefix}{cmdline.db_nm}_{cmdline.sc_nm}_{role_hierarchy[role_num]}_AR"
-            self.grant_r2r(lower_ar_role, higher_ar_role)
-            # Grant the highest level role to 'ROLE_OWNER'
-        self.grant_r2r(f"{ar_sc_prefix}{cmdline.db_nm}_{cmdline.sc_nm}_{role_hierarchy[0]}_AR", cfg.config['ROLE_OWNER']) 
+        model = self.compiled_config().sc
+        self.grant_hierarchy(model, model.ar_roles(self.cmdline.db_nm, self.cmdline.sc_nm))
             
     def create_wh(self):
-        cfg = self.wh
+        model = self.compiled_config().wh
         config = self.obj_config
         cmdline = self.cmdline
         create_wh = []
@@ -430,52 +441,39 @@ class SfProvisionConfig():
         create_wh.append(";")
         self.objects.append("\n".join(create_wh))
         self.drop_objects.append(f"DROP WAREHOUSE IF EXISTS {cmdline.wh_nm};")
-        self.owner_grants.append(f"GRANT OWNERSHIP ON WAREHOUSE {cmdline.wh_nm} TO ROLE {cfg.config['ROLE_OWNER']} REVOKE CURRENT GRANTS;")
-        self.owner_grants.append(f"GRANT ALL PRIVILEGES ON WAREHOUSE {cmdline.wh_nm} TO ROLE {cfg.config['ROLE_OWNER']};")
+        self.owner_grants.append(f"GRANT OWNERSHIP ON WAREHOUSE {cmdline.wh_nm} TO ROLE {model.role_owner} REVOKE CURRENT GRANTS;")
+        self.owner_grants.append(f"GRANT ALL PRIVILEGES ON WAREHOUSE {cmdline.wh_nm} TO ROLE {model.role_owner};")
 
     def create_wh_roles(self):
-        cfg = self.wh
-        cmdline = self.cmdline
-        ar_wh_prefix = cfg.config['AR_PREFIX']
-        for role_type in cfg.config['ROLE_HIERARCHY'][::-1]:
-            ar_role = f"{ar_wh_prefix}{cmdline.wh_nm}_{role_type}_AR"
+        model = self.compiled_config().wh
+        for ar_role in model.ar_roles(self.cmdline.wh_nm)[::-1]:
             self.create_role(ar_role)
 
     def create_wh_grants(self):
-        cfg = self.wh
+        model = self.compiled_config().wh
         cmdline = self.cmdline
-        ar_wh_prefix = cfg.config['AR_PREFIX']
-        for role_type in cfg.config['ROLE_HIERARCHY'][::-1]:
-            ar_role = f"{ar_wh_prefix}{cmdline.wh_nm}_{role_type}_AR"
-            type_grants = cfg.config['ROLE_PERMISSIONS'][role_type]
-            for privilege in type_grants.keys():
-                for object in type_grants[privilege]:
-                    self.grant_privilege(privilege, object, cmdline.wh_nm, ar_role)
+        for role_type in model.role_hierarchy[::-1]:
+            ar_role = model.ar_role(role_type, cmdline.wh_nm)
+            for privilege, object in model.expansions[role_type]:
+                self.grant_privilege(privilege, object, cmdline.wh_nm, ar_role)
         
     def create_wh_r2r_grants(self):
-        cfg = self.wh
-        cmdline = self.cmdline
-        ar_wh_prefix = cfg.config['AR_PREFIX']
-        role_hierarchy = cfg.config['ROLE_HIERARCHY']
-        hierarchy_length = len(role_hierarchy)
-        hierarchy_length = hierarchy_length - 1;
-        for role_num in range(hierarchy_length)[::-1]:
-            lower_ar_role = f"{ar_wh_prefix}{cmdline.wh_nm}_{role_hierarchy[role_num+1]}_AR"
-            higher_ar_role = f"{ar_wh_prefix}{cmdline.wh_nm}_{role_hierarchy[role_num]}_AR"
-            self.grant_r2r(lower_ar_role, higher_ar_role)
-        # Grant the highest level role to 'ROLE_OWNER'
-        self.grant_r2r(f"{ar_wh_prefix}{cmdline.wh_nm}_{role_hierarchy[0]}_AR", cfg.config['ROLE_OWNER'])
+        model = self.compiled_config().wh
+        self.grant_hierarchy(model, model.ar_roles(self.cmdline.wh_nm))
         
     def create_role(self, role):
         self.objects.append(f"CREATE ROLE IF NOT EXISTS {role};")
-        if self.cmdline.type == 'database':
-            self.owner_grants.append(f"GRANT OWNERSHIP ON ROLE {role} TO ROLE {self.db.config['ROLE_OWNER']} REVOKE CURRENT GRANTS;")
-        elif self.cmdline.type == 'schema':
-            self.owner_grants.append(f"GRANT OWNERSHIP ON ROLE {role} TO ROLE {self.sc.config['ROLE_OWNER']} REVOKE CURRENT GRANTS;")
-        elif self.cmdline.type == 'warehouse':
-            self.owner_grants.append(f"GRANT OWNERSHIP ON ROLE {role} TO ROLE {self.wh.config['ROLE_OWNER']} REVOKE CURRENT GRANTS;")
+        self.owner_grants.append(f"GRANT OWNERSHIP ON ROLE {role} TO ROLE {self.obj_model().role_owner} REVOKE CURRENT GRANTS;")
         self.drop_objects.append(f"DROP ROLE IF EXISTS {role};")
 
+    def grant_hierarchy(self, model, ar_roles):
+        # ar_roles are ordered like the ROLE_HIERARCHY, highest level first.
+        # Each level is granted to the level above it, bottom up, and the
+        # highest level to the ROLE_OWNER
+        for role_num in range(len(ar_roles) - 1)[::-1]:
+            self.grant_r2r(ar_roles[role_num+1], ar_roles[role_num])
+        self.grant_r2r(ar_roles[0], model.role_owner)
+
     def grant_r2r(self, l_ar, h_ar):
         self.role_grants.append(f"GRANT ROLE {l_ar} TO ROLE {h_ar};")
         self.revoke_role_grants.append(f"REVOKE ROLE {l_ar} FROM ROLE {h_ar};")
@@ -500,6 +498,71 @@ class SfProvisionConfig():
         self.obj_grants.append(f"GRANT CREATE {obj} {in_obj} TO ROLE {role};")
         self.revoke_obj_grants.append(f"REVOKE CREATE {obj} {in_obj} FROM ROLE {role};")
 
+    def compact_grants(self):
+        """Merges object grants on the same target to the same role into a single
+           statement (SELECT + REFERENCES on FUTURE VIEWS, all CREATE <object>
+           privileges on a schema, ...) and drops duplicates. ALL supersedes the
+           other privileges on the same target. The revokes are rebuilt from the
+           compacted grants so the two stay symmetrical."""
+        groups = {}
+        order  = []
+        for grant, revoke in zip(self.obj_grants, self.revoke_obj_grants):
+            match = grant_re.match(grant)
+            if not match or match.group('suffix') is not None:
+                # Keep anything we can't interpret as is
+                if grant not in groups:
+                    groups[grant] = (grant, revoke)
+                    order.append(grant)
+                continue
+            key = (match.group('target'), match.group('role'))
+            if key not in groups:
+                groups[key] = []
+                order.append(key)
+            for priv in split_privileges(match.group('privs')):
+                if priv not in groups[key]:
+                    groups[key].append(priv)
+        obj_grants = []
+        revoke_obj_grants = []
+        for key in order:
+            if type(key) is str:
+                grant, revoke = groups[key]
+                obj_grants.append(grant)
+                revoke_obj_grants.append(revoke)
+                continue
+            target, role = key
+            privileges = groups[key]
+            if 'ALL' in privileges:
+                privileges = ['ALL']
+            privs = ', '.join(privileges)
+            obj_grants.append(f"GRANT {privs} ON {target} TO ROLE {role};")
+            revoke_obj_grants.append(f"REVOKE {privs} ON {target} FROM ROLE {role};")
+        self.obj_grants = obj_grants
+        self.revoke_obj_grants = revoke_obj_grants
+
+    def create_phases(self):
+        # Ownership has to be transferred (REVOKE CURRENT GRANTS) before the owner
+        # is granted privileges on the same object, so owner grants run in two phases
+        ownership  = [grant for grant in self.owner_grants if grant.startswith('GRANT OWNERSHIP ')]
+        privileges = [grant for grant in self.owner_grants if not grant.startswith('GRANT OWNERSHIP ')]
+        return [ ('objects', self.objects),
+                 ('owner_grants', ownership),
+                 ('owner_privileges', privileges),
+                 ('role_grants', self.role_grants),
+                 ('obj_grants', self.obj_grants) ]
+
+    def drop_phases(self):
+        return [ ('revoke_obj_grants', self.revoke_obj_grants[::-1]),
+                 ('revoke_role_grants', self.revoke_role_grants[::-1]),
+                 ('drop_objects', self.drop_objects[::-1]) ]
+
+    def print_phases(self, phases):
+        for phase, statements in phases:
+            if len(statements) == 0:
+                continue
+            for statement in statements:
+                print(statement)
+            print()
+
     def print_create(self):
         for obj in self.objects:
             print(obj)
@@ -0,0 +1,258 @@
+import re
+from sfbackend import programming_error
+from sfprovisionconfig import grant_re, split_privileges
+
+# Statements generated by SfProvisionConfig
+create_re = re.compile(r'^CREATE (?:TRANSIENT )?(?P<type>DATABASE|SCHEMA|WAREHOUSE|ROLE) IF NOT EXISTS (?P<name>[^\s;]+)')
+r2r_re    = re.compile(r'^GRANT ROLE (?P<role>\S+) TO ROLE (?P<grantee>\S+);$')
+# Targets of a grant
+future_re = re.compile(r'^FUTURE (?P<objs>.+?) (?:ON|IN) (?P<ctype>SCHEMA|DATABASE) (?P<cname>\S+)$')
+all_re    = re.compile(r'^ALL (?P<objs>.+?) (?:ON|IN) (?P<ctype>SCHEMA|DATABASE) (?P<cname>\S+)$')
+obj_re    = re.compile(r'^(?P<type>DATABASE|SCHEMA|WAREHOUSE|ROLE) (?P<name>\S+)$')
+
+# Privileges a grant of ALL gives on each object type
+all_privileges = {
+    'DATABASE':          { 'USAGE', 'MONITOR', 'MODIFY', 'CREATE SCHEMA' },
+    'SCHEMA':            { 'USAGE', 'MONITOR', 'MODIFY', 'CREATE TABLE', 'CREATE EXTERNAL TABLE', 'CREATE VIEW',
+                           'CREATE MATERIALIZED VIEW', 'CREATE FILE FORMAT', 'CREATE STAGE', 'CREATE STREAM',
+                           'CREATE SEQUENCE', 'CREATE FUNCTION', 'CREATE PROCEDURE', 'CREATE TASK', 'CREATE PIPE' },
+    'WAREHOUSE':         { 'USAGE', 'MONITOR', 'MODIFY', 'OPERATE' },
+    'TABLE':             { 'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'TRUNCATE', 'REFERENCES' },
+    'EXTERNAL TABLE':    { 'SELECT', 'REFERENCES' },
+    'VIEW':              { 'SELECT', 'REFERENCES' },
+    'MATERIALIZED VIEW': { 'SELECT', 'REFERENCES' },
+    'FILE FORMAT':       { 'USAGE' },
+    'STAGE':             { 'READ', 'WRITE' },
+    'STREAM':            { 'SELECT' },
+    'SEQUENCE':          { 'USAGE' },
+    'FUNCTION':          { 'USAGE' },
+    'PROCEDURE':         { 'USAGE' },
+    'TASK':              { 'MONITOR', 'OPERATE' }
+}
+
+def singular(objs):
+    # TABLES -> TABLE, FILE FORMATS -> FILE FORMAT, MATERIALIZED VIEWS -> MATERIALIZED VIEW
+    objs = ' '.join(objs.replace('_', ' ').split()).upper()
+    if objs.endswith('S'):
+        return objs[:-1]
+    return objs
+
+class SfProvisionDiff():
+    """SfProvisionDiff snapshots the current state of the object being provisioned
+       with a handful of SHOW commands, indexes it in memory and filters the
+       statements generated by SfProvisionConfig down to the ones that are missing.
+       Grants on the object held by its access roles that are not in the
+       configuration are reported as revokes.
+
+       A grant of ALL is present when the grantee owns the target or holds
+       every privilege ALL gives on its type (SHOW lists the expanded
+       privileges). GRANT ... ON ALL <objects> is always kept: SHOW does not
+       tell whether every existing object has the privilege and the grant is
+       idempotent."""
+
+    def __init__(self, prov_cfg, sf_conn, logger):
+        self.prov_cfg = prov_cfg
+        self.sf_conn  = sf_conn
+        self.logger   = logger
+        # (type, name) -> owner
+        self.objects  = {}
+        # role name -> owner
+        self.roles    = {}
+        # (type, name, grantee) -> set of privileges
+        self.grants   = {}
+        # (object type, container type, container name, grantee) -> set of privileges
+        self.future   = {}
+        # set of (role, grantee)
+        self.role_grants = set()
+        self.managed  = set()
+        self.desired_grants = {}
+        self.desired_future = {}
+        self.desired_role_grants = set()
+
+    def show(self, query):
+        """Runs a SHOW command and returns the rows as dictionaries keyed by
+           lower case column name. Objects that do not exist yet return no rows."""
+        rows = []
+        try:
+            cursor = self.sf_conn.run_query(query)
+            columns = [col[0].lower() for col in cursor.description]
+            for row in cursor:
+                rows.append(dict(zip(columns, row)))
+            cursor.close()
+        except programming_error() as e:
+            self.logger.debug(f"{query} returned no state: {e}")
+        return rows
+
+    def snapshot(self):
+        cmdline = self.prov_cfg.cmdline
+        compiled = self.prov_cfg.compiled_config()
+        for obj in self.prov_cfg.objects:
+            match = create_re.match(obj)
+            if match and match.group('type') == 'ROLE':
+                self.managed.add(match.group('name').upper())
+        if cmdline.type == 'database':
+            prefix = f"{compiled.db.ar_prefix}{cmdline.db_nm}_"
+            self.snapshot_object('DATABASE', cmdline.db_nm, f"SHOW DATABASES LIKE '{cmdline.db_nm}'")
+            self.snapshot_grants('DATABASE', cmdline.db_nm)
+            self.snapshot_future('DATABASE', cmdline.db_nm)
+        elif cmdline.type == 'schema':
+            prefix = f"{compiled.sc.ar_prefix}{cmdline.db_nm}_{cmdline.sc_nm}_"
+            self.snapshot_object('SCHEMA', f"{cmdline.db_nm}.{cmdline.sc_nm}", f"SHOW SCHEMAS LIKE '{cmdline.sc_nm}' IN DATABASE {cmdline.db_nm}", cmdline.sc_nm)
+            self.snapshot_grants('DATABASE', cmdline.db_nm)
+            self.snapshot_grants('SCHEMA', f"{cmdline.db_nm}.{cmdline.sc_nm}")
+            self.snapshot_future('SCHEMA', f"{cmdline.db_nm}.{cmdline.sc_nm}")
+        elif cmdline.type == 'warehouse':
+            prefix = f"{compiled.wh.ar_prefix}{cmdline.wh_nm}_"
+            self.snapshot_object('WAREHOUSE', cmdline.wh_nm, f"SHOW WAREHOUSES LIKE '{cmdline.wh_nm}'")
+            self.snapshot_grants('WAREHOUSE', cmdline.wh_nm)
+        for row in self.show(f"SHOW ROLES LIKE '{prefix}%'"):
+            self.roles[row['name'].upper()] = row['owner']
+        for role in sorted(self.managed):
+            if role not in self.roles:
+                continue
+            for row in self.show(f"SHOW GRANTS OF ROLE {role}"):
+                if row['granted_to'] == 'ROLE':
+                    self.role_grants.add((role, row['grantee_name'].upper()))
+        self.logger.info(f"Snapshot: {len(self.roles)} roles, {len(self.grants)} grants, {len(self.future)} future grants, {len(self.role_grants)} role grants")
+
+    def snapshot_object(self, obj_type, name, query, short_name=None):
+        if short_name is None:
+            short_name = name
+        for row in self.show(query):
+            if row['name'].upper() == short_name:
+                self.objects[(obj_type, name)] = row['owner']
+
+    def snapshot_grants(self, obj_type, name):
+        for row in self.show(f"SHOW GRANTS ON {obj_type} {name}"):
+            if row['granted_to'] != 'ROLE':
+                continue
+            key = (obj_type, name, row['grantee_name'].upper())
+            self.grants.setdefault(key, set()).add(row['privilege'].upper())
+
+    def snapshot_future(self, container_type, container):
+        for row in self.show(f"SHOW FUTURE GRANTS IN {container_type} {container}"):
+            if row['grant_to'] != 'ROLE':
+                continue
+            key = (singular(row['grant_on']), container_type, container, row['grantee_name'].upper())
+            self.future.setdefault(key, set()).add(row['privilege'].upper())
+
+    def missing(self, obj_type, held, privileges):
+        if privileges == ['ALL']:
+            if 'ALL' in held or 'OWNERSHIP' in held:
+                return []
+            if obj_type in all_privileges and all_privileges[obj_type] <= held:
+                return []
+            return privileges
+        return [priv for priv in privileges if priv not in held]
+
+    def delta_statement(self, statement):
+        """Returns the statement reduced to what is missing, or None if nothing is missing.
+           Statements that cannot be interpreted are always returned."""
+        match = create_re.match(statement)
+        if match:
+            obj_type, name = match.group('type'), match.group('name').upper()
+            if obj_type == 'ROLE':
+                if name in self.roles:
+                    return None
+            elif (obj_type, name) in self.objects:
+                return None
+            return statement
+        match = r2r_re.match(statement)
+        if match:
+            key = (match.group('role').upper(), match.group('grantee').upper())
+            self.desired_role_grants.add(key)
+            if key in self.role_grants:
+                return None
+            return statement
+        match = grant_re.match(statement)
+        if not match:
+            return statement
+        privileges = split_privileges(match.group('privs'))
+        target = match.group('target')
+        grantee = match.group('role').upper()
+        if privileges == ['OWNERSHIP']:
+            obj_match = obj_re.match(target)
+            if obj_match:
+                obj_type, name = obj_match.group('type'), obj_match.group('name').upper()
+                if obj_type == 'ROLE':
+                    owner = self.roles.get(name)
+                else:
+                    owner = self.objects.get((obj_type, name))
+                if owner is not None and owner.upper() == grantee:
+                    return None
+            return statement
+        if all_re.match(target):
+            return statement
+        future_match = future_re.match(target)
+        obj_match = obj_re.match(target)
+        if future_match:
+            key = (singular(future_match.group('objs')), future_match.group('ctype'), future_match.group('cname').upper(), grantee)
+            self.desired_future.setdefault(key, set()).update(privileges)
+            missing = self.missing(key[0], self.future.get(key, set()), privileges)
+        elif obj_match:
+            key = (obj_match.group('type'), obj_match.group('name').upper(), grantee)
+            self.desired_grants.setdefault(key, set()).update(privileges)
+            missing = self.missing(key[0], self.grants.get(key, set()), privileges)
+        else:
+            return statement
+        if len(missing) == 0:
+            return None
+        if len(missing) == len(privileges):
+            return statement
+        return f"GRANT {', '.join(missing)} ON {target} TO ROLE {match.group('role')};"
+
+    def delta_phases(self, phases):
+        delta = []
+        total = 0
+        kept  = 0
+        for phase, statements in phases:
+            phase_delta = []
+            for statement in statements:
+                total += 1
+                stmt = self.delta_statement(statement)
+                if stmt is not None:
+                    phase_delta.append(stmt)
+            kept += len(phase_delta)
+            delta.append((phase, phase_delta))
+        self.logger.info(f"Diff: {kept} of {total} statements needed")
+        return delta
+
+    def revokes(self):
+        """Grants held by the access roles being provisioned that are not in the
+           configuration. Only valid after delta_phases() has been called. Role
+           grants to functional roles are left alone as sf_funcrole manages them."""
+        revokes = []
+        for key in sorted(self.grants):
+            obj_type, name, grantee = key
+            if grantee not in self.managed:
+                continue
+            desired = self.desired_grants.get(key, set())
+            if 'ALL' in desired:
+                continue
+            for priv in sorted(self.grants[key] - desired - {'OWNERSHIP'}):
+                revokes.append(f"REVOKE {priv} ON {obj_type} {name} FROM ROLE {grantee};")
+        for key in sorted(self.future):
+            obj_type, container_type, container, grantee = key
+            if grantee not in self.managed:
+                continue
+            desired = self.desired_future.get(key, set())
+            if 'ALL' in desired:
+                continue
+            for priv in sorted(self.future[key] - desired - {'OWNERSHIP'}):
+                revokes.append(f"REVOKE {priv} ON FUTURE {obj_type}S IN {container_type} {container} FROM ROLE {grantee};")
+        for role, grantee in sorted(self.role_grants):
+            if not grantee.endswith('_AR'):
+                continue
+            if (role, grantee) not in self.desired_role_grants:
+                revokes.append(f"REVOKE ROLE {role} FROM ROLE {grantee};")
+        return revokes
+
+    def print_revokes(self, revokes):
+        # Printed as comments so the output can still be piped into a client
+        # without revoking anything that was not reviewed
+        if len(revokes) == 0:
+            return
+        print("-- Grants not in the configuration:")
+        for revoke in revokes:
+            print(f"-- {revoke}")
+        print()
@@ -0,0 +1,220 @@
+import json
+import os
+from datetime import datetime
+
+cache_dir = os.path.join(os.path.expanduser("~"), '.snowflake', 'cache')
+
+# account_usage.grants_to_roles can show rows up to a couple of hours after the
+# grant was made, so an incremental refresh re-reads this window before the
+# watermark. Applying a grant twice is harmless.
+refresh_overlap_hours = 3
+
+role_grants_sql = """select grantee_name, name, greatest(created_on, coalesce(deleted_on, created_on)) as changed_on, deleted_on is not null as deleted
+  from snowflake.account_usage.grants_to_roles
+ where granted_on = 'ROLE' and privilege = 'USAGE'"""
+
+def default_cache_file(account):
+    return os.path.join(cache_dir, f"rolegraph-{account}.json")
+
+class SfRoleGraph():
+    """SfRoleGraph holds every role to role grant of the account as adjacency
+       lists of integer role ids. A role reaches the roles granted to it and,
+       transitively, everything granted to those. Closures are computed once
+       per role and memoized until the graph changes.
+
+       The graph is loaded with a single query against
+       snowflake.account_usage.grants_to_roles and, when a cache file is
+       given, persisted there with a watermark so the next run only pulls the
+       grants and revokes made since. With an SfSnapshot the grants are read
+       from the local snapshot instead."""
+
+    def __init__(self, sf_conn, logger, cache_file=None, snapshot=None):
+        self.sf_conn    = sf_conn
+        self.logger     = logger
+        self.cache_file = cache_file
+        self.snapshot   = snapshot
+        self.watermark  = None
+        self.loaded     = False
+        self.clear()
+
+    def clear(self):
+        # role name -> id and id -> role name
+        self.ids      = {}
+        self.names    = []
+        # id -> list of ids granted to the role
+        self.granted  = []
+        # id -> list of ids the role is granted to
+        self.grantees = []
+        self.reach_memo = {}
+        self.who_memo   = {}
+
+    def role_id(self, name):
+        role_id = self.ids.get(name)
+        if role_id is None:
+            role_id = len(self.names)
+            self.ids[name] = role_id
+            self.names.append(name)
+            self.granted.append([])
+            self.grantees.append([])
+        return role_id
+
+    def add_grant(self, grantee, role):
+        grantee_id = self.role_id(grantee)
+        role_id = self.role_id(role)
+        if role_id not in self.granted[grantee_id]:
+            self.granted[grantee_id].append(role_id)
+            self.grantees[role_id].append(grantee_id)
+
+    def remove_grant(self, grantee, role):
+        grantee_id = self.ids.get(grantee)
+        role_id = self.ids.get(role)
+        if grantee_id is None or role_id is None:
+            return
+        if role_id in self.granted[grantee_id]:
+            self.granted[grantee_id].remove(role_id)
+            self.grantees[role_id].remove(grantee_id)
+
+    def set_granted_roles(self, grantee, roles):
+        """Replaces the roles granted directly to grantee, e.g. with the live
+           state read through SHOW GRANTS TO ROLE"""
+        self.load()
+        for role in self.granted_roles(grantee) - set(roles):
+            self.remove_grant(grantee, role)
+        for role in roles:
+            self.add_grant(grantee, role)
+        self.reach_memo = {}
+        self.who_memo   = {}
+
+    def apply_rows(self, rows):
+        """Applies (grantee, role, changed_on, deleted) rows in the order the changes were made"""
+        for grantee, role, changed_on, deleted in sorted(rows, key=lambda row: row[2]):
+            if deleted:
+                self.remove_grant(grantee, role)
+            else:
+                self.add_grant(grantee, role)
+            if self.watermark is None or changed_on > self.watermark:
+                self.watermark = changed_on
+        self.reach_memo = {}
+        self.who_memo   = {}
+
+    def fetch(self, query):
+        cursor = self.sf_conn.run_query(query)
+        rows = cursor.fetchall()
+        cursor.close()
+        return rows
+
+    def refresh(self, full=False):
+        if self.snapshot is not None:
+            self.clear()
+            for grantee, role in self.snapshot.role_grants():
+                self.add_grant(grantee, role)
+            self.loaded = True
+            self.logger.info(f"Role graph: {len(self.names)} roles from snapshot {self.snapshot.filename}")
+            return
+        if full is False and self.loaded is False:
+            self.load_cache()
+        if full is True or self.watermark is None:
+            self.clear()
+            self.watermark = None
+            rows = self.fetch(role_grants_sql + " and deleted_on is null")
+            self.logger.info(f"Role graph: loaded {len(rows)} role grants")
+        else:
+            rows = self.fetch(role_grants_sql + f"\n   and changed_on >= dateadd(hour, -{refresh_overlap_hours}, '{self.watermark.isoformat()}'::timestamp_ltz)")
+            self.logger.info(f"Role graph: {len(rows)} role grants changed since {self.watermark.isoformat()}")
+        self.apply_rows(rows)
+        self.loaded = True
+        self.save_cache()
+
+    def load(self):
+        if self.loaded is False:
+            self.refresh()
+
+    def load_cache(self):
+        if self.cache_file is None or not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, 'r') as fobj:
+                cache = json.load(fobj)
+            self.clear()
+            for name in cache['roles']:
+                self.role_id(name)
+            for grantee_id, role_id in cache['grants']:
+                self.granted[grantee_id].append(role_id)
+                self.grantees[role_id].append(grantee_id)
+            self.watermark = None
+            if cache['watermark'] is not None:
+                self.watermark = datetime.fromisoformat(cache['watermark'])
+        except (OSError, ValueError, KeyError, IndexError) as e:
+            self.logger.warning(f"Ignoring unreadable role graph cache {self.cache_file}: {e}")
+            self.clear()
+            self.watermark = None
+            return
+        self.logger.debug(f"Role graph: {len(self.names)} roles from {self.cache_file}")
+
+    def save_cache(self):
+        if self.cache_file is None:
+            return
+        cache = {
+            'watermark': None if self.watermark is None else self.watermark.isoformat(),
+            'roles':     self.names,
+            'grants':    [ [grantee_id, role_id] for grantee_id in range(len(self.names)) for role_id in self.granted[grantee_id] ]
+        }
+        try:
+            os.makedirs(os.path.dirname(self.cache_file), 0o700, exist_ok=True)
+            tmp_file = self.cache_file + f".{os.getpid()}"
+            with open(tmp_file, 'w') as fobj:
+                json.dump(cache, fobj)
+            os.replace(tmp_file, self.cache_file)
+        except OSError as e:
+            self.logger.warning(f"Unable to save role graph cache {self.cache_file}: {e}")
+
+    def closure(self, role_id, edges, memo):
+        if role_id in memo:
+            return memo[role_id]
+        seen = set()
+        stack = list(edges[role_id])
+        while stack:
+            next_id = stack.pop()
+            if next_id in seen:
+                continue
+            if next_id in memo:
+                # Everything below has been computed already
+                seen.add(next_id)
+                seen |= memo[next_id]
+                continue
+            seen.add(next_id)
+            stack.extend(edges[next_id])
+        seen.discard(role_id)
+        memo[role_id] = frozenset(seen)
+        return memo[role_id]
+
+    def exists(self, name):
+        self.load()
+        return name in self.ids
+
+    def granted_roles(self, name):
+        """Roles granted directly to the role"""
+        self.load()
+        if name not in self.ids:
+            return set()
+        return set(self.names[role_id] for role_id in self.granted[self.ids[name]])
+
+    def reachable(self, name):
+        """Every role the role has the privileges of - directly or inherited"""
+        self.load()
+        if name not in self.ids:
+            return set()
+        return set(self.names[role_id] for role_id in self.closure(self.ids[name], self.granted, self.reach_memo))
+
+    def who_can_reach(self, name):
+        """Every role that has the privileges of the role - directly or inherited"""
+        self.load()
+        if name not in self.ids:
+            return set()
+        return set(self.names[role_id] for role_id in self.closure(self.ids[name], self.grantees, self.who_memo))
+
+    def can_reach(self, grantee, role):
+        self.load()
+        if grantee not in self.ids or role not in self.ids:
+            return False
+        return self.ids[role] in self.closure(self.ids[grantee], self.granted, self.reach_memo)
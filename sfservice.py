@@ -0,0 +1,291 @@
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from sfapply import SfApply
+from sfclone import SfClone
+from sfconfig import SfConfig
+from sfconnpool import SfConnPool
+from sfexport import expand_db_sc, has_pattern, make_export
+from sffuncrole import SfFuncRole
+from sfgrantindex import SfGrantIndex
+from sfprovisionconfig import SfProvisionConfig
+from sfrolegraph import SfRoleGraph, default_cache_file
+from sftieout import SfTieout
+from sfvalidator import SfValidator
+
+# Jobs answered by the service itself instead of the scheduler
+control_jobs = [ 'status', 'shutdown' ]
+
+class SfServiceHandler(socketserver.StreamRequestHandler):
+    """One request per connection: a JSON line {"job": ..., "args": {...}}
+       answered by a JSON line {"status", "result", "error", "elapsed_ms"}"""
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            request = json.loads(line)
+            response = self.server.service.submit(request.get('job'), request.get('args', {}))
+        except ValueError as e:
+            response = { 'status': 'error', 'result': None, 'error': f"Invalid request: {e}", 'elapsed_ms': 0 }
+        self.wfile.write((json.dumps(response, default=str) + '\n').encode())
+
+class SfServiceServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+class SfService():
+    """SfService is a local daemon holding warm Snowflake sessions and the
+       grant index between jobs. Jobs (export, clone, tieout, funcrole) are
+       accepted over a Unix socket and run by a scheduler of max_workers
+       threads. Every warehouse has its own SfConnPool and admission gate, so
+       the number of sessions - and jobs - running on a warehouse at once is
+       capped by
+       "service": { "warehouse_limits": { "<WH>": N }, "default_limit": N }
+       in config.json. Jobs wait at the gate of their warehouse before they
+       take a scheduler thread, so a backlog on one warehouse never holds up
+       jobs for the others. A session is reset to the configured role,
+       database and schema after every job.
+
+       Paths in job arguments should be absolute, the service does not know
+       the working directory of the client. Funcrole jobs use the
+       provisioning configuration of the directory the service runs in."""
+
+    def __init__(self, config, logger, socket_path, max_workers=8):
+        service_cfg           = config.get('service', {})
+        self.config           = config
+        self.logger           = logger
+        self.socket_path      = os.path.abspath(socket_path)
+        self.warehouse_limits = service_cfg.get('warehouse_limits', {})
+        self.default_limit    = service_cfg.get('default_limit', 2)
+        # The grant index is reloaded when it is older than this
+        self.grant_index_seconds = service_cfg.get('grant_index_seconds', 300)
+        self.executor         = ThreadPoolExecutor(max_workers=max_workers)
+        self.lock             = threading.Lock()
+        self.grant_lock       = threading.Lock()
+        self.pools            = {}
+        self.gates            = {}
+        self.grant_index      = None
+        self.grant_index_loaded = None
+        self.sf_val           = SfValidator()
+        self.jobs_run         = 0
+        self.server           = None
+        self.jobs = {
+            'export':   self.run_export,
+            'clone':    self.run_clone,
+            'tieout':   self.run_tieout,
+            'funcrole': self.run_funcrole,
+            'status':   self.run_status,
+            'shutdown': self.run_shutdown
+        }
+
+    def pool(self, warehouse=None):
+        if warehouse is None:
+            warehouse = self.config['warehouse']
+        with self.lock:
+            if warehouse not in self.pools:
+                limit = self.warehouse_limits.get(warehouse, self.default_limit)
+                self.logger.info(f"Creating session pool for warehouse {warehouse} with limit {limit}")
+                self.pools[warehouse] = SfConnPool(dict(self.config, warehouse=warehouse), self.logger, max_size=limit)
+            return self.pools[warehouse]
+
+    def gate(self, warehouse=None):
+        """Semaphore admitting as many jobs of the warehouse to the scheduler
+           as its pool has sessions"""
+        if warehouse is None:
+            warehouse = self.config['warehouse']
+        with self.lock:
+            if warehouse not in self.gates:
+                self.gates[warehouse] = threading.BoundedSemaphore(self.warehouse_limits.get(warehouse, self.default_limit))
+            return self.gates[warehouse]
+
+    @contextmanager
+    def session(self, args):
+        with self.pool(args.get('warehouse')).session() as sf_conn:
+            try:
+                yield sf_conn
+            finally:
+                sf_conn.reset_session()
+
+    def submit(self, job, args):
+        if job not in self.jobs:
+            return { 'status': 'error', 'result': None, 'error': f"Unknown job {job} - expected one of {', '.join(self.jobs)}", 'elapsed_ms': 0 }
+        if job in control_jobs:
+            return self.run_job(job, args)
+        # Waits in the connection's own thread, a scheduler thread only runs a
+        # job that can get a session of its warehouse right away
+        with self.gate(args.get('warehouse')):
+            return self.executor.submit(self.run_job, job, args).result()
+
+    def run_job(self, job, args):
+        response = { 'status': 'ok', 'result': None, 'error': None }
+        start = time.perf_counter()
+        self.logger.info(f"Running {job} job: {args}")
+        try:
+            response['result'] = self.jobs[job](args)
+        except SystemExit as e:
+            # The service keeps running and the pool frees the session of a job that exits
+            response['status'] = 'error'
+            response['error'] = f"{job} job exited with {e.code}"
+        except Exception as e:
+            response['status'] = 'error'
+            response['error'] = f"{job} job failed: {e}"
+        response['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 1)
+        if response['status'] == 'error':
+            self.logger.error(response['error'])
+        else:
+            self.logger.info(f"{job} job done in {response['elapsed_ms']} ms")
+        with self.lock:
+            self.jobs_run += 1
+        return response
+
+    def run_export(self, args):
+        with self.session(args) as sf_conn:
+            db_sc = args.get('database_schema')
+            if args.get('all', False):
+                db_sc = sf_conn.list_db_sc(args.get('refresh', False))
+            elif has_pattern(db_sc):
+                db_sc = expand_db_sc(db_sc, sf_conn.list_db_sc(args.get('refresh', False)), self.logger)
+            sf_export = make_export(sf_conn, self.logger, args['export_dir'], args.get('format', 'files'), args.get('delete', False),
+                                    args.get('journal'), args.get('retries', 3), args.get('store_dir'), args.get('compress', False))
+            return sf_export.export(db_sc, args.get('resume', False))
+
+    def run_clone(self, args):
+        with self.session(args) as sf_conn:
+            sf_clone = SfClone(sf_conn, self.logger, args.get('dryrun', False))
+            if args['type'] == 'init':
+                return sf_clone.init(args['owner_role'], args['clone_role'], args['from_db_nm'], args['from_sc_nm'],
+                                     args['to_db_nm'], args['to_sc_nm'], args.get('delete_existing', False))
+            if args['type'] == 'refresh':
+                return sf_clone.refresh(args['owner_role'], args['clone_role'], args['from_db_nm'], args['from_sc_nm'],
+                                        args['to_db_nm'], args['to_sc_nm'])
+            if args['type'] == 'remove':
+                return sf_clone.remove(args['owner_role'], args['from_db_nm'], args['from_sc_nm'], args['to_db_nm'], args['to_sc_nm'])
+            raise ValueError(f"Unknown clone type {args['type']}")
+
+    def run_tieout(self, args):
+        yaml_cfg = SfConfig(args['yaml'], 'yaml')
+        target = args['target']
+        if target not in yaml_cfg.config:
+            raise ValueError(f"{target} not a target in yaml file: {args['yaml']}")
+        with self.session(args) as sf_conn:
+            sf_tieout = SfTieout(sf_conn, self.logger, self.sf_val, args.get('case_insensitive', False),
+                                 args.get('treat_null_as_blank', False), args.get('detect_duplicate_key', False))
+            return sf_tieout.run_target(yaml_cfg.config[target], target)
+
+    def load_grant_index(self, sf_conn):
+        with self.grant_lock:
+            if self.grant_index is None or time.monotonic() - self.grant_index_loaded > self.grant_index_seconds:
+                role_graph = SfRoleGraph(sf_conn, self.logger, default_cache_file(sf_conn.account))
+                grant_index = SfGrantIndex(sf_conn, self.logger, role_graph)
+                grant_index.load()
+                self.grant_index = grant_index
+                self.grant_index_loaded = time.monotonic()
+            return self.grant_index
+
+    def run_funcrole(self, args):
+        # Re-read for every job - unchanged configuration comes from the compiled cache
+        prov_cfg = SfProvisionConfig()
+        prov_cfg.validate_config()
+        froles = args.get('roles')
+        if froles is None:
+            froles = list(prov_cfg.fr.config)
+        for frole in froles:
+            if frole not in prov_cfg.fr.config:
+                raise ValueError(f"Role {frole} not in configuration file: {prov_cfg.fr.filename}")
+        apply = args.get('apply', False)
+        with self.session(args) as sf_conn:
+            func_role = SfFuncRole(prov_cfg, sf_conn, self.logger, self.load_grant_index(sf_conn))
+            # Applied deltas are computed against the live grants of the roles,
+            # which also brings the shared index up to date for them
+            with self.grant_lock:
+                deltas = [ func_role.role_delta(frole, live=apply) for frole in froles ]
+            result = { 'roles': [ dict(delta.to_dict(), statements=delta.statements()) for delta in deltas ] }
+            if apply is False:
+                return result
+            sf_apply = SfApply(sf_conn, self.logger, max_workers=args.get('max_workers', 8))
+            results = sf_apply.run_chains([ (delta.role, delta.statements()) for delta in deltas if not delta.is_empty() ])
+            for entry in result['roles']:
+                entry['results'] = results.get(entry['role'], [])
+            # account_usage will not show the applied grants for hours, keep
+            # the index in sync with what was applied instead of reloading it
+            with self.grant_lock:
+                for delta in deltas:
+                    func_role.record_applied(delta, results.get(delta.role, []))
+            return result
+
+    def run_status(self, args):
+        with self.lock:
+            pools = { warehouse: { 'sessions': pool.size, 'opened': pool.opened, 'limit': pool.max_size }
+                      for warehouse, pool in self.pools.items() }
+            return { 'pid': os.getpid(), 'jobs_run': self.jobs_run, 'pools': pools,
+                     'grant_index_loaded': self.grant_index is not None }
+
+    def run_shutdown(self, args):
+        # shutdown() waits for serve_forever to return, which cannot happen in this thread
+        threading.Thread(target=self.server.shutdown).start()
+        return 'Shutting down'
+
+    def serve(self):
+        if os.path.exists(self.socket_path):
+            try:
+                SfServiceClient(self.socket_path).submit('status')
+                raise ValueError(f"A service is already listening on {self.socket_path}")
+            except OSError:
+                self.logger.warning(f"Removing stale socket {self.socket_path}")
+                os.remove(self.socket_path)
+        self.server = SfServiceServer(self.socket_path, SfServiceHandler)
+        self.server.service = self
+        os.chmod(self.socket_path, 0o600)
+        self.logger.info(f"Listening on {self.socket_path}")
+        try:
+            self.server.serve_forever()
+        finally:
+            self.close()
+
+    def close(self):
+        if self.server is not None:
+            self.server.server_close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+        self.executor.shutdown(wait=True)
+        with self.lock:
+            pools = list(self.pools.values())
+        for pool in pools:
+            pool.close()
+
+class SfServiceClient():
+    """SfServiceClient submits a job to an SfService and waits for its response"""
+
+    def __init__(self, socket_path, timeout=None):
+        self.socket_path = socket_path
+        self.timeout     = timeout
+
+    def submit(self, job, args={}):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            sock.sendall((json.dumps({ 'job': job, 'args': args }) + '\n').encode())
+            with sock.makefile('rb') as fobj:
+                line = fobj.readline()
+        if not line:
+            raise ConnectionError(f"No response from service on {self.socket_path}")
+        return json.loads(line)
+
+    def run(self, job, args, logger):
+        """Returns the result of the job, exits like the tools do when it failed"""
+        try:
+            response = self.submit(job, args)
+        except OSError as e:
+            logger.error(f"Could not reach sf_service on {self.socket_path}: {e}")
+            exit(-1)
+        if response['status'] != 'ok':
+            logger.error(response['error'])
+            exit(-1)
+        logger.debug(f"{job} job ran in {response['elapsed_ms']} ms in sf_service")
+        return response['result']
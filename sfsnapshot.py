@@ -0,0 +1,149 @@
+import sqlite3
+from datetime import datetime, timezone
+
+# Every source is split in partitions and only the partitions whose hash_agg
+# digest changed since the last sync are pulled again
+snapshot_sources = {
+    'allfuturegrantsdb': {
+        'columns':   [ 'grantee_name', 'db_name' ],
+        'from':      'allfuturegrantsdb',
+        'partition': 'db_name'
+    },
+    'allfuturegrantssc': {
+        'columns':   [ 'grantee_name', 'db_name', 'sc_name' ],
+        'from':      'allfuturegrantssc',
+        'partition': 'db_name'
+    },
+    'allgrantswh': {
+        'columns':   [ 'grantee_name', 'wh_name' ],
+        'from':      'allgrantswh',
+        'partition': 'wh_name'
+    },
+    'roles': {
+        'columns':   [ 'name' ],
+        'from':      'snowflake.account_usage.roles where deleted_on is null',
+        'partition': 'abs(hash(name)) % 256'
+    },
+    'role_grants': {
+        'columns':   [ 'grantee_name', 'name' ],
+        'from':      "snowflake.account_usage.grants_to_roles where deleted_on is null and granted_on = 'ROLE' and privilege = 'USAGE'",
+        'partition': 'abs(hash(grantee_name)) % 256'
+    }
+}
+
+snapshot_indexes = [
+    "create index if not exists allfuturegrantsdb_grantee on allfuturegrantsdb (grantee_name)",
+    "create index if not exists allfuturegrantsdb_db on allfuturegrantsdb (db_name)",
+    "create index if not exists allfuturegrantssc_grantee on allfuturegrantssc (grantee_name)",
+    "create index if not exists allfuturegrantssc_db_sc on allfuturegrantssc (db_name, sc_name)",
+    "create index if not exists allgrantswh_grantee on allgrantswh (grantee_name)",
+    "create index if not exists allgrantswh_wh on allgrantswh (wh_name)",
+    "create index if not exists role_grants_grantee on role_grants (grantee_name)"
+]
+
+# Above this many changed partitions the source is pulled in full
+max_in_list = 1000
+
+def sql_literal(value):
+    if isinstance(value, (int, float)):
+        return str(value)
+    value = str(value).replace("'", "''")
+    return f"'{value}'"
+
+class SfSnapshot():
+    """SfSnapshot keeps a local SQLite copy of the grant tables maintained by
+       the procedures in grants/ and of the roles and role to role grants from
+       snowflake.account_usage. sf_funcrole and sf_genrole can work from the
+       snapshot without a connection to Snowflake.
+
+       sync() compares a hash_agg digest per partition (database, warehouse or
+       hash bucket of the role name) with the digests stored by the previous
+       sync and only pulls the partitions that changed."""
+
+    def __init__(self, filename, logger):
+        self.filename = filename
+        self.logger   = logger
+        self.db       = sqlite3.connect(filename)
+        self.create_tables()
+
+    def create_tables(self):
+        for source, spec in snapshot_sources.items():
+            columns = ", ".join(f"{column} text" for column in spec['columns'])
+            self.db.execute(f"create table if not exists {source} (part text, {columns})")
+            self.db.execute(f"create index if not exists {source}_part on {source} (part)")
+        for index in snapshot_indexes:
+            self.db.execute(index)
+        self.db.execute("create table if not exists sync_state (source text, part text, digest text, primary key (source, part))")
+        self.db.execute("create table if not exists sync_log (source text, synced_at text, partitions integer, changed integer, pulled integer)")
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def fetch(self, sf_conn, query):
+        cursor = sf_conn.run_query(query)
+        rows = cursor.fetchall()
+        cursor.close()
+        return rows
+
+    def sync(self, sf_conn, full=False):
+        for source in snapshot_sources:
+            self.sync_source(sf_conn, source, full)
+
+    def sync_source(self, sf_conn, source, full=False):
+        spec = snapshot_sources[source]
+        columns = ", ".join(spec['columns'])
+        remote = {}
+        for part, digest in self.fetch(sf_conn, f"select {spec['partition']} as part, hash_agg({columns}) from {spec['from']} group by 1"):
+            remote[str(part)] = (part, str(digest))
+        local = {}
+        if full is False:
+            for part, digest in self.db.execute("select part, digest from sync_state where source = ?", (source,)):
+                local[part] = digest
+        changed = [ part for part in remote if local.get(part) != remote[part][1] ]
+        removed = [ part for part in local if part not in remote ]
+
+        full_pull = full is True or len(changed) == len(remote) or len(changed) > max_in_list
+        rows = []
+        if full_pull:
+            rows = self.fetch(sf_conn, f"select distinct {spec['partition']} as part, {columns} from {spec['from']}")
+            changed = list(remote)
+        elif len(changed) > 0:
+            in_list = ", ".join(sql_literal(remote[part][0]) for part in changed)
+            where = 'and' if ' where ' in spec['from'] else 'where'
+            rows = self.fetch(sf_conn, f"select distinct {spec['partition']} as part, {columns} from {spec['from']} {where} {spec['partition']} in ({in_list})")
+
+        placeholders = ", ".join('?' for column in spec['columns'])
+        with self.db:
+            if full_pull:
+                self.db.execute(f"delete from {source}")
+                self.db.execute("delete from sync_state where source = ?", (source,))
+            else:
+                for part in changed + removed:
+                    self.db.execute(f"delete from {source} where part = ?", (part,))
+                    self.db.execute("delete from sync_state where source = ? and part = ?", (source, part))
+            self.db.executemany(f"insert into {source} (part, {columns}) values (?, {placeholders})",
+                                [ (str(row[0]),) + tuple(row[1:]) for row in rows ])
+            self.db.executemany("insert into sync_state (source, part, digest) values (?, ?, ?)",
+                                [ (source, part, remote[part][1]) for part in changed ])
+            self.db.execute("insert into sync_log values (?, ?, ?, ?, ?)",
+                            (source, datetime.now(timezone.utc).isoformat(), len(remote), len(changed) + len(removed), len(rows)))
+        self.logger.info(f"Snapshot {source}: {len(changed)} of {len(remote)} partitions changed, {len(removed)} removed, {len(rows)} rows pulled")
+
+    def query(self, sql):
+        return self.db.execute(sql).fetchall()
+
+    def db_grants(self):
+        return self.query("select distinct grantee_name, db_name from allfuturegrantsdb")
+
+    def sc_grants(self):
+        return self.query("select distinct grantee_name, db_name, sc_name from allfuturegrantssc")
+
+    def wh_grants(self):
+        return self.query("select distinct grantee_name, wh_name from allgrantswh")
+
+    def roles(self):
+        return [ row[0] for row in self.query("select distinct name from roles") ]
+
+    def role_grants(self):
+        return self.query("select distinct grantee_name, name from role_grants")
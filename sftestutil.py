@@ -0,0 +1,85 @@
+from datetime import datetime, timezone
+from sfbackend import programming_error
+
+# Fakes shared by the test*.py modules
+
+changed_on = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+class FakeCursor():
+    """Cursor of FakeConn serving a fixed list of rows"""
+    def __init__(self, rows):
+        self.rows = rows
+
+    def fetchall(self):
+        return self.rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def close(self):
+        pass
+
+class FakeConn():
+    """Stands in for SfConn: run_query answers with the rows of the first key
+       of results contained in the query and records every query"""
+    def __init__(self, results):
+        self.results = results
+        self.queries = []
+
+    def run_query(self, query):
+        self.queries.append(query)
+        for table in self.results:
+            if table in query:
+                return FakeCursor(self.results[table])
+        return FakeCursor([])
+
+class FakeLogger():
+    def is_enabled(self, level):
+        return False
+
+    def info(self, message, *args, **fields):
+        pass
+
+    def debug(self, message, *args, **fields):
+        pass
+
+    def warning(self, message, *args, **fields):
+        pass
+
+    def error(self, message, *args, **fields):
+        pass
+
+class FakeSfCursor():
+    def __init__(self, results):
+        self.results = results
+        self.rows = []
+
+    def execute(self, query):
+        if query not in self.results:
+            raise programming_error()(f"SQL compilation error: {query}")
+        self.rows = self.results[query]
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+class FakeSfConn():
+    """Stands in for a connector session: a query is answered with the rows
+       of the exact query in results and fails like Snowflake otherwise"""
+    def __init__(self, results):
+        self.results = results
+
+    def cursor(self):
+        return FakeSfCursor(self.results)
+
+    def close(self):
+        pass
+
+class FakeCmdline():
+    def __init__(self, type, db_nm=None, sc_nm=None, wh_nm=None):
+        self.type  = type
+        self.db_nm = db_nm
+        self.sc_nm = sc_nm
+        self.wh_nm = wh_nm
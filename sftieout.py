@@ -0,0 +1,209 @@
+class SfTieout():
+    """SfTieout compares the tables of each validation of a tieout target
+       column by column and stores the differences in the TIEOUT_<OUTPUT_PREFIX>_*
+       tables of the target (see sample_tieout_config.yaml)."""
+
+    def __init__(self, sf_conn, logger, sf_val, case_insensitive=False, treat_null_as_blank=False, detect_duplicate_key=False):
+        self.sf_conn              = sf_conn
+        self.logger               = logger
+        self.sf_val               = sf_val
+        self.case_insensitive     = case_insensitive
+        self.treat_null_as_blank  = treat_null_as_blank
+        self.detect_duplicate_key = detect_duplicate_key
+
+    def run_target(self, config, target):
+        """Runs all validations of one target and returns the number of validations run"""
+        output_db     = config['OUTPUT_DB']
+        output_sc     = config['OUTPUT_SC']
+        output_prefix = config['OUTPUT_PREFIX']
+
+        output_base = f"{output_db}.{output_sc}.TIEOUT_{output_prefix}"
+
+        self.sf_conn.tieout_create_tables(output_base)
+
+        validations = config['VALIDATIONS']
+        # Report every invalid table name of the target before running any validation
+        invalid = self.sf_val.validate_identifiers([ validation[tbl] for validation in validations for tbl in [ 'FROM_TBL', 'TO_TBL' ] ], parts=3)
+        if len(invalid) > 0:
+            raise ValueError(f"{target}: Invalid Database.Schema.Table name(s): {', '.join(invalid)}")
+
+        for validation in validations:
+            name = validation['NAME']
+            key = validation['KEY']
+            key_iter = "'" + "','".join(key) + "'"
+            key_iter_unquoted = ", ".join(key)
+            _from_tbl = validation['FROM_TBL']
+            _to_tbl = validation['TO_TBL']
+            ignore_cols = []
+            if 'IGNORE_COLS' in validation:
+                ignore_cols = validation['IGNORE_COLS']
+            ignore_cols.extend(key)
+            from_db, from_sc, from_obj = self.sf_val.split_db_sc_obj(_from_tbl)
+            to_db, to_sc, to_obj = self.sf_val.split_db_sc_obj(_to_tbl)
+            self.logger.info(f"{target}:{name}: Validating using key {key_iter_unquoted} between {_from_tbl} and {_to_tbl}")
+            # logic to detect duplicates should run here
+            if self.detect_duplicate_key:
+                self.logger.info(f"Detecting duplicate key(s) in from {_from_tbl}")
+                qry = f"""
+with cnt as (
+  select count(1) as cnt, {key_iter_unquoted}
+    from {_from_tbl}
+   group by {key_iter_unquoted}
+  having cnt > 1
+)
+select count(1) from cnt
+"""
+                # if the first column of the first row is 0 then there's no duplicates
+                dup_curs = self.sf_conn.run_query(qry)
+                dup_row = dup_curs.fetchone()
+                dup_keys, = dup_row
+                if dup_keys > 0:
+                    self.logger.warning(f"Multiple keys of {key_iter_unquoted} ({dup_keys}) have more than one row in {_from_tbl}")
+                self.logger.info(f"Detecting duplicate key(s) in to {_to_tbl}")
+                qry = f"""
+with cnt as (
+  select count(1) as cnt, {key_iter_unquoted}
+    from {_to_tbl}
+   group by {key_iter_unquoted}
+  having cnt > 1
+)
+select count(1) from cnt
+"""
+                # if the first column of the first row is 0 then there's no duplicates
+                dup_curs = self.sf_conn.run_query(qry)
+                dup_row = dup_curs.fetchone()
+                dup_keys, = dup_row
+                if dup_keys > 0:
+                    self.logger.warning(f"Multiple keys ({dup_keys}) have more than one row in {_to_tbl}")
+            # how do we fix this
+            f_curs = self.sf_conn.run_query(f"select count({key_iter_unquoted}) from {from_db}.{from_sc}.{from_obj}")
+            from_row = f_curs.fetchone()
+            from_rowcnt, = from_row
+            t_curs = self.sf_conn.run_query(f"select count({key_iter_unquoted}) from {to_db}.{to_sc}.{to_obj}")
+            to_row = t_curs.fetchone()
+            to_rowcnt, = to_row
+            only_keys = f"""
+with from_keys as (
+  select {key_iter_unquoted} from {_from_tbl}
+   minus
+  select {key_iter_unquoted} from {_to_tbl}
+), to_keys as (
+  select {key_iter_unquoted} from {_to_tbl}
+   minus
+  select {key_iter_unquoted} from {_from_tbl}
+), both_keys as (
+  select {key_iter_unquoted} from {_to_tbl}
+   intersect
+  select {key_iter_unquoted} from {_from_tbl}
+)
+select 'FROM' as type, count({key_iter_unquoted}) from from_keys
+union
+select 'TO' as type, count({key_iter_unquoted}) from to_keys
+union
+select 'BOTH' as type, count({key_iter_unquoted}) from both_keys
+"""
+            from_only = 0
+            to_only = 0
+            both = 0
+            only_curs = self.sf_conn.run_query(only_keys)
+            for row in only_curs:
+                dir, count = row
+                if dir == 'FROM':
+                    from_only = count
+                if dir == 'TO':
+                    to_only = count
+                if dir == 'BOTH':
+                    both = count
+            self.logger.info(f"{target}:{name}: {_from_tbl} total row count: {from_rowcnt}; unique {key_iter_unquoted}: {from_only}")
+            self.logger.info(f"{target}:{name}: {_to_tbl} total row count: {to_rowcnt}; unique {key_iter_unquoted}: {to_only}")
+            curs = self.sf_conn.run_query(f"insert into {output_base}_1_OVERVIEW (name, key, overlap_rowcount, from_tbl, from_rowcount, from_unique, to_tbl, to_rowcount, to_unique) select '{name}', array_construct({key_iter}), {both}, '{_from_tbl}', {from_rowcnt}, {from_only}, '{_to_tbl}', {to_rowcnt}, {to_only}")
+            #self.logger.debug("Need to store the keys that are unique")
+            self.logger.info(f"{target}:{name}: Comparing column by column where {key_iter_unquoted} overlaps both tables")
+            self.logger.debug(f"{target}:{name}: Determining columns to compare")
+            igncols = ''
+            if len(ignore_cols) > 0:
+                igncols = "and column_name not in ('" + "','".join(ignore_cols) + "')"
+                self.logger.debug(f"{target}:{name}: Ignoring columns: {ignore_cols}")
+            from_cols = f"select column_name from {from_db}.information_schema.columns where table_catalog = '{from_db}' and table_schema = '{from_sc}' and table_name = '{from_obj}' {igncols}"
+            to_cols = f"select column_name from {to_db}.information_schema.columns where table_catalog = '{to_db}' and table_schema = '{to_sc}' and table_name = '{to_obj}' {igncols}"
+            tbl_columns = f"""
+with from_only as (
+{from_cols} minus {to_cols}
+), to_only as (
+{to_cols} minus {from_cols}
+), both as (
+{from_cols} intersect {to_cols}
+)
+select 'FROM' as source, column_name from from_only
+union
+select 'TO' as source, column_name from to_only
+union
+select 'BOTH' as source, column_name from both
+order by column_name asc
+"""
+# This can be removed when Snowflake support confirms fix
+#    shared_keys = f"""
+#shared_keys as (
+#  select {key_iter_unquoted} from {_from_tbl}
+#  intersect
+#  select {key_iter_unquoted} from {_to_tbl}
+#)
+#"""
+            shared_keys_list_unqoted = ", ".join(map(lambda x: f"f.{x}", key))
+            shared_keys_list_join = " and ".join(map(lambda x: f"f.{x} = t.{x}", key))
+            shared_keys = f"""
+shared_keys as (
+  select {shared_keys_list_unqoted} from {_from_tbl} f
+    inner join {_to_tbl} t on {shared_keys_list_join}
+)
+"""
+            col_curs = self.sf_conn.run_query(tbl_columns)
+            for row in col_curs:
+                source, col_nm = row
+                if source == 'BOTH':
+                    # this needs to be expanded ..
+                    keys_list = " and ".join(map(lambda x: f"t.{x} = f.{x} and s.{x} = t.{x} and s.{x} = f.{x}", key))
+                    skey_iter_unquoted = ", ".join(map(lambda x: f"s.{x}",key))
+                    compare_condition = f"t.{col_nm}, f.{col_nm}"
+                    if self.case_insensitive and self.treat_null_as_blank:
+                        compare_condition = f"upper(ifnull(t.{col_nm}, '')), upper(ifnull(f.{col_nm}, ''))"
+                    elif self.case_insensitive:
+                        compare_condition = f"upper(t.{col_nm}), upper(f.{col_nm})"
+                    elif self.treat_null_as_blank:
+                        compare_condition = f"ifnull(t.{col_nm}, ''), ifnull(f.{col_nm}, '')"
+                    comp_sql = f"""
+with {shared_keys}
+select count({skey_iter_unquoted}) as diff from shared_keys s, {_from_tbl} f, {_to_tbl} t
+ where {keys_list}
+   and NOT(EQUAL_NULL({compare_condition}))
+"""
+                    # Skip this one if it fails and move to the next key?
+                    comp_curs = self.sf_conn.run_query(comp_sql)
+                    comp_row = comp_curs.fetchone()
+                    diff, = comp_row
+                    self.logger.info("%s:%s: Column: %s has %s differences", target, name, col_nm, diff, object=name)
+                    comp_curs = self.sf_conn.run_query(f"insert into {output_base}_2_COLUMNS_SUMMARY (name, col_nm, col_diff_cnt) values ('{name}', '{col_nm}', {diff})")
+                    if diff > 0:
+
+                        keys_hash = ", ".join(map(lambda x: f"'{x}', s.{x}", key))
+                        comp_sql = f"""
+insert into {output_base}_3_COLUMNS_DETAIL
+ (name, col_nm, key_vals, data_vals)
+  with {shared_keys}
+  select '{name}' as name,
+         '{col_nm}' as col_nm,
+         array_construct({key_iter}) as key_vals, -- the below key is not correct
+         object_construct_keep_null({keys_hash}, '__to_val', t.{col_nm}, '__from_val', f.{col_nm}) as data_vals
+    from shared_keys s, {_from_tbl} f, {_to_tbl} t
+   where {keys_list}
+     and NOT(EQUAL_NULL({compare_condition}))
+"""
+                        comp_curs = self.sf_conn.run_query(comp_sql)
+                        self.logger.info("%s:%s: Column: %s diff details stored", target, name, col_nm, object=name)
+                elif source == 'FROM':
+                    self.logger.debug("%s:%s: Skipping %s as only exists in from %s", target, name, col_nm, _from_tbl, object=name)
+                    comp_curs = self.sf_conn.run_query(f"insert into {output_base}_4_COLUMNS_SKIPPED (name, tbl_nm, col_nm) values ('{name}', '{_from_tbl}', '{col_nm}')")
+                elif source == 'TO':
+                    self.logger.debug("%s:%s: Skipping %s as only exists in to %s", target, name, col_nm, _to_tbl, object=name)
+                    comp_curs = self.sf_conn.run_query(f"insert into {output_base}_4_COLUMNS_SKIPPED (name, tbl_nm, col_nm) values ('{name}', '{_to_tbl}', '{col_nm}')")
+        return len(validations)
@@ -0,0 +1,259 @@
+import atexit
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+
+# Literals are replaced so statements differing only in names in quotes or
+# numbers share a fingerprint
+literal_re = re.compile(r"'(?:[^']|'')*'")
+number_re  = re.compile(r'\b\d+(\.\d+)?\b')
+
+# Frames in these files are the plumbing, not the caller
+trace_files = [ 'sfconn.py', 'sftrace.py', 'sfbackend.py' ]
+
+history_sql = """select query_id, compilation_time, execution_time, queued_overload_time
+  from table(information_schema.query_history_by_session(result_limit => 10000))
+ where query_tag = '{query_tag}'"""
+
+def normalize_statement(query):
+    statement = literal_re.sub('?', ' '.join(query.split()))
+    return number_re.sub('?', statement).lower()
+
+def fingerprint(query):
+    return hashlib.sha1(normalize_statement(query).encode('utf-8')).hexdigest()[:16]
+
+def sql_string(value):
+    value = str(value).replace("'", "''")
+    return f"'{value}'"
+
+def caller():
+    """Returns the SfConn method and the first frame outside of the connection code"""
+    method = None
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = os.path.basename(frame.f_code.co_filename)
+        if filename not in trace_files:
+            return method, f"{filename}:{frame.f_lineno}:{frame.f_code.co_name}"
+        if filename == 'sfconn.py' and method is None:
+            method = frame.f_code.co_name
+        frame = frame.f_back
+    return method, None
+
+class SfSpan():
+    def __init__(self, trace_id, query, method, caller):
+        self.trace_id    = trace_id
+        self.span_id     = uuid.uuid4().hex[:16]
+        self.query       = query
+        self.method      = method
+        self.caller      = caller
+        self.start_ns    = time.time_ns()
+        self.end_ns      = None
+        self.query_id    = None
+        self.execute_ms  = 0.0
+        self.fetch_ms    = 0.0
+        self.rows        = 0
+        self.error       = None
+        self.compilation_ms = None
+        self.execution_ms   = None
+        self.queued_ms      = None
+
+    def to_dict(self):
+        # OpenTelemetry style span
+        return {
+            'trace_id':             self.trace_id,
+            'span_id':              self.span_id,
+            'name':                 'snowflake.query',
+            'start_time_unix_nano': self.start_ns,
+            'end_time_unix_nano':   self.end_ns,
+            'status':               'OK' if self.error is None else 'ERROR',
+            'attributes': {
+                'db.system':             'snowflake',
+                'db.statement':          self.query,
+                'db.snowflake.query_id': self.query_id,
+                'fingerprint':           fingerprint(self.query),
+                'execute_ms':            round(self.execute_ms, 3),
+                'fetch_ms':              round(self.fetch_ms, 3),
+                'compilation_ms':        self.compilation_ms,
+                'execution_ms':          self.execution_ms,
+                'queued_ms':             self.queued_ms,
+                'rows':                  self.rows,
+                'sfconn.method':         self.method,
+                'caller':                self.caller,
+                'error':                 self.error
+            }
+        }
+
+class SfTracedCursor():
+    """Times execute and every fetch of a cursor and counts the rows fetched.
+       The span of a statement ends when the cursor is closed or runs its
+       next statement."""
+    def __init__(self, cursor, tracer):
+        self.cursor = cursor
+        self.tracer = tracer
+        self.span   = None
+
+    def execute(self, query):
+        self.end_span()
+        method, caller_frame = caller()
+        span = SfSpan(self.tracer.trace_id, query, method, caller_frame)
+        with self.tracer.lock:
+            self.span = span
+            self.tracer.active.add(self)
+        start = time.perf_counter()
+        try:
+            self.cursor.execute(query)
+        except Exception as e:
+            span.error = str(e)
+            raise
+        finally:
+            span.execute_ms = (time.perf_counter() - start) * 1000
+            span.query_id = getattr(self.cursor, 'sfqid', None)
+            if span.error is not None:
+                self.end_span()
+        return self
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = self.cursor.fetchone()
+        span = self.span
+        if span is not None:
+            span.fetch_ms += (time.perf_counter() - start) * 1000
+            if row is not None:
+                span.rows += 1
+        return row
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = self.cursor.fetchall()
+        span = self.span
+        if span is not None:
+            span.fetch_ms += (time.perf_counter() - start) * 1000
+            span.rows += len(rows)
+        return rows
+
+    def __iter__(self):
+        while True:
+            row = self.fetchone()
+            if row is None:
+                return
+            yield row
+
+    def end_span(self):
+        # The tracer may end the span from another thread when it is closed
+        with self.tracer.lock:
+            span, self.span = self.span, None
+            self.tracer.active.discard(self)
+        if span is not None:
+            self.tracer.end_span(span)
+
+    def close(self):
+        self.end_span()
+        self.cursor.close()
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+class SfTracedConn():
+    def __init__(self, conn, tracer):
+        self.conn   = conn
+        self.tracer = tracer
+        # query_history is read through the untraced connection
+        tracer.conn = conn
+
+    def cursor(self):
+        return SfTracedCursor(self.conn.cursor(), self.tracer)
+
+    def close(self):
+        self.tracer.close(self.conn)
+        self.conn.close()
+
+class SfTracer():
+    """SfTracer collects a span per statement run through SfConn and writes
+       them as JSON lines when the connection is closed (or the process
+       exits), followed by a summary of the top statements by total time
+       grouped by fingerprint. Statements are tagged with query_tag and the
+       compilation, execution and queued times are looked up in one query
+       against information_schema.query_history_by_session."""
+    def __init__(self, filename, logger, query_tag=None, top_n=10):
+        # The tools may change directory before the trace is written
+        self.filename  = os.path.abspath(filename)
+        self.logger    = logger
+        self.trace_id  = uuid.uuid4().hex
+        self.query_tag = query_tag
+        if self.query_tag is None:
+            self.query_tag = f"snowflake-provisioning:{os.path.basename(sys.argv[0])}:{self.trace_id[:8]}"
+        self.top_n     = top_n
+        self.conn      = None
+        self.spans     = []
+        # Cursors with a statement whose span has not ended yet
+        self.active    = set()
+        self.lock      = threading.Lock()
+        self.closed    = False
+        atexit.register(self.close)
+
+    def end_span(self, span):
+        span.end_ns = time.time_ns()
+        self.spans.append(span)
+
+    def query_history(self, conn):
+        query_ids = set(span.query_id for span in self.spans if span.query_id is not None)
+        if conn is None or len(query_ids) == 0:
+            return
+        try:
+            cursor = conn.cursor()
+            cursor.execute(history_sql.format(query_tag=self.query_tag.replace("'", "''")))
+            history = { row[0]: row[1:] for row in cursor.fetchall() }
+            cursor.close()
+        except Exception as e:
+            self.logger.warning(f"Unable to read query_history for the trace: {e}")
+            return
+        for span in self.spans:
+            if span.query_id in history:
+                span.compilation_ms, span.execution_ms, span.queued_ms = history[span.query_id]
+
+    def close(self, conn=None):
+        if self.closed:
+            return
+        self.closed = True
+        with self.lock:
+            active = list(self.active)
+        for cursor in active:
+            cursor.end_span()
+        self.query_history(conn if conn is not None else self.conn)
+        try:
+            with open(self.filename, 'a') as fobj:
+                for span in sorted(self.spans, key=lambda span: span.start_ns):
+                    fobj.write(json.dumps(span.to_dict(), default=str) + '\n')
+        except OSError as e:
+            self.logger.warning(f"Unable to write trace {self.filename}: {e}")
+        self.print_summary()
+
+    def summary(self):
+        fingerprints = {}
+        for span in self.spans:
+            key = fingerprint(span.query)
+            entry = fingerprints.setdefault(key, {
+                'fingerprint': key,
+                'statement':   normalize_statement(span.query),
+                'count':       0,
+                'total_ms':    0.0,
+                'rows':        0,
+                'errors':      0
+            })
+            entry['count']    += 1
+            entry['total_ms'] += span.execute_ms + span.fetch_ms
+            entry['rows']     += span.rows
+            entry['errors']   += 0 if span.error is None else 1
+        return sorted(fingerprints.values(), key=lambda entry: entry['total_ms'], reverse=True)[:self.top_n]
+
+    def print_summary(self):
+        total_ms = sum(span.execute_ms + span.fetch_ms for span in self.spans)
+        print(f"-- Trace {self.trace_id} ({self.query_tag}): {len(self.spans)} statements, {total_ms:.1f} ms, written to {self.filename}", file=sys.stderr)
+        print(f"-- {'total ms':>10} {'count':>6} {'mean ms':>9} {'rows':>8}  statement", file=sys.stderr)
+        for entry in self.summary():
+            print(f"-- {entry['total_ms']:>10.1f} {entry['count']:>6} {entry['total_ms'] / entry['count']:>9.1f} {entry['rows']:>8}  {entry['statement'][:100]}", file=sys.stderr)
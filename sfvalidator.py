@@ -1,7 +1,11 @@
 #!/usr/bin/env python3
 
+import functools
 import re
 
+# Number of distinct identifiers normalize_identifiers remembers
+identifier_cache_size = 65536
+
 class SfValidator():
     """SfValidator is written to validate identifiers passed on
        the command line to scripts. It is meant to validate that
@@ -24,61 +28,73 @@ class SfValidator():
         self._ref_obj_pat = r'CREATE\s*(?:ORE\s*REPLACE\s*)?'
         self.ref_obj_pat = re.compile(self._ref_obj_pat)
         self.unquoted_pat = r'[A-Za-z\_]{1}[A-Za-z0-9\_\$]{0,254}'
+        # Database.Schema where either part may be a LIKE pattern with % wildcards
+        self.db_sc_like_pat = re.compile(r'([A-Za-z0-9\_\$%]{1,255})\.([A-Za-z0-9\_\$%]{1,255})')
+        self.unquoted_name_pat = re.compile(self.unquoted_pat)
+        # Quotes inside a quoted name are doubled: "quote""andunquote"""
+        self._quoted_pat = r'"(?:[^"]|"")+"'
+        self.quoted_name_pat = re.compile(self._quoted_pat)
+        # One to three parts name, db.sc or db.sc.obj, each quoted or unquoted
+        _part_pat = '(' + self.unquoted_pat + '|' + self._quoted_pat + ')'
+        self.identifier_pat = re.compile(_part_pat + r'(?:\.' + _part_pat + r')?(?:\.' + _part_pat + r')?')
+        self.normalize_identifier = functools.lru_cache(maxsize=identifier_cache_size)(self._normalize_identifier)
 
     def is_quoted_name(self, name):
-        if '\"' not in name:
-            return False
-        num_quotes = name.count('"')
-        if (num_quotes % 2) != 0: 
-            return False
-        if name[0] != '"': 
-            return False 
-        if name[-1] != '"': 
+        if self.quoted_name_pat.fullmatch(name) is None:
             return False
-        if num_quotes > 2:
-            double_quoted_quotes = int((num_quotes / 2) - 2)
-            if len(name) < 3 + double_quoted_quotes:
-                return False
-            if len(name) > 255 + double_quoted_quotes:
-                return False 
-            # now we just need to make sure all quotes are grouped together
-            quotes = []
-            for elmnt in range(1, len(name)-1): # avoid checking on first and last character
-                if name[elmnt] == '\"':
-                    quotes.append(elmnt)
-            for elmnt in range(0, double_quoted_quotes+1):
-                if quotes[(elmnt*2)+1] - quotes[elmnt*2] != 1:
-                    return False
-        else:
-            if len(name) < 3: # only the two quotes - can't be valid
-                return False 
-            if len(name) > 255:
-                return False 
-        return True
+        # Every doubled quote past the first one adds to the maximum length
+        double_quoted_quotes = name.count('"') // 2 - 2
+        return len(name) <= 255 + max(double_quoted_quotes, 0)
 
     def is_unquoted_name(self, name):
-        if '\"' in name:
-            return False
-        if len(name) > 255:
-            return False
-        if len(name) < 1:
-            return False
-        name_match = re.compile('' + self.unquoted_pat + '')
-        match = name_match.findall(name)
-        if len(match) == 1 and match[0] == name:
-            return True
-        return False
+        return self.unquoted_name_pat.fullmatch(name) is not None
 
     def unquoted_name(self, name):
-        if is_unquoted_name(name):
+        if self.is_unquoted_name(name):
             return name.upper()
         return None
 
     def quoted_name(self, name):
-        if is_quoted_name(name):
+        if self.is_quoted_name(name):
             return name
         return None
 
+    def _normalize_identifier(self, identifier):
+        match = self.identifier_pat.fullmatch(identifier)
+        if match is None:
+            return None
+        parts = []
+        for part in match.groups():
+            if part is None:
+                break
+            if part[0] == '"':
+                if not self.is_quoted_name(part):
+                    return None
+                parts.append(part)
+            else:
+                parts.append(part.upper())
+        return tuple(parts)
+
+    def normalize_identifiers(self, identifiers, parts=None):
+        """Validates and normalizes a list of identifiers - name, db.sc or
+           db.sc.obj with every part quoted or unquoted - in one call. Returns
+           a list with a tuple of the parts of every identifier, unquoted parts
+           upper case, or None where the identifier is not valid or does not
+           have the number of parts asked for. Identifiers repeated across
+           manifests and tieout configurations are only parsed once."""
+        normalized = []
+        for identifier in identifiers:
+            result = self.normalize_identifier(identifier)
+            if result is not None and parts is not None and len(result) != parts:
+                result = None
+            normalized.append(result)
+        return normalized
+
+    def validate_identifiers(self, identifiers, parts=None):
+        """Returns the identifiers normalize_identifiers does not accept"""
+        return [ identifier for identifier, result in
+                 zip(identifiers, self.normalize_identifiers(identifiers, parts)) if result is None ]
+
     def split_db_sc_obj(self, db_sc_obj):
         if '.' not in db_sc_obj:
             raise ValueError
@@ -137,6 +153,14 @@ class SfValidator():
                 return [db.upper(), sc]
             raise ValueError
 
+    def split_db_sc_like(self, db_sc):
+        """Splits a Database.Schema pattern like YOURNAMESPACE_PRD_%.% - wildcards
+           are only supported in unquoted names, which are returned upper case"""
+        match = self.db_sc_like_pat.fullmatch(db_sc)
+        if match is None:
+            raise ValueError
+        return [ match.group(1).upper(), match.group(2).upper() ]
+
     def name(self, text):
         """Takes a text string and returns the re fullmatch object"""
         # matches exact full length name starting at the beginning of the string
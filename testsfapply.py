@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+from sfapply import SfApply
+from sftestutil import FakeCursor, FakeLogger
+import contextlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+class RecordingConn():
+    def __init__(self, fail=None):
+        self.fail = fail
+        self.queries = []
+        self.lock = threading.Lock()
+
+    def run_query(self, query):
+        if query == self.fail:
+            raise Exception(f"failing {query}")
+        if query.startswith('SLOW '):
+            time.sleep(0.05)
+        with self.lock:
+            self.queries.append(query)
+        return FakeCursor([])
+
+phases = [ ('objects', [ 'SLOW CREATE ROLE A_AR;', 'CREATE ROLE B_AR;', 'CREATE ROLE B_AR;' ]),
+           ('owner_grants', [ 'GRANT OWNERSHIP ON ROLE A_AR TO ROLE SYSADMIN;', 'GRANT OWNERSHIP ON ROLE B_AR TO ROLE SYSADMIN;' ]),
+           ('role_grants', [ 'GRANT ROLE B_AR TO ROLE A_AR;' ]) ]
+
+class TestMethods(unittest.TestCase):
+
+    def test_run_phases_in_order(self):
+        conn = RecordingConn()
+        failures = SfApply(conn, FakeLogger(), max_workers=4).run(phases)
+        self.assertEqual(failures, [])
+        # Duplicates run once and no statement starts before the previous phase finished
+        self.assertEqual(len(conn.queries), 5)
+        ran = [ phase for query in conn.queries for phase, statements in phases if query in statements ]
+        self.assertEqual(ran, sorted(ran, key=[ phase for phase, statements in phases ].index))
+
+    def test_failure_stops_later_phases(self):
+        conn = RecordingConn(fail='CREATE ROLE B_AR;')
+        sf_apply = SfApply(conn, FakeLogger(), max_workers=4)
+        failures = sf_apply.run(phases)
+        self.assertEqual([ (phase, statement) for phase, statement, error in failures ], [ ('objects', 'CREATE ROLE B_AR;') ])
+        # The rest of the failed phase is still attempted, later phases are not
+        self.assertEqual(conn.queries, [ 'SLOW CREATE ROLE A_AR;' ])
+
+    def test_journal_resume(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            journal = os.path.join(tmp_dir, 'apply.journal')
+            first = SfApply(RecordingConn(fail='GRANT OWNERSHIP ON ROLE B_AR TO ROLE SYSADMIN;'), FakeLogger(), journal)
+            self.assertEqual(len(first.run(phases)), 1)
+            self.assertEqual(first.skipped, [])
+            # A partially written entry of a killed run is ignored
+            with open(journal, 'a') as fobj:
+                fobj.write('{"key": "trunc')
+            conn = RecordingConn()
+            resumed = SfApply(conn, FakeLogger(), journal)
+            self.assertEqual(resumed.run(phases), [])
+            self.assertEqual(conn.queries, [ 'GRANT OWNERSHIP ON ROLE B_AR TO ROLE SYSADMIN;', 'GRANT ROLE B_AR TO ROLE A_AR;' ])
+            self.assertEqual(sorted((entry['phase'], entry['statement']) for entry in resumed.skipped),
+                             [ ('objects', 'CREATE ROLE B_AR;'), ('objects', 'SLOW CREATE ROLE A_AR;'),
+                               ('owner_grants', 'GRANT OWNERSHIP ON ROLE A_AR TO ROLE SYSADMIN;') ])
+            # Applied statements are tracked with the same entry the journal has
+            with open(journal, 'r') as fobj:
+                lines = fobj.read().splitlines()
+            self.assertEqual(lines.count('{"key": "trunc'), 1)
+            entries = [ json.loads(line) for line in lines if line != '{"key": "trunc' ]
+            applied = { entry['key']: entry for entry in entries if entry['status'] == 'applied' }
+            self.assertEqual(resumed.applied, applied)
+            self.assertEqual(len(applied), 5)
+            # Every skipped statement is reported exactly once
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                resumed.print_skipped()
+            lines = out.getvalue().splitlines()
+            self.assertEqual(len(lines), 3)
+            for entry in resumed.skipped:
+                self.assertEqual(len([ line for line in lines if line.endswith(f": {entry['statement']}") ]), 1)
+
+    def test_run_chains_in_order(self):
+        conn = RecordingConn()
+        chains = [ ('A_FR', [ 'GRANT ROLE X TO ROLE A_FR;', 'REVOKE ROLE Y FROM ROLE A_FR;' ]),
+                   ('B_FR', [ 'GRANT ROLE X TO ROLE B_FR;', 'REVOKE ROLE Y FROM ROLE B_FR;' ]) ]
+        results = SfApply(conn, FakeLogger(), max_workers=2).run_chains(chains)
+        self.assertEqual(sorted(results), [ 'A_FR', 'B_FR' ])
+        for name, statements in chains:
+            self.assertEqual([ result['statement'] for result in results[name] ], statements)
+            ran = [ query for query in conn.queries if query in statements ]
+            self.assertEqual(ran, statements)
+
+    def test_run_chain_stops_at_failure(self):
+        conn = RecordingConn(fail='GRANT ROLE X TO ROLE A_FR;')
+        sf_apply = SfApply(conn, FakeLogger())
+        results = sf_apply.run_chains([ ('A_FR', [ 'GRANT ROLE X TO ROLE A_FR;', 'REVOKE ROLE Y FROM ROLE A_FR;' ]) ])
+        self.assertEqual([ result['status'] for result in results['A_FR'] ], [ 'failed' ])
+        self.assertEqual(conn.queries, [])
+        self.assertEqual(len(sf_apply.failures), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+
+from sfarchive import SfArchive, find_archive, list_archives
+import os
+import tempfile
+import unittest
+
+class TestMethods(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def archive(self, name, objects):
+        archive = SfArchive(os.path.join(self.tmp_dir.name, name))
+        for schema, file, ddl in objects:
+            archive.add(schema, file, '2024-01-01T00:00:00+00:00', ddl)
+        archive.commit()
+        return archive
+
+    def test_diff(self):
+        old = self.archive('export-20240101T000000.sqlite', [ ('DB.SC', 'T.tbl', 'create table T (A int);'),
+                                                             ('DB.SC', 'P.pr', 'create procedure P(A int);'),
+                                                             ('DB.SC', 'V.vw', 'create view V as select 1;') ])
+        new = self.archive('export-20240102T000000.sqlite', [ ('DB.SC', 'T.tbl', 'create table T (A int);'),
+                                                             ('DB.SC', 'P.pr', 'create procedure P(A int);'),
+                                                             ('DB.SC', 'P.pr', 'create procedure P(A int, B int);'),
+                                                             ('DB.SC2', 'T.tbl', 'create table T (A int);') ])
+        self.assertEqual(old.diff(new), { 'added': [ 'DB.SC2/T.tbl' ], 'removed': [ 'DB.SC/V.vw' ], 'changed': [ 'DB.SC/P.pr' ] })
+        self.assertEqual(old.diff(new, [ 'DB.SC2' ])['added'], [ 'DB.SC2/T.tbl' ])
+        self.assertEqual(find_archive(self.tmp_dir.name), new.filename)
+        with self.assertRaises(ValueError):
+            find_archive(os.path.join(self.tmp_dir.name, 'missing.sqlite'))
+        # Overloads are written to one file, like sf_export does
+        output_dir = os.path.join(self.tmp_dir.name, 'files')
+        self.assertEqual(new.extract(output_dir, [ 'DB.SC' ]), 2)
+        with open(os.path.join(output_dir, 'DB.SC', 'P.pr'), 'r') as fobj:
+            self.assertEqual(fobj.read(), 'create procedure P(A int);\ncreate procedure P(A int, B int);\n')
+        old.close()
+        new.close()
+
+if __name__ == '__main__':
+    unittest.main()
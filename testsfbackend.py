@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+from datetime import datetime, timezone
+from decimal import Decimal
+from sfbackend import SfRecordingConn, SfReplayConn, SfSimConn
+from sfconn import SfConn, SfConnError, show_schemas_scan_sql
+import sfconn
+from snowflake.connector.errors import ProgrammingError
+from sftestutil import FakeLogger, FakeSfConn
+import os
+import tempfile
+import threading
+import unittest
+
+created = datetime(2024, 1, 1, 12, 30, tzinfo=timezone.utc)
+results = {
+    "ALTER SESSION SET QUOTED_IDENTIFIERS_IGNORE_CASE = TRUE": [ ('Statement executed successfully.',) ],
+    "SELECT current_version(), current_role(), current_database(), current_schema(), current_warehouse()": [ ('8.0.0', 'DEMO_ROLE', 'DEMO_DB', 'PUBLIC', 'DEMO_WH') ],
+    "select table_name, last_altered, bytes from tables": [ ('T1', created, Decimal('10.5')), ('T2', created, Decimal('0')) ]
+}
+
+class TestMethods(unittest.TestCase):
+
+    def record(self, filename):
+        conn = SfRecordingConn(FakeSfConn(results), filename)
+        for query in results:
+            curs = conn.cursor()
+            curs.execute(query)
+            curs.close()
+        curs = conn.cursor()
+        with self.assertRaises(ProgrammingError):
+            curs.execute("select * from missing")
+        conn.close()
+
+    def test_record_replay(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'session.jsonl')
+            self.record(filename)
+            conn = SfReplayConn(filename, latency_ms=0)
+            curs = conn.cursor()
+            curs.execute("select table_name,\n       last_altered, bytes   from tables")
+            self.assertEqual(curs.fetchone(), ('T1', created, Decimal('10.5')))
+            self.assertEqual([ row for row in curs ], [ ('T2', created, Decimal('0')) ])
+            # Recorded errors are raised again and unknown queries fail
+            with self.assertRaises(ProgrammingError):
+                curs.execute("select * from missing")
+            with self.assertRaises(ProgrammingError):
+                curs.execute("select 1")
+            self.assertEqual(conn.round_trips, 2)
+
+    def test_replay_threads(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'session.jsonl')
+            self.record(filename)
+            conn = SfReplayConn(filename, latency_ms=0)
+            query = "select table_name, last_altered, bytes from tables"
+            def replay():
+                for i in range(1000):
+                    conn.next_result(query)
+            threads = [ threading.Thread(target=replay) for i in range(8) ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            # No round trip is lost when cursors of one connection run on several threads
+            self.assertEqual(conn.served[query], 8000)
+            self.assertEqual(conn.round_trips, 8000)
+
+    def test_replay_sfconn(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'session.jsonl')
+            self.record(filename)
+            config = { 'user': 'your@login', 'account': 'ACCOUNT', 'role': 'DEMO_ROLE', 'warehouse': 'DEMO_WH',
+                       'database': 'DEMO_DB', 'schema': 'PUBLIC', 'backend': 'replay', 'recording': filename, 'latency_ms': 0 }
+            sf_conn = SfConn(config, FakeLogger())
+            self.assertEqual(sf_conn.run_query("select table_name, last_altered, bytes from tables").fetchall()[1][0], 'T2')
+            sf_conn.close_conn()
+    def test_cursor_error(self):
+        config = { 'user': 'your@login', 'account': 'ACCOUNT', 'role': 'DEMO_ROLE', 'warehouse': 'DEMO_WH',
+                   'database': 'DEMO_DB', 'schema': 'PUBLIC', 'backend': 'sim' }
+        sf_conn = SfConn(config, FakeLogger())
+        sf_conn.conn = FakeSfConn({ "use database DEMO_DB": [] })
+        # A schema that does not exist raises instead of ending the process
+        with self.assertRaisesRegex(SfConnError, '^Could not use database DEMO_DB and schema MISSING_SC: .*SQL compilation error'):
+            sf_conn.cursor('DEMO_DB', 'MISSING_SC')
+
+    def test_list_db_sc(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache_dir = sfconn.cache_dir
+            sfconn.cache_dir = tmp_dir
+            try:
+                config = { 'user': 'your@login', 'account': 'ACCOUNT', 'role': 'DEMO_ROLE', 'warehouse': 'DEMO_WH',
+                           'database': 'DEMO_DB', 'schema': 'PUBLIC', 'backend': 'sim' }
+                sf_conn = SfConn(config, FakeLogger())
+                # account_usage.schemata is not accessible, one show and a result_scan list every schema
+                sf_conn.conn = FakeSfConn({ "show schemas in account": [],
+                                            show_schemas_scan_sql: [ ('DB1', 'SC2'), ('DB1', 'SC1'), ('DB2', 'PUBLIC') ] })
+                listing = [ [ 'DB1', 'SC2' ], [ 'DB1', 'SC1' ], [ 'DB2', 'PUBLIC' ] ]
+                self.assertEqual(sf_conn.list_db_sc(), listing)
+                # Served from the cache without any statement until refreshed
+                sf_conn.conn = FakeSfConn({})
+                self.assertEqual(sf_conn.list_db_sc(), listing)
+                self.assertEqual(sf_conn.list_db_sc(refresh=True), [])
+                sf_conn.schema_cache_seconds = 0
+                self.assertEqual(sf_conn.list_db_sc(), [])
+            finally:
+                sfconn.cache_dir = cache_dir
+
+    def test_sim_show_grants(self):
+        conn = SfSimConn({ 'roles': 2 }, latency_ms=0)
+        role = conn.account.roles[0]
+        curs = conn.cursor()
+        curs.execute(f"SHOW GRANTS TO ROLE {role}")
+        curs.execute(f"select \"name\" from table(result_scan('{curs.sfqid}')) where \"granted_on\" = 'ROLE'")
+        self.assertEqual(set(row[0] for row in curs), set(granted for grantee, granted in conn.account.role_grants() if grantee == role))
+        with self.assertRaises(ProgrammingError):
+            curs.execute("SHOW GRANTS TO ROLE MISSING_FR")
+
+if __name__ == '__main__':
+    unittest.main()
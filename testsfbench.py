@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+
+from sfbench import SfBench
+from sftestutil import FakeLogger
+import os
+import subprocess
+import sys
+import unittest
+
+repo_dir = os.path.dirname(os.path.abspath(__file__))
+
+class TestMethods(unittest.TestCase):
+
+    def test_run(self):
+        bench = SfBench(repo_dir, FakeLogger())
+        result = bench.run('clone_refresh', 'small')
+        self.assertEqual(result['exit_code'], 0)
+        self.assertEqual(result['objects'], 10)
+        # connect, validate 3 roles, query clones and refresh every other table
+        self.assertEqual(result['statements'], 25)
+        self.assertGreater(result['peak_rss_kb'], 0)
+
+    def test_regressions(self):
+        bench = SfBench(repo_dir, FakeLogger())
+        bench.results = [ { 'scenario': 'export', 'size': 'small', 'exit_code': 0, 'statements': 300, 'wall_clock': 1.0 },
+                          { 'scenario': 'tieout', 'size': 'small', 'exit_code': 0, 'statements': 290, 'wall_clock': 2.0 } ]
+        baseline = { 'export/small': { 'statements': 259, 'wall_clock': 1.0 },
+                     'tieout/small': { 'statements': 290, 'wall_clock': 1.0 } }
+        self.assertEqual(bench.regressions(baseline), [ 'export/small: 300 statements, baseline 259',
+                                                        'tieout/small: 2.0s wall-clock, baseline 1.0s' ])
+        self.assertEqual(bench.regressions(baseline, tolerance=1.5), [ 'export/small: 300 statements, baseline 259' ])
+
+    def test_lazy_imports(self):
+        # The heavy dependencies are only imported when they are used
+        modules = "'snowflake.connector' in sys.modules, 'cryptography' in sys.modules, 'yaml' in sys.modules"
+        output = subprocess.run([ sys.executable, '-c', f"import sys, cmdlineparse, sfconn, sfconfig, sfprovisionconfig, sfprovisiondiff; print({modules})" ],
+                                cwd=repo_dir, capture_output=True, text=True).stdout
+        self.assertEqual(output.split(), [ 'False', 'False', 'False' ])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+from sfconn import load_private_key
+from sfconnpool import SfConnPool
+from sftestutil import FakeLogger
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+import os
+import tempfile
+import threading
+import unittest
+
+config = { 'user': 'your@login', 'account': 'ACCOUNT', 'role': 'DEMO_ROLE', 'warehouse': 'DEMO_WH',
+           'database': 'DEMO_DB', 'schema': 'PUBLIC', 'backend': 'sim' }
+
+class TestMethods(unittest.TestCase):
+
+    def test_reuse(self):
+        with SfConnPool(config, FakeLogger(), max_size=2) as pool:
+            with pool.session() as first:
+                with pool.session() as second:
+                    self.assertIsNot(first, second)
+            with pool.session() as again:
+                self.assertIn(again, [ first, second ])
+            self.assertEqual(pool.opened, 2)
+
+    def test_max_size(self):
+        in_use = []
+        peak = []
+        lock = threading.Lock()
+        def work(pool):
+            with pool.session() as sf_conn:
+                with lock:
+                    in_use.append(sf_conn)
+                    peak.append(len(in_use))
+                sf_conn.run_query("select count(1) from t").fetchall()
+                with lock:
+                    in_use.remove(sf_conn)
+        with SfConnPool(config, FakeLogger(), max_size=3) as pool:
+            threads = [ threading.Thread(target=work, args=(pool,)) for nr in range(12) ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertLessEqual(max(peak), 3)
+            self.assertLessEqual(pool.opened, 3)
+
+    def test_health_check(self):
+        with SfConnPool(config, FakeLogger(), max_size=1, health_check_seconds=0) as pool:
+            with pool.session() as sf_conn:
+                sf_conn.verify_conn = lambda: False
+            with pool.session() as replaced:
+                self.assertIsNot(replaced, sf_conn)
+            self.assertEqual(pool.opened, 2)
+
+    def test_exit(self):
+        with SfConnPool(config, FakeLogger(), max_size=1) as pool:
+            with self.assertRaises(SystemExit):
+                with pool.session() as sf_conn:
+                    exit(-1)
+            # The slot is not lost, the session is handed out again
+            self.assertEqual((pool.size, len(pool.idle)), (1, 1))
+            with pool.session() as again:
+                self.assertIs(again, sf_conn)
+
+    def test_private_key_cached(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'rsa_key.p8')
+            key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+            with open(filename, 'wb') as fobj:
+                fobj.write(key.private_bytes(encoding=serialization.Encoding.PEM, format=serialization.PrivateFormat.PKCS8,
+                                             encryption_algorithm=serialization.NoEncryption()))
+            self.assertIs(load_private_key(filename), load_private_key(filename))
+
+if __name__ == '__main__':
+    unittest.main()
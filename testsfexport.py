@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+
+from sfconn import SfConn, SfConnError
+from sfarchive import SfArchive, list_archives
+from sfexport import SfExport, SfExportArchive, SfExportStore, expand_db_sc, has_pattern
+from sftestutil import FakeLogger
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+listing = [ [ 'YOURNAMESPACE_PRD_DB', 'SALES' ], [ 'YOURNAMESPACE_PRD_DB', 'PUBLIC' ],
+            [ 'YOURNAMESPACE_DEV_DB', 'SALES' ], [ 'OTHER_DB', 'SALES' ] ]
+
+config = { 'user': 'your@login', 'account': 'ACCOUNT', 'role': 'DEMO_ROLE', 'warehouse': 'SIM_WH_000',
+           'database': 'SIM_DB_000', 'schema': 'SC_000', 'backend': 'sim',
+           'sim': { 'databases': 1, 'schemas': 3, 'objects': 4, 'columns': 2, 'roles': 2 } }
+
+class FlakySfConn(SfConn):
+    """Fails listing the objects of SC_001 failures times, SC_002 has no access"""
+
+    def __init__(self, failures):
+        super().__init__(config, FakeLogger())
+        self.failures = failures
+
+    def get_objs_by_type(self, db_nm, sc_nm, type):
+        if sc_nm == 'SC_001' and self.failures > 0:
+            self.failures -= 1
+            raise ConnectionError('Connection reset by peer')
+        if sc_nm == 'SC_002':
+            raise SfConnError(f"Could not use database {db_nm} and schema {sc_nm}: insufficient privileges")
+        return super().get_objs_by_type(db_nm, sc_nm, type)
+
+class FlakyDdlSfConn(SfConn):
+    """Loses its connection getting the first DDL"""
+
+    def __init__(self):
+        super().__init__(config, FakeLogger())
+        self.failures = 1
+
+    def get_ddl(self, db_nm, sc_nm, type, name):
+        if self.failures > 0:
+            self.failures -= 1
+            raise ConnectionError('Connection reset by peer')
+        return super().get_ddl(db_nm, sc_nm, type, name)
+
+class SharedSessionSfConn(SfConn):
+    """Gets a DDL on the same session from another thread right after every
+       show statement, before its output is read with result_scan"""
+
+    def __init__(self):
+        super().__init__(dict(config, sim=dict(config['sim'], types=[ 'TABLE', 'TASK', 'STREAM' ])), FakeLogger())
+        self.fetched = []
+        next_result = self.conn.next_result
+        def interleaved(query):
+            result = next_result(query)
+            if query.startswith('show '):
+                thread = threading.Thread(target=lambda: self.fetched.append(self.get_ddl('SIM_DB_000', 'SC_000', 'TABLE', 'OBJ_0000')))
+                thread.start()
+                thread.join()
+            return result
+        self.conn.next_result = interleaved
+
+class ListingSfConn(SfConn):
+    """Only lists objects, fetching DDL on it fails the export"""
+
+    def __init__(self):
+        super().__init__(config, FakeLogger())
+
+    def get_ddl(self, db_nm, sc_nm, type, name):
+        raise AssertionError('DDL fetched on the listing session')
+
+class TestMethods(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.export_dir = os.path.join(self.tmp_dir.name, 'export')
+        self.journal = os.path.join(self.tmp_dir.name, 'journal.jsonl')
+        self.db_sc = [ [ 'SIM_DB_000', 'SC_000' ], [ 'SIM_DB_000', 'SC_001' ], [ 'SIM_DB_000', 'SC_002' ] ]
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_expand_db_sc(self):
+        self.assertFalse(has_pattern([ [ 'OTHER_DB', 'SALES' ] ]))
+        self.assertTrue(has_pattern([ [ 'OTHER_DB', 'SALES' ], [ 'YOURNAMESPACE_%', '%' ] ]))
+        self.assertEqual(expand_db_sc([ [ 'YOURNAMESPACE_PRD_%', '%' ] ], listing, FakeLogger()),
+                         [ [ 'YOURNAMESPACE_PRD_DB', 'SALES' ], [ 'YOURNAMESPACE_PRD_DB', 'PUBLIC' ] ])
+        # Names are kept, overlapping patterns do not export a schema twice and patterns without a match are dropped
+        self.assertEqual(expand_db_sc([ [ 'OTHER_DB', 'SALES' ], [ '%', 'SALES' ], [ 'MISSING_%', '%' ] ], listing, FakeLogger()),
+                         [ [ 'OTHER_DB', 'SALES' ], [ 'YOURNAMESPACE_PRD_DB', 'SALES' ], [ 'YOURNAMESPACE_DEV_DB', 'SALES' ] ])
+
+    def test_retry(self):
+        sf_export = SfExport(FlakySfConn(2), FakeLogger(), self.export_dir, journal=self.journal, backoff_seconds=0)
+        results = sf_export.export(self.db_sc)
+        self.assertEqual((results['SIM_DB_000.SC_000']['status'], results['SIM_DB_000.SC_000']['attempts']), ('done', 1))
+        self.assertEqual((results['SIM_DB_000.SC_001']['status'], results['SIM_DB_000.SC_001']['attempts']), ('done', 3))
+        self.assertEqual(results['SIM_DB_000.SC_001']['catalog_version'], '2024-01-01T00:00:00+00:00')
+        # Missing access is not retried and does not end the run
+        self.assertEqual(results['SIM_DB_000.SC_002'], dict(results['SIM_DB_000.SC_002'], status='failed', attempts=1))
+        sf_export = SfExport(FlakySfConn(5), FakeLogger(), self.export_dir, retries=1, backoff_seconds=0)
+        self.assertEqual(sf_export.export_schema_retry('SIM_DB_000', 'SC_001')['error'], 'Connection reset by peer')
+
+    def test_resume(self):
+        SfExport(FlakySfConn(5), FakeLogger(), self.export_dir, journal=self.journal, retries=0).export(self.db_sc)
+        with open(self.journal, 'a') as fobj:
+            fobj.write('{"schema": "SIM_DB_0')
+        with open(self.journal, 'r') as fobj:
+            entries = [ json.loads(line) for line in fobj.readlines()[:-1] ]
+        self.assertEqual([ entry['status'] for entry in entries ], [ 'done', 'failed', 'failed' ])
+        self.assertEqual(entries[0]['objects'], 4)
+        # Only the schemas that failed are exported again
+        results = SfExport(FlakySfConn(0), FakeLogger(), self.export_dir, journal=self.journal).export(self.db_sc, resume=True)
+        self.assertEqual([ stats['status'] for stats in results.values() ], [ 'skipped', 'done', 'failed' ])
+        results = SfExport(FlakySfConn(0), FakeLogger(), self.export_dir, journal=self.journal).export(self.db_sc, resume=True)
+        self.assertEqual([ stats['status'] for stats in results.values() ], [ 'skipped', 'skipped', 'failed' ])
+
+    def test_store(self):
+        sf_export = SfExportStore(SfConn(config, FakeLogger()), FakeLogger(), self.export_dir)
+        results = sf_export.export(self.db_sc)
+        # The three schemas have the same objects, each body is stored once
+        self.assertEqual(sum(stats['written'] for stats in results.values()), 12)
+        self.assertEqual((sf_export.blob_store.written, sf_export.blob_store.reused), (4, 8))
+        self.assertEqual(os.listdir(os.path.join(self.export_dir, 'SIM_DB_000.SC_001')), [ 'index.json' ])
+        sf_export = SfExportStore(SfConn(config, FakeLogger()), FakeLogger(), self.export_dir)
+        results = sf_export.export(self.db_sc)
+        self.assertEqual(sum(stats['written'] for stats in results.values()), 0)
+        # The materialized layout is the one of the classic export
+        files_dir = os.path.join(self.tmp_dir.name, 'files')
+        SfExport(SfConn(config, FakeLogger()), FakeLogger(), files_dir).export(self.db_sc)
+        materialized_dir = os.path.join(self.tmp_dir.name, 'materialized')
+        self.assertEqual(SfExportStore(None, FakeLogger(), self.export_dir).materialize(materialized_dir, [ 'SIM_DB_000.SC_002' ]), 4)
+        schema_dir = os.path.join(files_dir, 'SIM_DB_000.SC_002')
+        for file_nm in os.listdir(schema_dir):
+            with open(os.path.join(schema_dir, file_nm), 'r') as fobj, open(os.path.join(materialized_dir, 'SIM_DB_000.SC_002', file_nm), 'r') as mobj:
+                self.assertEqual(fobj.read(), mobj.read())
+        self.assertEqual(sorted(os.listdir(schema_dir)), sorted(os.listdir(os.path.join(materialized_dir, 'SIM_DB_000.SC_002'))))
+
+    def test_archive(self):
+        SfExportArchive(SfConn(config, FakeLogger()), FakeLogger(), self.export_dir).export(self.db_sc)
+        first = list_archives(self.export_dir)[0]
+        # Nothing changed, SC_001 fails and SC_002 is not exported - both are kept from the first archive
+        sf_export = SfExportArchive(FlakySfConn(5), FakeLogger(), self.export_dir, retries=0)
+        results = sf_export.export(self.db_sc[:2])
+        self.assertEqual([ stats['status'] for stats in results.values() ], [ 'done', 'failed' ])
+        self.assertEqual(results['SIM_DB_000.SC_000']['written'], 0)
+        self.assertFalse(os.path.exists(os.path.join(self.export_dir, 'SIM_DB_000.SC_000')))
+        self.assertEqual(list_archives(self.export_dir, partial=True), [])
+        old, new = SfArchive(first), SfArchive(sf_export.archive_file)
+        self.assertEqual(new.schemas(), [ 'SIM_DB_000.SC_000', 'SIM_DB_000.SC_001', 'SIM_DB_000.SC_002' ])
+        self.assertEqual(old.diff(new), { 'added': [], 'removed': [], 'changed': [] })
+        old.close()
+        new.close()
+
+    def test_pipeline(self):
+        SfExport(SfConn(config, FakeLogger()), FakeLogger(), self.export_dir).export(self.db_sc)
+        pipelined_dir = os.path.join(self.tmp_dir.name, 'pipelined')
+        sf_export = SfExport(SfConn(config, FakeLogger()), FakeLogger(), pipelined_dir, backoff_seconds=0,
+                             fetch_conns=[ FlakyDdlSfConn(), SfConn(config, FakeLogger()) ], queue_size=1, batch_size=3)
+        results = sf_export.export(self.db_sc)
+        # The error of a fetcher fails the attempt of one schema, which is exported again
+        self.assertEqual([ stats['status'] for stats in results.values() ], [ 'done', 'done', 'done' ])
+        self.assertEqual(sum(stats['attempts'] for stats in results.values()), 4)
+        # Objects of the failed attempt may have been listed, fetched and written before it failed
+        for stage in [ 'list', 'fetch', 'write' ]:
+            self.assertGreaterEqual(sf_export.stages[stage].items, 12)
+        for schema in results:
+            for file_nm in os.listdir(os.path.join(self.export_dir, schema)):
+                with open(os.path.join(self.export_dir, schema, file_nm), 'r') as fobj, open(os.path.join(pipelined_dir, schema, file_nm), 'r') as pobj:
+                    self.assertEqual(fobj.read(), pobj.read())
+
+    def test_shared_session(self):
+        sf_conn = SharedSessionSfConn()
+        self.assertEqual([ obj[0] for obj in sf_conn.get_objs_by_type('SIM_DB_000', 'SC_000', 'TASK') ], [ 'OBJ_0001' ])
+        self.assertEqual([ obj[0] for obj in sf_conn.get_objs_by_type('SIM_DB_000', 'SC_000', 'STREAM') ], [ 'OBJ_0002' ])
+        self.assertEqual(len(sf_conn.fetched), 2)
+        # DDL is only fetched on the sessions of the fetchers
+        sf_export = SfExport(ListingSfConn(), FakeLogger(), self.export_dir, fetch_conns=[ SfConn(config, FakeLogger()) ])
+        results = sf_export.export(self.db_sc)
+        self.assertEqual([ (stats['status'], stats['written']) for stats in results.values() ], [ ('done', 4) ] * 3)
+
+if __name__ == '__main__':
+    unittest.main()
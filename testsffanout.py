@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+from sfconfig import SfConfig
+from sffanout import SfFanout
+from sftestutil import FakeLogger
+import json
+import os
+import tempfile
+import unittest
+
+config = { 'account': 'ACCOUNT', 'user': 'your@login', 'warehouse': 'DEMO_WH', 'role': 'DEMO_ROLE',
+           'database': 'DEMO_DB', 'schema': 'PUBLIC', 'service_socket': '/tmp/sf_service.sock',
+           'profiles': { 'US': { 'account': 'US_ACCOUNT' }, 'EU': { 'account': 'EU_ACCOUNT', 'role': 'EU_ROLE' } } }
+
+# Prints its command line, profile BAD fails
+script = """import sys
+print(' '.join(sys.argv[1:]))
+if sys.argv[2] == 'BAD':
+    print('Error connecting', file=sys.stderr)
+    exit(2)
+"""
+
+class TestMethods(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp_dir.name)
+        with open('config.json', 'w') as fobj:
+            json.dump(config, fobj)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp_dir.cleanup()
+
+    def test_profile_config(self):
+        sf_cfg = SfConfig('config.json')
+        eu = sf_cfg.profile_config('EU')
+        self.assertEqual((eu['account'], eu['role'], eu['warehouse']), ('EU_ACCOUNT', 'EU_ROLE', 'DEMO_WH'))
+        self.assertNotIn('profiles', eu)
+        self.assertNotIn('service_socket', eu)
+        self.assertIs(sf_cfg.profile_config(None), sf_cfg.config)
+        self.assertEqual(sf_cfg.profile_names([ 'ALL' ]), [ 'US', 'EU' ])
+        self.assertEqual(sf_cfg.profile_names(None), [])
+        with self.assertRaises(ValueError):
+            sf_cfg.profile_names([ 'US', 'APAC' ])
+        with self.assertRaises(ValueError):
+            sf_cfg.profile_config('APAC')
+
+    def test_fanout(self):
+        with open('tool.py', 'w') as fobj:
+            fobj.write(script)
+        fanout = SfFanout('tool.py', FakeLogger(), 'out', max_workers=2)
+        report = fanout.run([ 'US', 'EU', 'BAD' ], lambda profile, profile_dir: [ '--export_dir', profile_dir ],
+                            lambda result: result.update(merged=True))
+        self.assertEqual(report['failed'], [ 'BAD' ])
+        self.assertEqual(report['profiles']['BAD']['error'], 'Error connecting')
+        self.assertTrue(report['profiles']['US']['merged'])
+        with open(report['profiles']['EU']['stdout'], 'r') as fobj:
+            self.assertEqual(fobj.read(), f"--profile EU --export_dir {os.path.abspath('out/EU')}\n")
+        with open(os.path.join('out', 'report.json'), 'r') as fobj:
+            self.assertEqual(list(json.load(fobj)['profiles']), [ 'US', 'EU', 'BAD' ])
+
+if __name__ == '__main__':
+    unittest.main()
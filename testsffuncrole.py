@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+from sfbackend import programming_error
+from sffuncrole import SfFuncRole, apply_order
+from sfgrantindex import SfGrantIndex
+from sfprovisionconfig import SfProvisionConfig
+from sftestutil import FakeConn, FakeCursor, FakeLogger, changed_on
+import unittest
+
+grants = { 'allfuturegrantsdb':   [ ('_DB_SENSITIVE_DB_RO_AR', 'SENSITIVE_DB') ],
+           'allfuturegrantssc':   [ ('_SC_TEST_DB_TEST_SC_RW_AR', 'TEST_DB', 'TEST_SC'),
+                                    ('_SC_TEST_DB_TEST_SC_RO_AR', 'TEST_DB', 'TEST_SC') ],
+           'allgrantswh':         [ ('_WH_TEST_WH_USE_AR', 'TEST_WH'), ('_WH_LOAD_WH_MOD_AR', 'LOAD_WH') ],
+           'account_usage.roles': [ ('TEST_READER_FR',) ],
+           'grants_to_roles':     [ ('TEST_READER_FR', '_WH_TEST_WH_USE_AR', changed_on, False),
+                                    ('TEST_READER_FR', '_SC_TEST_DB_TEST_SC_RO_AR', changed_on, False) ] }
+
+# Roles granted to the role now, account_usage has not caught up yet
+live_grants = [ ('_SC_TEST_DB_TEST_SC_RW_AR',), ('_DB_SENSITIVE_DB_RO_AR',) ]
+
+class LiveConn(FakeConn):
+    """Answers SHOW GRANTS TO ROLE TEST_READER_FR and the result_scan of its
+       output, the other roles do not exist"""
+    def run_query(self, query):
+        if query.startswith('SHOW GRANTS TO ROLE '):
+            self.queries.append(query)
+            if query != 'SHOW GRANTS TO ROLE TEST_READER_FR':
+                raise programming_error()(f"Role does not exist: {query}")
+            cursor = FakeCursor([])
+            cursor.sfqid = 'show-grants-query-id'
+            return cursor
+        if "result_scan('show-grants-query-id')" in query:
+            self.queries.append(query)
+            return FakeCursor(live_grants)
+        return super().run_query(query)
+
+def func_role():
+    prov_cfg = SfProvisionConfig()
+    conn = LiveConn(grants)
+    return SfFuncRole(prov_cfg, conn, FakeLogger(), SfGrantIndex(conn, FakeLogger()))
+
+class TestMethods(unittest.TestCase):
+
+    def test_apply_order(self):
+        inc, exc = { 'A_AR', 'B_AR' }, { 'B_AR', 'C_AR' }
+        self.assertEqual(apply_order('INCEXC', inc, exc, { 'C_AR' }, set()), { 'A_AR' })
+        self.assertEqual(apply_order('EXCINC', inc, exc, { 'C_AR' }, set()), { 'A_AR', 'C_AR' })
+        self.assertEqual(apply_order('EXCINC', inc, set(), set(), { 'A_AR' }), { 'B_AR' })
+
+    def test_role_delta(self):
+        delta = func_role().role_delta('TEST_READER_FR')
+        self.assertFalse(delta.create_role)
+        self.assertEqual(delta.grant_ars, [ '_SC_TEST_DB_TEST_SC_RW_AR' ])
+        self.assertEqual(delta.revoke_ars, [ '_SC_TEST_DB_TEST_SC_RO_AR' ])
+        self.assertEqual(delta.statements(), [ 'GRANT ROLE _SC_TEST_DB_TEST_SC_RW_AR TO ROLE TEST_READER_FR;',
+                                               'REVOKE ROLE _SC_TEST_DB_TEST_SC_RO_AR FROM ROLE TEST_READER_FR;' ])
+
+    def test_role_delta_create(self):
+        delta = func_role().role_delta('TEST_MODIFY_ALL_WH_FR')
+        self.assertTrue(delta.create_role)
+        self.assertEqual(delta.statements(), [ 'CREATE ROLE IF NOT EXISTS TEST_MODIFY_ALL_WH_FR;',
+                                               'GRANT ROLE _WH_LOAD_WH_MOD_AR TO ROLE TEST_MODIFY_ALL_WH_FR;' ])
+
+    def test_role_delta_live(self):
+        sf_func_role = func_role()
+        # The dry run uses the snapshot, applying reads the grants of the role again
+        self.assertEqual(sf_func_role.role_delta('TEST_READER_FR').grant_ars, [ '_SC_TEST_DB_TEST_SC_RW_AR' ])
+        delta = sf_func_role.role_delta('TEST_READER_FR', live=True)
+        self.assertIn('SHOW GRANTS TO ROLE TEST_READER_FR', sf_func_role.sf_conn.queries)
+        # Granted RW, revoked the warehouse role and granted SENSITIVE since the snapshot
+        self.assertEqual(delta.grant_ars, [ '_WH_TEST_WH_USE_AR' ])
+        self.assertEqual(delta.revoke_ars, [ '_DB_SENSITIVE_DB_RO_AR' ])
+        # The index now has the live grants of the role
+        self.assertEqual(sf_func_role.grant_index.granted_roles('TEST_READER_FR'), { '_SC_TEST_DB_TEST_SC_RW_AR', '_DB_SENSITIVE_DB_RO_AR' })
+
+    def test_role_delta_live_missing_role(self):
+        sf_func_role = func_role()
+        sf_func_role.grant_index.load()
+        sf_func_role.grant_index.roles.add('TEST_MODIFY_ALL_WH_FR')
+        # Dropped since account_usage was read
+        self.assertFalse(sf_func_role.role_delta('TEST_MODIFY_ALL_WH_FR').create_role)
+        self.assertTrue(sf_func_role.role_delta('TEST_MODIFY_ALL_WH_FR', live=True).create_role)
+
+    def test_record_applied(self):
+        sf_func_role = func_role()
+        delta = sf_func_role.role_delta('TEST_READER_FR')
+        results = [ { 'statement': statement, 'status': 'applied' } for statement in delta.statements() ]
+        sf_func_role.record_applied(delta, results)
+        self.assertEqual(sf_func_role.grant_index.granted_roles('TEST_READER_FR'), { '_WH_TEST_WH_USE_AR', '_SC_TEST_DB_TEST_SC_RW_AR' })
+        self.assertTrue(sf_func_role.role_delta('TEST_READER_FR').is_empty())
+
+if __name__ == '__main__':
+    unittest.main()
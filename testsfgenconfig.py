@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+
+from sfgenconfig import SfGenConfig
+from sfprovisionconfig import SfProvisionConfig
+from sfrolegraph import SfRoleGraph
+from sftestutil import FakeConn, FakeLogger, changed_on
+import io
+import json
+import unittest
+
+grants = { 'allgrantswh':       [ ('_WH_TEST_WH_USE_AR', 'TEST_WH') ],
+           'allfuturegrantssc': [ ('_SC_TEST_DB_TEST_SC_RO_AR', 'TEST_DB', 'TEST_SC') ],
+           'allfuturegrantsdb': [ ('_DB_SALES_RO_AR', 'SALES') ],
+           'grants_to_roles':   [ ('TEST_READER_FR', '_WH_TEST_WH_USE_AR', changed_on, False),
+                                  ('TEST_READER_FR', '_SC_TEST_DB_TEST_SC_RO_AR', changed_on, False),
+                                  ('TEST_WRITER_FR', '_DB_SALES_RO_AR', changed_on, False),
+                                  ('TEST_WRITER_FR', 'TEST_READER_FR', changed_on, False),
+                                  ('TEST_WRITER_FR', 'LEGACY_RW_AR', changed_on, False) ] }
+
+class TestMethods(unittest.TestCase):
+
+    def test_write_config(self):
+        conn = FakeConn(grants)
+        gen_cfg = SfGenConfig(SfProvisionConfig(), conn, [ 'TEST_READER_FR', 'TEST_WRITER_FR' ], SfRoleGraph(conn, FakeLogger()))
+        fobj = io.StringIO()
+        gen_cfg.write_config(fobj)
+        config = json.loads(fobj.getvalue())
+        self.assertEqual(config['TEST_READER_FR']['INCLUDE'], [ { "TYPE" : "WAREHOUSE", "WAREHOUSE" : "TEST_WH", "ROLE" : "USE" },
+                                                               { "TYPE" : "SCHEMA", "DATABASE" : "TEST_DB", "SCHEMA" : "TEST_SC", "ROLE" : "RO" } ])
+        self.assertEqual(config['TEST_WRITER_FR']['INCLUDE'], [ { "TYPE" : "DATABASE", "DATABASE" : "SALES", "ROLE" : "RO" },
+                                                               { "TYPE" : "ROLE", "ROLE" : "TEST_READER_FR" } ])
+        self.assertEqual(config['TEST_WRITER_FR']['CUSTOM_INCLUDE'], [ 'LEGACY_RW_AR' ])
+        # One query per source regardless of the number of roles
+        self.assertEqual(len(conn.queries), 4)
+
+if __name__ == '__main__':
+    unittest.main()
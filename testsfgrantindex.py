@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+
+from sfgrantindex import SfGrantIndex, like_to_regex, match_like
+from sftestutil import FakeConn, FakeLogger, changed_on
+import unittest
+
+class TestMethods(unittest.TestCase):
+
+    def test_like_to_regex(self):
+        self.assertTrue(like_to_regex('PRD%').match('PRD_DB'))
+        self.assertFalse(like_to_regex('PRD%').match('DEV_PRD'))
+        self.assertTrue(like_to_regex('_DB_%_RO_AR').match('_DB_SALES_RO_AR'))
+        self.assertFalse(like_to_regex('_DB_%_RO_AR').match('_DB_SALES_RW_AR'))
+        self.assertTrue(like_to_regex('A\\_B').match('A_B'))
+        self.assertFalse(like_to_regex('A\\_B').match('AXB'))
+        self.assertFalse(like_to_regex('A.B').match('AXB'))
+        self.assertEqual(match_like('SALES', {'SALES': 1, 'SALES2': 1}), ['SALES'])
+        # _ is a wildcard in LIKE just like in Snowflake
+        self.assertEqual(sorted(match_like('TEST_DB', {'TEST_DB': 1, 'TESTXDB': 1})), ['TESTXDB', 'TEST_DB'])
+
+    def test_index_lookups(self):
+        conn = FakeConn({ 'allfuturegrantsdb': [ ('_DB_SALES_RO_AR', 'SALES'), ('_DB_SALES_RW_AR', 'SALES'), ('_DB_HR_RO_AR', 'HR') ],
+                          'allfuturegrantssc': [ ('_SC_SALES_RAW_RO_AR', 'SALES', 'RAW'), ('_SC_SALES_STG_RO_AR', 'SALES', 'STG') ],
+                          'allgrantswh':       [ ('_WH_LOAD_USE_AR', 'LOAD') ],
+                          'account_usage.roles': [ ('SALES_FR',), ('HR_FR',) ],
+                          'grants_to_roles':   [ ('SALES_FR', '_DB_SALES_RO_AR', changed_on, False) ] })
+        index = SfGrantIndex(conn, FakeLogger())
+        self.assertEqual(index.db_grantees('%', '_DB_%_RO_AR'), { '_DB_SALES_RO_AR', '_DB_HR_RO_AR' })
+        self.assertEqual(index.sc_grantees('SALES', 'R%'), { '_SC_SALES_RAW_RO_AR' })
+        self.assertEqual(index.wh_grantees('LOAD'), { '_WH_LOAD_USE_AR' })
+        self.assertEqual(index.roles_like('%_FR'), { 'SALES_FR', 'HR_FR' })
+        self.assertTrue(index.role_exists('SALES_FR'))
+        self.assertEqual(index.granted_roles('SALES_FR'), { '_DB_SALES_RO_AR' })
+        self.assertEqual(index.granted_roles('HR_FR'), set())
+        # Everything is answered from the snapshot taken with the first lookup
+        self.assertEqual(len(conn.queries), 5)
+
+if __name__ == '__main__':
+    unittest.main()
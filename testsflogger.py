@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+from sflogger import SfLogger
+import io
+import json
+import sys
+import unittest
+
+class Costly():
+    """Counts how often it is formatted"""
+    formatted = 0
+
+    def __str__(self):
+        Costly.formatted += 1
+        return 'COSTLY'
+
+class TestMethods(unittest.TestCase):
+
+    def setUp(self):
+        self.stderr = sys.stderr
+        sys.stderr = io.StringIO()
+
+    def tearDown(self):
+        sys.stderr = self.stderr
+
+    def test_text(self):
+        logger = SfLogger('INFO', 'testsflogger_text', log_format='text')
+        # A second logger of the same name does not write every record twice
+        logger = SfLogger('INFO', 'testsflogger_text', log_format='text')
+        logger.debug("Skipped %s", Costly(), schema='DB.SC')
+        logger.info("Exported %s in %.1f ms", 'DB.SC', 12.34, schema='DB.SC', duration_ms=12.3)
+        logger.flush()
+        lines = sys.stderr.getvalue().splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertRegex(lines[0], r' - INFO - Exported DB\.SC in 12\.3 ms$')
+        self.assertEqual(Costly.formatted, 0)
+        self.assertFalse(logger.is_enabled('DEBUG'))
+
+    def test_json(self):
+        logger = SfLogger('DEBUG', 'testsflogger_json', log_format='json')
+        logger.debug("Applied in %.3fs: %s", 0.25, 'GRANT ROLE A TO ROLE B', duration_ms=250.0, query_id='01b2')
+        logger.warning("100% done")
+        logger.flush()
+        entries = [ json.loads(line) for line in sys.stderr.getvalue().splitlines() ]
+        self.assertEqual(entries[0]['message'], 'Applied in 0.250s: GRANT ROLE A TO ROLE B')
+        self.assertEqual((entries[0]['level'], entries[0]['duration_ms'], entries[0]['query_id']), ('DEBUG', 250.0, '01b2'))
+        self.assertEqual(entries[1]['message'], '100% done')
+        with self.assertRaises(ValueError):
+            SfLogger('INFO', 'testsflogger_xml', log_format='xml')
+
+if __name__ == '__main__':
+    unittest.main()
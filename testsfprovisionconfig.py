@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+from sfprovisionconfig import SfProvisionConfig
+from sfcompiledconfig import SfCompiledConfig, config_key
+from sftestutil import FakeCmdline
+import os
+import pickle
+import tempfile
+import unittest
+
+def provision(grants):
+    prov_cfg = SfProvisionConfig()
+    for priv, on, role in grants:
+        prov_cfg.grant_privilege(priv, on, 'TEST_DB.TEST_SC', role)
+    return prov_cfg
+
+class TestMethods(unittest.TestCase):
+
+    def test_compact_merges_same_target_and_role(self):
+        prov_cfg = provision([ ('SELECT', 'FUTURE VIEWS IN SCHEMA', 'RO_AR'),
+                               ('REFERENCES', 'FUTURE VIEWS IN SCHEMA', 'RO_AR'),
+                               ('SELECT', 'FUTURE VIEWS IN SCHEMA', 'RX_AR') ])
+        prov_cfg.compact_grants()
+        self.assertEqual(prov_cfg.obj_grants, [ 'GRANT SELECT, REFERENCES ON FUTURE VIEWS IN SCHEMA TEST_DB.TEST_SC TO ROLE RO_AR;',
+                                                'GRANT SELECT ON FUTURE VIEWS IN SCHEMA TEST_DB.TEST_SC TO ROLE RX_AR;' ])
+
+    def test_compact_create_privileges(self):
+        prov_cfg = SfProvisionConfig()
+        prov_cfg.grant_create_privilege('TABLE', 'ON SCHEMA TEST_DB.TEST_SC', 'RW_AR')
+        prov_cfg.grant_create_privilege('VIEW', 'ON SCHEMA TEST_DB.TEST_SC', 'RW_AR')
+        prov_cfg.grant_create_privilege('TABLE', 'ON SCHEMA TEST_DB.TEST_SC', 'RW_AR')
+        prov_cfg.compact_grants()
+        self.assertEqual(prov_cfg.obj_grants, [ 'GRANT CREATE TABLE, CREATE VIEW ON SCHEMA TEST_DB.TEST_SC TO ROLE RW_AR;' ])
+        self.assertEqual(prov_cfg.revoke_obj_grants, [ 'REVOKE CREATE TABLE, CREATE VIEW ON SCHEMA TEST_DB.TEST_SC FROM ROLE RW_AR;' ])
+
+    def test_compact_all_supersedes(self):
+        prov_cfg = provision([ ('SELECT', 'FUTURE TABLES IN SCHEMA', 'RW_AR'),
+                               ('ALL', 'FUTURE TABLES IN SCHEMA', 'RW_AR') ])
+        prov_cfg.compact_grants()
+        self.assertEqual(prov_cfg.obj_grants, [ 'GRANT ALL ON FUTURE TABLES IN SCHEMA TEST_DB.TEST_SC TO ROLE RW_AR;' ])
+
+    def test_compact_revoke_symmetry(self):
+        prov_cfg = provision([ ('USAGE', 'SCHEMA', 'RO_AR'),
+                               ('MONITOR', 'SCHEMA', 'RO_AR'),
+                               ('USAGE', 'SCHEMA', 'RO_AR') ])
+        prov_cfg.compact_grants()
+        self.assertEqual(len(prov_cfg.obj_grants), len(prov_cfg.revoke_obj_grants))
+        for grant, revoke in zip(prov_cfg.obj_grants, prov_cfg.revoke_obj_grants):
+            self.assertEqual(grant.replace('GRANT ', 'REVOKE ', 1).replace(' TO ROLE ', ' FROM ROLE '), revoke)
+
+    def test_compiled_config(self):
+        prov_cfg = SfProvisionConfig()
+        compiled = SfCompiledConfig('test', prov_cfg.db, prov_cfg.sc, prov_cfg.wh, prov_cfg.fr)
+        self.assertEqual(list(compiled.sc.role_hierarchy), prov_cfg.sc.config['ROLE_HIERARCHY'])
+        self.assertEqual(compiled.sc.ar_role('RO', 'TEST_DB', 'TEST_SC'), f"{prov_cfg.sc.config['AR_PREFIX']}TEST_DB_TEST_SC_RO_AR")
+        self.assertIn(('SELECT', 'TABLES'), compiled.sc.expansions['RO'])
+        # Every CREATE privilege is granted once across the hierarchy
+        creates = [obj for level in compiled.sc.role_hierarchy for obj in compiled.sc.creates[level]]
+        self.assertEqual(len(creates), len(set(creates)))
+        restored = pickle.loads(pickle.dumps(compiled))
+        self.assertEqual(restored.sc.expansions, compiled.sc.expansions)
+        self.assertEqual(restored.fr_cfg.config, prov_cfg.fr.config)
+
+    def test_generate_from_compiled_config(self):
+        prov_cfg = SfProvisionConfig()
+        prov_cfg.compiled = SfCompiledConfig('test', prov_cfg.db, prov_cfg.sc, prov_cfg.wh, prov_cfg.fr)
+        # Only the compiled model is used once the configuration is compiled
+        prov_cfg.compiled.sc.ar_prefix  = '_X_'
+        prov_cfg.compiled.sc.role_owner = 'X_OWNER'
+        prov_cfg.cmdline = FakeCmdline('schema', 'TEST_DB', 'TEST_SC')
+        prov_cfg.create_sc_roles()
+        prov_cfg.create_sc_grants()
+        prov_cfg.create_sc_r2r_grants()
+        model = prov_cfg.compiled.sc
+        self.assertEqual(prov_cfg.objects, [ f"CREATE ROLE IF NOT EXISTS _X_TEST_DB_TEST_SC_{level}_AR;" for level in model.role_hierarchy[::-1] ])
+        self.assertIn(f"GRANT OWNERSHIP ON ROLE _X_TEST_DB_TEST_SC_{model.role_hierarchy[0]}_AR TO ROLE X_OWNER REVOKE CURRENT GRANTS;", prov_cfg.owner_grants)
+        self.assertIn(f"GRANT ROLE _X_TEST_DB_TEST_SC_{model.role_hierarchy[0]}_AR TO ROLE X_OWNER;", prov_cfg.role_grants)
+        creates = [ grant.split()[2] for grant in prov_cfg.obj_grants if grant.startswith('GRANT CREATE ') ]
+        self.assertEqual(creates, [ obj.split()[0] for level in model.role_hierarchy[::-1] for obj in model.creates[level] ])
+
+    def test_config_key(self):
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            os.chdir(tmp_dir)
+            try:
+                with open('test-config.json', 'w') as fobj:
+                    fobj.write('{}')
+                key = config_key(['test-config.json'])
+                self.assertEqual(config_key(['test-config.json']), key)
+                # Touching the file keeps the compiled configuration, editing it does not
+                stat = os.stat('test-config.json')
+                os.utime('test-config.json', ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+                self.assertEqual(config_key(['test-config.json']), key)
+                with open('test-config.json', 'w') as fobj:
+                    fobj.write('{ }')
+                self.assertNotEqual(config_key(['test-config.json']), key)
+            finally:
+                os.chdir(cwd)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+from sfbackend import programming_error
+from sfprovisionconfig import SfProvisionConfig
+from sfprovisiondiff import SfProvisionDiff, singular
+from sftestutil import FakeCmdline, FakeConn, FakeLogger
+import contextlib
+import io
+import unittest
+
+sc = 'TEST_DB.TEST_SC'
+ro, rx, rw, adm = [ f"_SC_TEST_DB_TEST_SC_{level}_AR" for level in [ 'RO', 'RX', 'RW', 'ADM' ] ]
+
+def grant(privilege, grantee, granted_to='ROLE'):
+    return { 'privilege': privilege, 'granted_to': granted_to, 'grantee_name': grantee }
+
+def future(privilege, grant_on, grantee):
+    return { 'privilege': privilege, 'grant_on': grant_on, 'grant_to': 'ROLE', 'grantee_name': grantee }
+
+def role_grant(grantee, granted_to='ROLE'):
+    return { 'role': ro, 'granted_to': granted_to, 'grantee_name': grantee }
+
+# SHOW output of a schema that was provisioned before and has drifted since
+shows = { "SHOW SCHEMAS LIKE 'TEST_SC' IN DATABASE TEST_DB":  [ { 'name': 'TEST_SC', 'owner': 'SYSADMIN' } ],
+          "SHOW GRANTS ON DATABASE TEST_DB":                  [ grant('USAGE', ro) ],
+          f"SHOW GRANTS ON SCHEMA {sc}":                      [ grant('OWNERSHIP', 'SYSADMIN'), grant('MONITOR', ro) ],
+          f"SHOW FUTURE GRANTS IN SCHEMA {sc}":               [ future('SELECT', 'TABLE', ro), future('INSERT', 'TABLE', ro),
+                                                                future('INSERT', 'TABLE', rx), future('UPDATE', 'TABLE', rx),
+                                                                future('INSERT', 'TABLE', rw), future('SELECT', 'VIEW', rw),
+                                                                future('REFERENCES', 'VIEW', rw) ],
+          "SHOW ROLES LIKE '_SC_TEST_DB_TEST_SC_%'":          [ { 'name': ro, 'owner': 'SYSADMIN' }, { 'name': rx, 'owner': 'SYSADMIN' },
+                                                                { 'name': rw, 'owner': 'USERADMIN' } ],
+          f"SHOW GRANTS OF ROLE {ro}":                        [ role_grant(rx), role_grant('_DB_TEST_DB_RO_AR'), role_grant('STALE_AR'),
+                                                                role_grant('SALES_FR'), role_grant('JANE', 'USER') ] }
+
+class ShowCursor():
+    def __init__(self, rows):
+        columns = []
+        for row in rows:
+            columns.extend(col for col in row if col not in columns)
+        self.description = [ (col,) for col in columns ]
+        self.rows = [ tuple(row.get(col) for col in columns) for row in rows ]
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def close(self):
+        pass
+
+class ShowConn(FakeConn):
+    """Answers SHOW commands with the rows of the exact query, SHOW on an
+       object that does not exist fails like it does in Snowflake"""
+    def run_query(self, query):
+        self.queries.append(query)
+        if query not in self.results:
+            raise programming_error()(f"Object does not exist: {query}")
+        return ShowCursor(self.results[query])
+
+def provision_diff(results):
+    prov_cfg = SfProvisionConfig()
+    prov_cfg.cmdline = FakeCmdline('schema', 'TEST_DB', 'TEST_SC')
+    prov_cfg.obj_config = { 'TRANSIENT': False }
+    prov_cfg.create_sc()
+    prov_cfg.create_sc_roles()
+    prov_cfg.create_sc_grants()
+    prov_cfg.create_sc_r2r_grants()
+    prov_diff = SfProvisionDiff(prov_cfg, ShowConn(results), FakeLogger())
+    prov_diff.snapshot()
+    delta = [ statement for phase, statements in prov_diff.delta_phases(prov_cfg.create_phases()) for statement in statements ]
+    return prov_cfg, prov_diff, delta
+
+class TestMethods(unittest.TestCase):
+
+    def test_singular(self):
+        self.assertEqual(singular('TABLES'), 'TABLE')
+        self.assertEqual(singular('file_formats'), 'FILE FORMAT')
+        self.assertEqual(singular('MATERIALIZED VIEWS'), 'MATERIALIZED VIEW')
+
+    def test_snapshot(self):
+        prov_cfg, prov_diff, delta = provision_diff(shows)
+        self.assertEqual(prov_diff.objects, { ('SCHEMA', sc): 'SYSADMIN' })
+        self.assertEqual(prov_diff.roles, { ro: 'SYSADMIN', rx: 'SYSADMIN', rw: 'USERADMIN' })
+        self.assertEqual(prov_diff.grants[('SCHEMA', sc, ro)], { 'MONITOR' })
+        self.assertEqual(prov_diff.future[('TABLE', 'SCHEMA', sc, rx)], { 'INSERT', 'UPDATE' })
+        # Users and roles that are not granted are left out, missing roles are not queried
+        self.assertEqual(prov_diff.role_grants, { (ro, rx), (ro, '_DB_TEST_DB_RO_AR'), (ro, 'STALE_AR'), (ro, 'SALES_FR') })
+        self.assertNotIn(f"SHOW GRANTS OF ROLE {adm}", prov_diff.sf_conn.queries)
+
+    def test_delta_existing(self):
+        prov_cfg, prov_diff, delta = provision_diff(shows)
+        for statement in [ f"CREATE ROLE IF NOT EXISTS {ro};",
+                           f"GRANT OWNERSHIP ON SCHEMA {sc} TO ROLE SYSADMIN REVOKE CURRENT GRANTS;",
+                           f"GRANT OWNERSHIP ON ROLE {ro} TO ROLE SYSADMIN REVOKE CURRENT GRANTS;",
+                           f"GRANT ROLE {ro} TO ROLE {rx};",
+                           "GRANT USAGE ON DATABASE TEST_DB TO ROLE _SC_TEST_DB_TEST_SC_RO_AR;",
+                           f"GRANT SELECT ON FUTURE TABLES ON SCHEMA {sc} TO ROLE {ro};",
+                           # ALL is present when every privilege of the type is held or the target is owned
+                           f"GRANT ALL ON FUTURE VIEWS ON SCHEMA {sc} TO ROLE {rw};",
+                           f"GRANT ALL PRIVILEGES ON SCHEMA {sc} TO ROLE SYSADMIN;" ]:
+            self.assertIn(statement, prov_cfg.objects + prov_cfg.owner_grants + prov_cfg.role_grants + prov_cfg.obj_grants)
+            self.assertNotIn(statement, delta)
+        self.assertFalse(any(statement.startswith('CREATE SCHEMA ') for statement in delta))
+
+    def test_delta_partial(self):
+        prov_cfg, prov_diff, delta = provision_diff(shows)
+        self.assertIn(f"GRANT INSERT, UPDATE, TRUNCATE, DELETE, REFERENCES ON FUTURE TABLES ON SCHEMA {sc} TO ROLE {rx};", prov_cfg.obj_grants)
+        self.assertIn(f"GRANT TRUNCATE, DELETE, REFERENCES ON FUTURE TABLES ON SCHEMA {sc} TO ROLE {rx};", delta)
+        # Whether every existing table has the privileges is not known
+        self.assertIn(f"GRANT INSERT, UPDATE, TRUNCATE, DELETE, REFERENCES ON ALL TABLES ON SCHEMA {sc} TO ROLE {rx};", delta)
+
+    def test_delta_missing(self):
+        prov_cfg, prov_diff, delta = provision_diff(shows)
+        for statement in [ f"CREATE ROLE IF NOT EXISTS {adm};",
+                           f"GRANT OWNERSHIP ON ROLE {adm} TO ROLE SYSADMIN REVOKE CURRENT GRANTS;",
+                           # Owned by another role
+                           f"GRANT OWNERSHIP ON ROLE {rw} TO ROLE SYSADMIN REVOKE CURRENT GRANTS;",
+                           f"GRANT ROLE {rx} TO ROLE {rw};",
+                           f"GRANT USAGE ON SCHEMA {sc} TO ROLE {ro};",
+                           f"GRANT REFERENCES ON FUTURE VIEWS ON SCHEMA {sc} TO ROLE {ro};",
+                           # Only some of the privileges of ALL are held
+                           f"GRANT ALL ON FUTURE TABLES ON SCHEMA {sc} TO ROLE {rw};",
+                           # ON ALL is kept even though the FUTURE grant is present
+                           f"GRANT SELECT ON ALL TABLES ON SCHEMA {sc} TO ROLE {ro};" ]:
+            self.assertIn(statement, delta)
+        # A role holding one privilege on the schema still needs ALL
+        self.assertEqual(prov_diff.delta_statement(f"GRANT ALL ON SCHEMA {sc} TO ROLE {ro};"), f"GRANT ALL ON SCHEMA {sc} TO ROLE {ro};")
+        # Statements that cannot be interpreted are always kept
+        self.assertEqual(prov_diff.delta_statement('ALTER SCHEMA TEST_DB.TEST_SC SET COMMENT = \'x\';'), 'ALTER SCHEMA TEST_DB.TEST_SC SET COMMENT = \'x\';')
+
+    def test_delta_new_object(self):
+        # Nothing exists yet, every SHOW fails and every statement is needed
+        prov_cfg, prov_diff, delta = provision_diff({})
+        self.assertEqual(delta, [ statement for phase, statements in prov_cfg.create_phases() for statement in statements ])
+        self.assertEqual(prov_diff.revokes(), [])
+
+    def test_revokes(self):
+        prov_cfg, prov_diff, delta = provision_diff(shows)
+        # Role grants to functional roles are managed by sf_funcrole
+        self.assertEqual(prov_diff.revokes(), [ f"REVOKE MONITOR ON SCHEMA {sc} FROM ROLE {ro};",
+                                                f"REVOKE INSERT ON FUTURE TABLES IN SCHEMA {sc} FROM ROLE {ro};",
+                                                f"REVOKE ROLE {ro} FROM ROLE STALE_AR;" ])
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            prov_diff.print_revokes(prov_diff.revokes())
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0], "-- Grants not in the configuration:")
+        self.assertIn(f"-- REVOKE ROLE {ro} FROM ROLE STALE_AR;", lines)
+        self.assertTrue(all(line.startswith('-- ') for line in lines if line != ''))
+
+if __name__ == '__main__':
+    unittest.main()
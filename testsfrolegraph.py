@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+from sfrolegraph import SfRoleGraph
+from sftestutil import FakeConn, FakeLogger
+from datetime import datetime, timedelta, timezone
+import os
+import tempfile
+import unittest
+
+start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+def grant(grantee, role, minutes=0, deleted=False):
+    return (grantee, role, start + timedelta(minutes=minutes), deleted)
+
+hierarchy = [ grant('_SC_DB_SC_RW_AR', '_SC_DB_SC_RO_AR'),
+              grant('_SC_DB_SC_ADM_AR', '_SC_DB_SC_RW_AR'),
+              grant('SYSADMIN', '_SC_DB_SC_ADM_AR'),
+              grant('READER_FR', '_SC_DB_SC_RO_AR'),
+              grant('WRITER_FR', '_SC_DB_SC_RW_AR'),
+              grant('TEAM_FR', 'WRITER_FR') ]
+
+class TestMethods(unittest.TestCase):
+
+    def test_reachable(self):
+        graph = SfRoleGraph(FakeConn({ 'grants_to_roles': hierarchy }), FakeLogger())
+        self.assertEqual(graph.granted_roles('TEAM_FR'), { 'WRITER_FR' })
+        self.assertEqual(graph.reachable('TEAM_FR'), { 'WRITER_FR', '_SC_DB_SC_RW_AR', '_SC_DB_SC_RO_AR' })
+        self.assertEqual(graph.who_can_reach('_SC_DB_SC_RO_AR'), { '_SC_DB_SC_RW_AR', '_SC_DB_SC_ADM_AR', 'SYSADMIN',
+                                                                   'READER_FR', 'WRITER_FR', 'TEAM_FR' })
+        self.assertTrue(graph.can_reach('SYSADMIN', '_SC_DB_SC_RO_AR'))
+        self.assertFalse(graph.can_reach('READER_FR', '_SC_DB_SC_RW_AR'))
+        self.assertEqual(graph.reachable('UNKNOWN_FR'), set())
+
+    def test_cycle(self):
+        graph = SfRoleGraph(FakeConn({ 'grants_to_roles': [ grant('A', 'B'), grant('B', 'A') ] }), FakeLogger())
+        self.assertEqual(graph.reachable('A'), { 'B' })
+
+    def test_incremental_refresh(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache_file = os.path.join(tmp_dir, 'rolegraph.json')
+            graph = SfRoleGraph(FakeConn({ 'grants_to_roles': hierarchy }), FakeLogger(), cache_file)
+            graph.load()
+            self.assertTrue(os.path.exists(cache_file))
+            # A new run only pulls the changes since the watermark from the cache
+            conn = FakeConn({ 'grants_to_roles': [ grant('TEAM_FR', 'WRITER_FR', 10, True),
+                                                   grant('TEAM_FR', 'READER_FR', 11) ] })
+            graph = SfRoleGraph(conn, FakeLogger(), cache_file)
+            self.assertEqual(graph.reachable('TEAM_FR'), { 'READER_FR', '_SC_DB_SC_RO_AR' })
+            self.assertIn('changed_on >=', conn.queries[0])
+            self.assertEqual(graph.watermark, start + timedelta(minutes=11))
+
+if __name__ == '__main__':
+    unittest.main()
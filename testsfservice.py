@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+from sfservice import SfService, SfServiceClient
+from sftestutil import FakeLogger
+import sfconn
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+config = { 'user': 'your@login', 'account': 'ACCOUNT', 'role': 'DEMO_ROLE', 'warehouse': 'SIM_WH_000',
+           'database': 'SIM_DB_000', 'schema': 'SC_000', 'backend': 'sim',
+           'sim': { 'databases': 1, 'schemas': 2, 'objects': 6, 'columns': 4, 'roles': 4 },
+           'service': { 'warehouse_limits': { 'SIM_WH_001': 1 }, 'default_limit': 2 } }
+
+class TestMethods(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        # Keep the schema listing cache out of ~/.snowflake
+        self.cache_dir = sfconn.cache_dir
+        sfconn.cache_dir = self.tmp_dir.name
+        socket_path = os.path.join(self.tmp_dir.name, 'sf_service.sock')
+        self.service = SfService(config, FakeLogger(), socket_path, max_workers=4)
+        self.thread = threading.Thread(target=self.service.serve)
+        self.thread.start()
+        self.client = SfServiceClient(socket_path, timeout=30)
+        while self.service.server is None or not os.path.exists(socket_path):
+            time.sleep(0.01)
+
+    def tearDown(self):
+        self.client.submit('shutdown')
+        self.thread.join()
+        sfconn.cache_dir = self.cache_dir
+        self.tmp_dir.cleanup()
+
+    def test_export_reuses_session(self):
+        export_dir = os.path.join(self.tmp_dir.name, 'export')
+        for run in range(3):
+            response = self.client.submit('export', { 'all': True, 'export_dir': export_dir })
+            self.assertEqual(response['status'], 'ok', response['error'])
+        # Every object is written on the first run only
+        stats = response['result']['SIM_DB_000.SC_001']
+        self.assertEqual({ key: stats[key] for key in [ 'status', 'objects', 'written', 'deleted', 'attempts' ] },
+                         { 'status': 'done', 'objects': 6, 'written': 0, 'deleted': 0, 'attempts': 1 })
+        self.assertTrue(os.path.exists(os.path.join(export_dir, 'SIM_DB_000.SC_000', 'OBJ_0000.tbl')))
+        status = self.client.submit('status')['result']
+        self.assertEqual(status['jobs_run'], 3)
+        self.assertEqual(status['pools']['SIM_WH_000']['opened'], 1)
+
+    def test_warehouse_limit(self):
+        args = { 'type': 'refresh', 'owner_role': 'OWNER_FR', 'clone_role': 'CLONE_FR', 'warehouse': 'SIM_WH_001',
+                 'from_db_nm': 'SIM_DB_000', 'from_sc_nm': 'SC_000', 'to_db_nm': 'SIM_DB_000', 'to_sc_nm': 'SC_001' }
+        responses = []
+        threads = [ threading.Thread(target=lambda: responses.append(self.client.submit('clone', args))) for nr in range(4) ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Every other table changed since it was cloned
+        self.assertEqual([ response['result'] for response in responses ], [ 1, 1, 1, 1 ])
+        status = self.client.submit('status')['result']
+        self.assertEqual(status['pools']['SIM_WH_001'], { 'sessions': 1, 'opened': 1, 'limit': 1 })
+
+    def test_warehouse_backlog(self):
+        # A backlog on SIM_WH_001 (limit 1) must not take the scheduler threads from other warehouses
+        started = threading.Event()
+        release = threading.Event()
+        def blocks(args):
+            with self.service.session(args):
+                started.set()
+                release.wait(30)
+            return args['nr']
+        self.service.jobs['blocks'] = blocks
+        responses = []
+        threads = [ threading.Thread(target=lambda nr=nr: responses.append(self.client.submit('blocks', { 'warehouse': 'SIM_WH_001', 'nr': nr })))
+                    for nr in range(6) ]
+        for thread in threads:
+            thread.start()
+        started.wait(30)
+        time.sleep(0.2)
+        args = { 'type': 'refresh', 'owner_role': 'OWNER_FR', 'clone_role': 'CLONE_FR', 'warehouse': 'SIM_WH_000',
+                 'from_db_nm': 'SIM_DB_000', 'from_sc_nm': 'SC_000', 'to_db_nm': 'SIM_DB_000', 'to_sc_nm': 'SC_001' }
+        try:
+            client = SfServiceClient(self.service.socket_path, timeout=5)
+            self.assertEqual(client.submit('clone', args)['status'], 'ok')
+        finally:
+            release.set()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(sorted(response['result'] for response in responses), list(range(6)))
+
+    def test_job_exits(self):
+        def exits(args):
+            with self.service.session(args):
+                exit(-1)
+        self.service.jobs['exits'] = exits
+        for run in range(2):
+            response = self.client.submit('exits', { 'warehouse': 'SIM_WH_001' })
+            self.assertEqual(response['error'], 'exits job exited with -1')
+        # The only session of the warehouse is still available
+        args = { 'type': 'refresh', 'owner_role': 'OWNER_FR', 'clone_role': 'CLONE_FR', 'warehouse': 'SIM_WH_001',
+                 'from_db_nm': 'SIM_DB_000', 'from_sc_nm': 'SC_000', 'to_db_nm': 'SIM_DB_000', 'to_sc_nm': 'SC_001' }
+        self.assertEqual(self.client.submit('clone', args)['status'], 'ok')
+        status = self.client.submit('status')['result']
+        self.assertEqual(status['pools']['SIM_WH_001'], { 'sessions': 1, 'opened': 1, 'limit': 1 })
+
+    def test_errors(self):
+        response = self.client.submit('vacuum')
+        self.assertEqual(response['status'], 'error')
+        self.assertRegex(response['error'], '^Unknown job vacuum')
+        response = self.client.submit('clone', { 'type': 'merge', 'owner_role': 'OWNER_FR', 'clone_role': 'CLONE_FR',
+                                                 'from_db_nm': 'SIM_DB_000', 'from_sc_nm': 'SC_000', 'to_db_nm': 'SIM_DB_000', 'to_sc_nm': 'SC_001' })
+        self.assertEqual(response['error'], 'clone job failed: Unknown clone type merge')
+        response = self.client.submit('clone', { 'type': 'init', 'owner_role': 'OWNER_FR', 'clone_role': 'CLONE_FR',
+                                                 'from_db_nm': 'SIM_DB_000', 'from_sc_nm': 'SC_000', 'to_db_nm': 'SIM_DB_000', 'to_sc_nm': 'SC_001' })
+        self.assertEqual(response['error'], 'clone job failed: Table OBJ_0000 exists in SIM_DB_000.SC_001, but --delete_existing is not specified')
+        # The service keeps running after a failed job
+        self.assertEqual(self.client.submit('status')['status'], 'ok')
+
+if __name__ == '__main__':
+    unittest.main()
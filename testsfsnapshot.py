@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+from sfgenconfig import SfGenConfig
+from sfrolegraph import SfRoleGraph
+from sfsnapshot import SfSnapshot, snapshot_sources
+from sftestutil import FakeCursor, FakeLogger
+import os
+import re
+import tempfile
+import unittest
+
+class SyncConn():
+    """Serves the snapshot sources from python lists. Partitions on an
+       expression are emulated with the first letter of the first column."""
+    def __init__(self, data):
+        self.data = data
+        self.queries = []
+
+    def part(self, source, row):
+        spec = snapshot_sources[source]
+        if spec['partition'] in spec['columns']:
+            return row[spec['columns'].index(spec['partition'])]
+        return row[0][:1]
+
+    def run_query(self, query):
+        self.queries.append(query)
+        source = [ source for source, spec in snapshot_sources.items() if f"from {spec['from']}" in query ][0]
+        rows = self.data.get(source, [])
+        if 'hash_agg' in query:
+            parts = {}
+            for row in rows:
+                parts.setdefault(self.part(source, row), []).append(row)
+            return FakeCursor([ (part, hash(tuple(sorted(part_rows)))) for part, part_rows in parts.items() ])
+        in_list = re.search(r' in \((.*)\)$', query)
+        if in_list:
+            rows = [ row for row in rows if f"'{self.part(source, row)}'" in in_list.group(1).split(', ') ]
+        return FakeCursor([ (self.part(source, row),) + tuple(row) for row in rows ])
+
+data = { 'allfuturegrantsdb': [ ('_DB_SALES_RO_AR', 'SALES'), ('_DB_HR_RO_AR', 'HR') ],
+         'allfuturegrantssc': [ ('_SC_SALES_RAW_RO_AR', 'SALES', 'RAW') ],
+         'allgrantswh':       [ ('_WH_LOAD_USE_AR', 'LOAD'), ('_WH_BI_USE_AR', 'BI') ],
+         'roles':             [ ('SALES_FR',), ('HR_FR',) ],
+         'role_grants':       [ ('SALES_FR', '_DB_SALES_RO_AR') ] }
+
+class TestMethods(unittest.TestCase):
+
+    def test_incremental_sync(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'grants.db')
+            snapshot = SfSnapshot(filename, FakeLogger())
+            snapshot.sync(SyncConn(data))
+            self.assertEqual(sorted(snapshot.db_grants()), [ ('_DB_HR_RO_AR', 'HR'), ('_DB_SALES_RO_AR', 'SALES') ])
+            self.assertEqual(snapshot.role_grants(), [ ('SALES_FR', '_DB_SALES_RO_AR') ])
+            snapshot.close()
+
+            changed = dict(data)
+            changed['allfuturegrantsdb'] = [ ('_DB_SALES_RO_AR', 'SALES'), ('_DB_SALES_RW_AR', 'SALES'), ('_DB_HR_RO_AR', 'HR') ]
+            changed['allgrantswh'] = [ ('_WH_LOAD_USE_AR', 'LOAD') ]
+            conn = SyncConn(changed)
+            snapshot = SfSnapshot(filename, FakeLogger())
+            snapshot.sync(conn)
+            self.assertEqual(sorted(snapshot.db_grants()), [ ('_DB_HR_RO_AR', 'HR'), ('_DB_SALES_RO_AR', 'SALES'), ('_DB_SALES_RW_AR', 'SALES') ])
+            self.assertEqual(snapshot.wh_grants(), [ ('_WH_LOAD_USE_AR', 'LOAD') ])
+            # Only the digests and the changed SALES partition were pulled
+            pulls = [ query for query in conn.queries if 'hash_agg' not in query ]
+            self.assertEqual(len(pulls), 1)
+            self.assertIn("in ('SALES')", pulls[0])
+            snapshot.close()
+
+    def test_offline_genconfig(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            snapshot = SfSnapshot(os.path.join(tmp_dir, 'grants.db'), FakeLogger())
+            snapshot.sync(SyncConn(data))
+            role_graph = SfRoleGraph(None, FakeLogger(), snapshot=snapshot)
+            gen_cfg = SfGenConfig(None, None, ['ALL'], role_graph, snapshot)
+            self.assertEqual(gen_cfg.list_roles(), [ 'HR_FR', 'SALES_FR' ])
+            config = gen_cfg.role_config('SALES_FR')
+            self.assertEqual(config['INCLUDE'], [ { "TYPE" : "DATABASE", "DATABASE" : "SALES", "ROLE" : "RO" } ])
+            snapshot.close()
+
+if __name__ == '__main__':
+    unittest.main()
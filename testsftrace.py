@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+from sftestutil import FakeLogger, FakeSfConn
+from sftrace import SfTracer, SfTracedConn, fingerprint, normalize_statement
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+class TestMethods(unittest.TestCase):
+
+    def test_fingerprint(self):
+        self.assertEqual(normalize_statement("select get_ddl('TABLE',  'T1')\n where x = 10"), "select get_ddl(?, ?) where x = ?")
+        self.assertEqual(fingerprint("select get_ddl('TABLE', 'T1')"), fingerprint("select get_ddl('VIEW', 'V2')"))
+        self.assertNotEqual(fingerprint("select 1 from a"), fingerprint("select 1 from b"))
+
+    def test_trace(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'trace.jsonl')
+            tracer = SfTracer(filename, FakeLogger(), 'BENCH_TAG', top_n=1)
+            conn = SfTracedConn(FakeSfConn({ "select get_ddl('TABLE', 'T1')": [ ('create table t1',) ],
+                                             "select get_ddl('TABLE', 'T2')": [ ('create table t2',) ] }), tracer)
+            for name in [ 'T1', 'T2' ]:
+                curs = conn.cursor()
+                curs.execute(f"select get_ddl('TABLE', '{name}')")
+                self.assertEqual(len(curs.fetchall()), 1)
+                curs.close()
+            curs = conn.cursor()
+            with self.assertRaises(Exception):
+                curs.execute("select * from missing")
+            conn.close()
+            spans = [ json.loads(line) for line in open(filename) ]
+            self.assertEqual(len(spans), 3)
+            self.assertEqual(spans[0]['attributes']['rows'], 1)
+            self.assertRegex(spans[0]['attributes']['caller'], r'^testsftrace\.py:\d+:test_trace$')
+            self.assertEqual(spans[2]['status'], 'ERROR')
+            summary = tracer.summary()
+            self.assertEqual(len(summary), 1)
+
+    def test_trace_threads(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'trace.jsonl')
+            tracer = SfTracer(filename, FakeLogger(), 'BENCH_TAG')
+            conn = SfTracedConn(FakeSfConn({ "select 1": [ (1,) ] }), tracer)
+            def execute():
+                curs = conn.cursor()
+                for i in range(50):
+                    curs.execute("select 1")
+            threads = [ threading.Thread(target=execute) for i in range(8) ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            # The last span of every cursor is still open and ended once by close
+            self.assertEqual(len(tracer.active), 8)
+            conn.close()
+            self.assertEqual(len(tracer.active), 0)
+            self.assertEqual(len([ line for line in open(filename) ]), 400)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -25,6 +25,17 @@ false_db_sc        = [ 'TEST_SC',
                        '%PRD%.%', 
                        '"01"23_DB"."0123_SC"',
                        'TEST_DB.%' ]
+true_db_sc_like    = [ ('YOURNAMESPACE_PRD_%.%', ('YOURNAMESPACE_PRD_%', '%')),
+                       ('%prd%.public', ('%PRD%', 'PUBLIC')),
+                       ('TEST_DB.TEST_SC', ('TEST_DB', 'TEST_SC')) ]
+false_db_sc_like   = [ '%PRD%', '"PRD%".%', '%.%.%', 'TEST DB.%' ]
+true_identifiers   = [ ('myidentifier', ('MYIDENTIFIER',)),
+                       ('"my.identifier"', ('"my.identifier"',)),
+                       ('test_db.test_sc', ('TEST_DB', 'TEST_SC')),
+                       ('"01""23_DB"."0123_SC"', ('"01""23_DB"', '"0123_SC"')),
+                       ('"my.identifier".myidentifier.My$Table', ('"my.identifier"', 'MYIDENTIFIER', 'MY$TABLE')) ]
+false_identifiers  = [ '0myidentifier', '"""', 'TEST_DB.', '"01"23_DB"."0123_SC"',
+                       'A.B.C.D', 'TEST DB.TEST_SC', '"' + 'x' * 254 + '"' ]
 
 class TestMethods(unittest.TestCase):
 
@@ -69,6 +80,25 @@ class TestMethods(unittest.TestCase):
             with self.assertRaises(ValueError):
                 print(f"self.asserRaises(ValueError): sf_val.split_db_sc('{qt}')")
                 sf_val.split_db_sc(qt)
+    def test_split_db_sc_like(self):
+        for qt,res in true_db_sc_like:
+            with self.subTest():
+                self.assertEqual(sf_val.split_db_sc_like(qt), [ res[0], res[1] ])
+        for qt in false_db_sc_like:
+            with self.assertRaises(ValueError):
+                sf_val.split_db_sc_like(qt)
+
+    def test_normalize_identifiers(self):
+        identifiers = [ qt for qt,res in true_identifiers ] + false_identifiers
+        self.assertEqual(sf_val.normalize_identifiers(identifiers),
+                         [ res for qt,res in true_identifiers ] + [ None ] * len(false_identifiers))
+        self.assertEqual(sf_val.validate_identifiers(identifiers), false_identifiers)
+        self.assertEqual(sf_val.validate_identifiers([ 'TEST_DB.TEST_SC', 'TEST_DB.TEST_SC.TBL' ], parts=2), [ 'TEST_DB.TEST_SC.TBL' ])
+        # Agrees with the validation of single names
+        for qt in true_unquoted_nms + false_unquoted_nms + true_quoted_nms + false_quoted_nms:
+            with self.subTest():
+                self.assertEqual(sf_val.normalize_identifiers([ qt ], parts=1) != [ None ],
+                                 sf_val.is_unquoted_name(qt) or sf_val.is_quoted_name(qt))
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file